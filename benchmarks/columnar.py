@@ -0,0 +1,70 @@
+"""
+Disk usage and parse time of text buckets against columnar buckets
+
+    python -m benchmarks.columnar [days]
+"""
+from __future__ import print_function
+
+import os
+import sys
+from datetime import timedelta
+from random import Random
+from time import time
+
+from notmany.store.base import Interval, record_to_data
+from notmany.store.columnar import ColumnarBucket
+from notmany.store.file import Store, Bucket
+from tests.utils import temporary_directory, dt
+
+START = dt('2018-03-03T12:30:00')
+
+
+def points(count):
+    rand = Random(42)
+    cpu, mem = 10, 4400
+    for i in range(count):
+        cpu += rand.choice([-2, -1, 0, 1, 2])
+        mem += rand.choice([-2, -1, 0, 1, 2])
+        yield START + timedelta(seconds=i), 'cpu:{},mem:{}'.format(cpu, mem)
+
+
+def disk_usage(directory):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(directory) for name in names)
+
+
+def measure(bucket_class, days, repeat=1):
+    """
+    :param repeat: read this many times, the fastest read is reported
+    :return: disk usage and seconds to read all points
+    """
+    count = 86400 * days
+    interval = Interval(start=START, delta=timedelta(days=days))
+    with temporary_directory() as tem_dir:
+        store = Store(directory=tem_dir, bucket_size=600, bucket_class=bucket_class)
+        store.record_many('temp', points(count))
+        usage = disk_usage(tem_dir)
+
+        timings = []
+        for _ in range(repeat):
+            start = time()
+            if issubclass(bucket_class, ColumnarBucket):
+                total = sum(len(timestamps) for timestamps, _ in store.retrieve_arrays('temp', interval))
+            else:
+                total = sum(1 for _, data in store.retrieve('temp', interval) if record_to_data(data))
+            timings.append(time() - start)
+            assert total == count, total
+    return usage, min(timings)
+
+
+def main(days=1):
+    text_usage, text_took = measure(Bucket, days)
+    col_usage, col_took = measure(ColumnarBucket, days)
+    print('text     {} bytes parsed in {:.3f}s'.format(text_usage, text_took))
+    print('columnar {} bytes parsed in {:.3f}s'.format(col_usage, col_took))
+    print('disk {:.2f}x smaller, parse {:.1f}x faster'.format(
+        text_usage / float(col_usage), text_took / col_took))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
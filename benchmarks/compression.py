@@ -0,0 +1,56 @@
+"""
+Compression ratio of sealed buckets and read throughput of retrieve and
+retrieve_raw for plain, zlib and lzma buckets
+
+    python -m benchmarks.compression [days]
+"""
+from __future__ import print_function
+
+import sys
+from datetime import timedelta
+from time import time
+
+from notmany.store.base import Interval
+from notmany.store.file import Store
+from benchmarks.columnar import START, points, disk_usage
+from tests.utils import temporary_directory
+
+CODECS = (None, 'zlib', 'lzma')
+
+
+def measure(codec, days):
+    count = 86400 * days
+    interval = Interval(start=START, delta=timedelta(days=days))
+    with temporary_directory() as tem_dir:
+        store = Store(directory=tem_dir, bucket_size=600, compression=codec, compress_after=0)
+        store.record_many('temp', points(count))
+        plain = disk_usage(tem_dir)
+
+        start = time()
+        if codec is not None:
+            store.compress('temp', before=START + timedelta(days=days + 1))
+        else:
+            store.compact('temp', before=START + timedelta(days=days + 1))
+        compress_took = time() - start
+        usage = disk_usage(tem_dir)
+
+        start = time()
+        total = sum(1 for _ in store.retrieve('temp', interval))
+        read_took = time() - start
+
+        start = time()
+        size = sum(len(chunk) for chunk in store.retrieve_raw('temp', interval))
+        raw_took = time() - start
+    assert total == count, total
+    return plain / float(usage), compress_took, count / read_took, size / raw_took / 1e6
+
+
+def main(days=1):
+    for codec in CODECS:
+        ratio, compress_took, records, megabytes = measure(codec, days)
+        print('{:<5} ratio {:5.2f}x compress {:6.2f}s retrieve {:8.0f} records/sec raw {:7.1f} MB/s'.format(
+            codec or 'plain', ratio, compress_took, records, megabytes))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,39 @@
+"""
+Full series retrieval through Store.get_all on a series with many bucket files
+
+    python -m benchmarks.get_all [buckets]
+"""
+from __future__ import print_function
+
+import sys
+from datetime import timedelta
+from time import time
+
+from notmany.store.base import Interval
+from notmany.store.file import Store
+from tests.utils import temporary_directory, dt
+
+START = dt('2018-03-03T00:00:00')
+
+
+def main(count=20000):
+    with temporary_directory() as tem_dir:
+        store = Store(directory=tem_dir, bucket_size=60)
+        store.record_many('temp', [(START + timedelta(seconds=60 * i), 'cpu:{}'.format(i)) for i in range(count)])
+
+        start = time()
+        buckets = sum(1 for _ in store.get_all('temp'))
+        print('Listing {} buckets took {:.3f}s'.format(buckets, time() - start))
+
+        start = time()
+        records = sum(1 for _ in store.retrieve('temp'))
+        print('Retrieving {} records of whole series took {:.3f}s'.format(records, time() - start))
+
+        start = time()
+        interval = Interval(start=START, delta=timedelta(seconds=60 * count))
+        records = sum(1 for _ in store.retrieve('temp', interval=interval))
+        print('Retrieving {} records by interval took {:.3f}s'.format(records, time() - start))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,28 @@
+"""
+Disk usage and decode time of text, columnar and gorilla buckets, the
+fastest of REPEAT reads is reported
+
+    python -m benchmarks.gorilla [days]
+"""
+from __future__ import print_function
+
+import sys
+
+from notmany.store.columnar import ColumnarBucket
+from notmany.store.file import Bucket
+from notmany.store.gorilla import GorillaBucket
+from benchmarks.columnar import measure
+
+REPEAT = 5
+
+
+def main(days=1):
+    text_usage, text_took = measure(Bucket, days, REPEAT)
+    for name, bucket_class in (('text', Bucket), ('columnar', ColumnarBucket), ('gorilla', GorillaBucket)):
+        usage, took = (text_usage, text_took) if bucket_class is Bucket else measure(bucket_class, days, REPEAT)
+        print('{:<8} {:>9} bytes {:5.2f} bytes/point decoded in {:.3f}s, {:5.1f}x smaller {:4.1f}x faster'.format(
+            name, usage, usage / (86400.0 * days), took, text_usage / float(usage), text_took / took))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
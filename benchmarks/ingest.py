@@ -0,0 +1,54 @@
+"""
+CPU time of single point ingest, timestamp conversion alone and whole
+Store.record calls with string, epoch and datetime timestamps, points are
+spread over the coming ten minutes so they go to open buckets like live
+ingest does
+
+    python -m benchmarks.ingest [points]
+"""
+from __future__ import print_function
+
+import sys
+from datetime import datetime, timedelta
+from time import time
+
+from notmany.store.base import get_datetime, naive_tstamp, get_tstamp
+from notmany.store.file import Store
+from notmany.store.writer import Writer
+from tests.utils import temporary_directory
+
+
+def timestamps(count):
+    now = datetime.now().replace(microsecond=0)
+    dates = [now + timedelta(seconds=600.0 * i // count) for i in range(count)]
+    return (
+        ('str', [date.strftime('%Y-%m-%dT%H:%M:%S') for date in dates]),
+        ('epoch', [int(naive_tstamp(date)) for date in dates]),
+        ('datetime', dates),
+    )
+
+
+def per_call(func, items):
+    start = time()
+    for item in items:
+        func(item)
+    return (time() - start) / len(items) * 1e6
+
+
+def main(count=100000):
+    for kind, items in timestamps(count):
+        legacy = per_call(lambda timestamp: naive_tstamp(get_datetime(timestamp)), items)
+        fast = per_call(get_tstamp, items)
+        print('timestamp {:<8} {:6.2f}us -> {:6.2f}us {:5.1f}x'.format(kind, legacy, fast, legacy / fast))
+
+    for kind, items in timestamps(count):
+        with temporary_directory() as tem_dir:
+            writer = Writer()
+            store = Store(directory=tem_dir, bucket_size=600, writer=writer)
+            took = per_call(lambda timestamp: store.record('temp', timestamp, 'cpu:1'), items)
+            store.close()
+        print('record    {:<8} {:6.2f}us per point'.format(kind, took))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,57 @@
+"""
+Retrieve throughput with buckets read ahead on a thread pool, files in the
+page cache and with a simulated per file latency of a cold disk
+
+    python -m benchmarks.prefetch [days] [latency in microseconds]
+"""
+from __future__ import print_function
+
+import sys
+from datetime import timedelta
+from time import time, sleep
+
+from notmany.store.base import Interval
+from notmany.store.file import Store, Bucket
+from benchmarks.columnar import START, points
+from tests.utils import temporary_directory
+
+DEPTHS = (0, 1, 2, 4, 8)
+
+
+class SlowBucket(Bucket):
+    """
+    Bucket waiting before every open like a read missing the page cache
+    """
+    __slots__ = []
+    latency = 0
+
+    def _open(self, mode='r'):
+        sleep(self.latency)
+        return Bucket._open(self, mode)
+
+
+def measure(directory, days, depth, bucket_class):
+    interval = Interval(start=START, delta=timedelta(days=days))
+    store = Store(directory=directory, bucket_size=600, bucket_class=bucket_class, prefetch=depth)
+    start = time()
+    total = sum(1 for _ in store.retrieve('temp', interval))
+    took = time() - start
+    store.close()
+    assert total == 86400 * days, total
+    return took
+
+
+def main(days=1, latency=500):
+    SlowBucket.latency = latency / 1e6
+    with temporary_directory() as tem_dir:
+        Store(directory=tem_dir, bucket_size=600).record_many('temp', points(86400 * days))
+        for bucket_class in (Bucket, SlowBucket):
+            base = None
+            for depth in DEPTHS:
+                took = measure(tem_dir, days, depth, bucket_class)
+                base = base or took
+                print('{:<10} prefetch {} {:6.3f}s {:5.2f}x'.format(bucket_class.__name__, depth, took, base / took))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,286 @@
+"""
+Reproducible benchmark of Store.record, retrieve, retrieve_raw and forget
+over a grid of bucket sizes, series counts and interval lengths.
+
+Series are generated from a fixed seed and queried at seeded offsets so
+every run sees the same data and the same queries. Results with
+throughput and latency percentiles are written as JSON, two result files
+are compared operation by operation and compare exits with status 1 when
+any of them got slower by more than the threshold
+
+    python -m benchmarks.suite run [output.json] [days]
+    python -m benchmarks.suite compare baseline.json current.json [threshold percent]
+"""
+from __future__ import print_function
+
+import json
+import platform
+import subprocess
+import sys
+from datetime import timedelta
+from random import Random
+from time import time
+
+from notmany.store.base import Interval
+from notmany.store.file import Store
+from tests.utils import temporary_directory, dt
+
+VERSION = 2
+SEED = 42
+START = dt('2018-03-03T00:00:00')
+# seconds between points of a series
+STEP = 10
+BUCKET_SIZES = (60, 600, 3600, 86400)
+SERIES = (1, 10)
+# shorter than a day so queries of a one day run cover different ranges
+INTERVALS = (600, 3600, 6 * 3600)
+# retrieve and retrieve_raw calls per interval length
+QUERIES = 20
+PERCENTILES = (50, 90, 99)
+# percent, runs on a shared machine differ by up to ~20%
+THRESHOLD = 25
+# what throughput of an operation counts
+UNITS = {
+    'record': 'records',
+    'retrieve': 'records',
+    'retrieve_raw': 'bytes',
+    'forget': 'calls',
+}
+
+
+def series_points(name, count):
+    """
+    Random walk of a series, the same for the same name on every run.
+    Timestamps are naive datetimes like the query intervals, epoch numbers
+    would be taken as local time and move the data away from the queries
+    outside UTC
+    :return: datetime and data tuples
+    """
+    rand = Random('{}:{}'.format(SEED, name))
+    cpu, mem = 10, 4400
+    points = []
+    for i in range(count):
+        cpu += rand.choice([-2, -1, 0, 1, 2])
+        mem += rand.choice([-2, -1, 0, 1, 2])
+        points.append((START + timedelta(seconds=i * STEP), 'cpu:{},mem:{}'.format(cpu, mem)))
+    return points
+
+
+def dataset(series, days):
+    """
+    :return: series name to its points
+    :rtype: dict
+    """
+    count = 86400 * days // STEP
+    return dict(('series_{}'.format(i), series_points('series_{}'.format(i), count)) for i in range(series))
+
+
+def queries(names, length, days):
+    """
+    Seeded intervals of the given length inside the generated data
+    :return: list of series name and interval tuples
+    """
+    rand = Random('{}:{}:{}'.format(SEED, length, len(names)))
+    span = max(86400 * days - length, 0)
+    return [(rand.choice(names), Interval(start=START + timedelta(seconds=rand.randrange(0, span + 1, STEP)),
+                                          delta=timedelta(seconds=length)))
+            for _ in range(QUERIES)]
+
+
+def percentile(ordered, percent):
+    """
+    Nearest rank percentile
+    :param ordered: sorted values
+    """
+    if not ordered:
+        return 0.0
+    rank = int(round(percent / 100.0 * len(ordered) + 0.5)) - 1
+    return ordered[min(max(rank, 0), len(ordered) - 1)]
+
+
+def summary(operation, params, latencies, items):
+    """
+    :param params: bucket_size, series and interval of the run
+    :param latencies: seconds of every call
+    :param items: records, bytes or calls processed, see UNITS
+    :return: one result entry, latencies in milliseconds
+    :rtype: dict
+    """
+    ordered = sorted(latencies)
+    took = sum(ordered)
+    result = {
+        'key': ' '.join([operation] + ['{}={}'.format(name, params[name]) for name in sorted(params)]),
+        'operation': operation,
+        'calls': len(ordered),
+        'items': items,
+        'unit': UNITS[operation],
+        'seconds': took,
+        'throughput': items / took if took else 0.0,
+        'max': ordered[-1] * 1000 if ordered else 0.0,
+    }
+    result.update(params)
+    for percent in PERCENTILES:
+        result['p{}'.format(percent)] = percentile(ordered, percent) * 1000
+    return result
+
+
+def timed(func, *args):
+    start = time()
+    value = func(*args)
+    return time() - start, value
+
+
+def bench_record(directory, bucket_size, data):
+    """
+    Points of all series recorded one by one in time order like live
+    ingest
+    """
+    store = Store(directory=directory, bucket_size=bucket_size)
+    points = sorted((timestamp, name, value) for name, series in data.items() for timestamp, value in series)
+    latencies = []
+    for timestamp, name, value in points:
+        latencies.append(timed(store.record, name, timestamp, value)[0])
+    store.close()
+    return latencies, len(points)
+
+
+def bench_retrieve(directory, bucket_size, names, length, days):
+    store = Store(directory=directory, bucket_size=bucket_size)
+    results = []
+    for operation, count in (('retrieve', lambda rows: sum(1 for _ in rows)),
+                             ('retrieve_raw', lambda pieces: sum(len(piece) for piece in pieces))):
+        latencies, items = [], 0
+        for name, interval in queries(names, length, days):
+            took, total = timed(lambda: count(getattr(store, operation)(name, interval)))
+            latencies.append(took)
+            items += total
+        results.append((operation, latencies, items))
+    store.close()
+    return results
+
+
+def bench_forget(directory, bucket_size, data, length, days):
+    """
+    Forget consecutive intervals of every series, each on data not
+    forgotten before
+    """
+    store = Store(directory=directory, bucket_size=bucket_size)
+    for name, points in sorted(data.items()):
+        store.record_many(name, points)
+    latencies = []
+    for name in sorted(data):
+        for i in range(min(QUERIES, 86400 * days // length)):
+            interval = Interval(start=START + timedelta(seconds=i * length), delta=timedelta(seconds=length - 1))
+            latencies.append(timed(store.forget, name, interval)[0])
+    store.close()
+    return latencies, len(latencies)
+
+
+def run(days):
+    results = []
+    for series in SERIES:
+        data = dataset(series, days)
+        names = sorted(data)
+        for bucket_size in BUCKET_SIZES:
+            params = {'bucket_size': bucket_size, 'series': series}
+            with temporary_directory() as tem_dir:
+                latencies, items = bench_record(tem_dir, bucket_size, data)
+                results.append(summary('record', params, latencies, items))
+                report(results[-1])
+                for length in INTERVALS:
+                    for operation, latencies, items in bench_retrieve(tem_dir, bucket_size, names, length, days):
+                        results.append(summary(operation, dict(params, interval=length), latencies, items))
+                        report(results[-1])
+
+            for length in INTERVALS:
+                with temporary_directory() as tem_dir:
+                    latencies, items = bench_forget(tem_dir, bucket_size, data, length, days)
+                results.append(summary('forget', dict(params, interval=length), latencies, items))
+                report(results[-1])
+    return results
+
+
+def report(result):
+    print('{:<58} {:>12.0f} {:<7}/s p50 {:8.3f} ms p99 {:8.3f} ms'.format(
+        result['key'], result['throughput'], result['unit'], result['p50'], result['p99']))
+
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main_run(output='benchmark.json', days='1'):
+    days = int(days)
+    started = time()
+    results = run(days)
+    document = {
+        'version': VERSION,
+        'commit': commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'started': started,
+        'days': days,
+        'seed': SEED,
+        'results': results,
+    }
+    with open(output, 'w') as fp:
+        json.dump(document, fp, indent=2, sort_keys=True)
+    print('Results of {} runs written to {}'.format(len(results), output))
+
+
+def compare(baseline, current, threshold=THRESHOLD):
+    """
+    :param baseline: results document of the reference run
+    :param current: results document of the run checked
+    :param threshold: percent p50 latency may grow or throughput drop
+    :return: keys of regressed runs, printing a line per run
+    :rtype: list
+    """
+    before = dict((result['key'], result) for result in baseline['results'])
+    regressions = []
+    for result in current['results']:
+        old = before.get(result['key'])
+        if old is None:
+            print('{:<58} new'.format(result['key']))
+            continue
+        latency = change(old['p50'], result['p50'])
+        throughput = change(old['throughput'], result['throughput'])
+        regressed = latency > threshold or throughput < -threshold
+        if regressed:
+            regressions.append(result['key'])
+        print('{:<58} p50 {:+7.1f}% throughput {:+7.1f}%{}'.format(
+            result['key'], latency, throughput, ' REGRESSION' if regressed else ''))
+    return regressions
+
+
+def change(old, new):
+    """
+    :return: percent new differs from old
+    """
+    return (new - old) / old * 100 if old else 0.0
+
+
+def main_compare(baseline, current, threshold=THRESHOLD):
+    with open(baseline, 'r') as fp:
+        baseline = json.load(fp)
+    with open(current, 'r') as fp:
+        current = json.load(fp)
+    regressions = compare(baseline, current, float(threshold))
+    print('{} of {} runs regressed'.format(len(regressions), len(current['results'])))
+    return 1 if regressions else 0
+
+
+def main(command='run', *args):
+    if command == 'run':
+        return main_run(*args)
+    if command == 'compare':
+        return main_compare(*args)
+    print(__doc__)
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main(*sys.argv[1:]))
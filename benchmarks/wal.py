@@ -0,0 +1,47 @@
+"""
+Ingest latency of record_many batches spread over many series, direct
+bucket writes against the write ahead log for every fsync policy
+
+    python -m benchmarks.wal [batches] [series]
+"""
+from __future__ import print_function
+
+import os
+import sys
+from datetime import timedelta
+from time import time
+
+from notmany.store.file import Store
+from notmany.store.wal import WriteAheadLog, FSYNC_POLICIES
+from tests.utils import temporary_directory, dt
+
+START = dt('2018-03-03T12:30:00')
+
+
+def ingest(store, batches, series):
+    latencies = []
+    for i in range(batches):
+        timestamp = START + timedelta(seconds=i)
+        begin = time()
+        store.record_many_series([
+            ('temp_{}'.format(j), timestamp, 'cpu:{},mem:{}'.format(i % 100, 4400)) for j in range(series)])
+        latencies.append(time() - begin)
+    store.close()
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+def main(batches=200, series=100):
+    with temporary_directory() as tem_dir:
+        median, p99 = ingest(Store(directory=tem_dir), batches, series)
+    print('direct          p50 {:.2f} ms p99 {:.2f} ms'.format(median * 1000, p99 * 1000))
+
+    for policy in FSYNC_POLICIES:
+        with temporary_directory() as tem_dir:
+            wal = WriteAheadLog(os.path.join(tem_dir, 'wal'), fsync=policy)
+            median, p99 = ingest(Store(directory=tem_dir, wal=wal), batches, series)
+        print('wal {:<11} p50 {:.2f} ms p99 {:.2f} ms'.format(policy, median * 1000, p99 * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,41 @@
+"""
+Points per second of open-per-point Bucket.append against the pooled Writer
+
+    python -m benchmarks.writer [points]
+"""
+from __future__ import print_function
+
+import sys
+from datetime import timedelta
+from time import time
+
+from notmany.store.file import Store
+from notmany.store.writer import Writer
+from tests.utils import temporary_directory, dt
+
+START = dt('2018-03-03T12:30:00')
+
+
+def ingest(store, count):
+    start = time()
+    for i in range(count):
+        store.record('temp', timestamp=START + timedelta(seconds=i), data='cpu:{},mem:{}'.format(i % 100, 4400))
+    store.flush()
+    return count / (time() - start)
+
+
+def main(count=100000):
+    with temporary_directory() as tem_dir:
+        plain = ingest(Store(directory=tem_dir, bucket_size=600), count)
+
+    with temporary_directory() as tem_dir:
+        store = Store(directory=tem_dir, bucket_size=600, writer=Writer())
+        pooled = ingest(store, count)
+        store.close()
+
+    print('open per point {:.0f} points/sec'.format(plain))
+    print('pooled writer  {:.0f} points/sec ({:.1f}x)'.format(pooled, pooled / plain))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
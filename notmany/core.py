@@ -9,5 +9,13 @@ def record(name, timestamp, data):
     store.record(name=name, timestamp=timestamp, data=data)
 
 
+def record_many(name, points):
+    store.record_many(name=name, points=points)
+
+
+def record_many_series(records):
+    store.record_many_series(records=records)
+
+
 def retrieve(name, interval=None):
     return store.retrieve(name=name, interval=interval)
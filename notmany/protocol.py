@@ -0,0 +1,122 @@
+import os
+import zlib
+from datetime import timedelta
+
+from .store.base import EPOCH, get_datetime, record_to_data
+
+__all__ = [
+    'LineParser',
+    'parse_line',
+]
+
+# gzip framing for zlib.decompressobj
+GZIP_WBITS = 31
+# rejected lines reported back with their reason
+MAX_ERRORS = 10
+
+
+def parse_line(line):
+    """
+    Parse one line of 'name timestamp field:value,...', timestamp is naive
+    epoch seconds or '2018-03-03T12:30:00[.ffffff]'
+    :param line: line without the new line
+    :return: name, datetime and data
+    :raises ValueError: for malformed line
+    """
+    parts = line.split()
+    if len(parts) != 3:
+        raise ValueError('Expected name timestamp data')
+    name, timestamp, data = parts
+    if name.startswith('.') or os.sep in name:
+        raise ValueError('Invalid series name {}'.format(name))
+    try:
+        timestamp = EPOCH + timedelta(seconds=float(timestamp))
+    except (ValueError, OverflowError):
+        timestamp = get_datetime(timestamp)
+    try:
+        record_to_data(data)
+    except IndexError:
+        raise ValueError('Invalid data {}'.format(data))
+    return name, timestamp, data
+
+
+class LineParser(object):
+    """
+    Incremental parser of a newline delimited batch, body chunks may split
+    lines anywhere and may be gzip compressed. Malformed lines are counted
+    and skipped.
+    """
+
+    def __init__(self, compressed=False):
+        """
+        :param compressed: body is gzip, concatenated members are accepted
+        """
+        self._decompressor = zlib.decompressobj(GZIP_WBITS) if compressed else None
+        self._rest = b''
+        self.lines = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.errors = []
+
+    def feed(self, chunk):
+        """
+        :param chunk: piece of the body
+        :type chunk: bytes
+        :return: records of lines completed by the chunk
+        :rtype: list of (name, datetime, data)
+        :raises zlib.error: for broken compressed body
+        """
+        if self._decompressor is not None:
+            chunk = self._decompress(chunk)
+        content = self._rest + chunk
+        end = content.rfind(b'\n')
+        if end < 0:
+            self._rest = content
+            return []
+        self._rest = content[end + 1:]
+        return self._parse(content[:end])
+
+    def close(self):
+        """
+        :return: records of the last line when it has no new line
+        :rtype: list of (name, datetime, data)
+        """
+        if self._decompressor is not None:
+            self._rest += self._decompressor.flush()
+        content, self._rest = self._rest, b''
+        return self._parse(content) if content else []
+
+    def _decompress(self, chunk):
+        pieces = [self._decompressor.decompress(chunk)]
+        while self._decompressor.eof and self._decompressor.unused_data:
+            unused = self._decompressor.unused_data
+            self._decompressor = zlib.decompressobj(GZIP_WBITS)
+            pieces.append(self._decompressor.decompress(unused))
+        return b''.join(pieces)
+
+    def _parse(self, content):
+        records = []
+        for line in content.decode('utf-8', 'replace').split('\n'):
+            self.lines += 1
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(parse_line(line))
+            except ValueError as exc:
+                self.rejected += 1
+                if len(self.errors) < MAX_ERRORS:
+                    self.errors.append('line {}: {}'.format(self.lines, exc))
+        self.accepted += len(records)
+        return records
+
+    def summary(self):
+        """
+        :return: accepted and rejected counts with first errors
+        :rtype: dict
+        """
+        return {
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'errors': self.errors,
+        }
@@ -0,0 +1,179 @@
+import numpy
+
+__all__ = [
+    'aggregate',
+    'aggregate_rollup',
+    'concatenate',
+    'FUNCS',
+]
+
+FUNCS = ('min', 'max', 'sum', 'count', 'avg')
+
+
+def check_funcs(funcs):
+    """
+    :raises ValueError: for unknown function, percentiles are p0 to p100
+    """
+    for func in funcs:
+        if func in FUNCS:
+            continue
+        if func.startswith('p') and func[1:].isdigit() and 0 <= int(func[1:]) <= 100:
+            continue
+        raise ValueError('Unknown aggregation function {}'.format(func))
+
+
+def concatenate(parts):
+    """
+    Join retrieved columns into one set of columns in order of appearance,
+    fields missing in some parts are filled with NaN
+    :param parts: iterable of (timestamps, {field: column})
+    :return: timestamps and dictionary of field name to column
+    :rtype: (numpy.ndarray, dict)
+    """
+    parts = list(parts)
+    if not parts:
+        return numpy.empty(0, numpy.float64), {}
+
+    names = []
+    for _, columns in parts:
+        names.extend([name for name in columns if name not in names])
+
+    columns = {}
+    for field in names:
+        columns[field] = numpy.concatenate([
+            part[1][field] if field in part[1] else numpy.full(len(part[0]), numpy.nan)
+            for part in parts])
+    return numpy.concatenate([part[0] for part in parts]), columns
+
+
+def aggregate(timestamps, columns, start, step, funcs):
+    """
+    Group values into steps and aggregate every group
+    :param timestamps: naive timestamps
+    :type timestamps: numpy.ndarray
+    :param columns: field name to values, NaN is a missing value
+    :type columns: dict
+    :param start: naive timestamp where the first step starts
+    :param step: step length in seconds
+    :param funcs: names of functions e.g. ['avg', 'max', 'p95']
+    :return: start of every step with data and for every field a
+        dictionary of function name to results, NaN where a field has no
+        values in a step
+    :rtype: dict
+    """
+    if step <= 0:
+        raise ValueError('Step has to be positive')
+    check_funcs(funcs)
+    steps = numpy.floor_divide(timestamps - start, step).astype(numpy.int64)
+    keys, inverse = numpy.unique(steps, return_inverse=True)
+    result = {
+        'timestamps': start + keys * step,
+        'fields': {},
+    }
+    for field, values in columns.items():
+        result['fields'][field] = _aggregate_field(values, inverse.ravel(), len(keys), funcs)
+    return result
+
+
+def aggregate_rollup(rows, start, step, funcs):
+    """
+    Group rollup rows into steps and aggregate every group like aggregate
+    does with raw values, a row counts in the step its slot starts in
+    :param rows: list of (naive timestamp, {field: [min, max, sum, count]})
+    :param start: naive timestamp where the first step starts
+    :param step: step length in seconds
+    :param funcs: names of functions, percentiles can not be computed
+    :rtype: dict
+    """
+    if step <= 0:
+        raise ValueError('Step has to be positive')
+    for func in funcs:
+        if func not in FUNCS:
+            raise ValueError('Function {} can not be computed from rollups'.format(func))
+    slots = numpy.array([slot for slot, _ in rows], numpy.float64)
+    steps = numpy.floor_divide(slots - start, step).astype(numpy.int64)
+    keys, inverse = numpy.unique(steps, return_inverse=True)
+    result = {
+        'timestamps': start + keys * step,
+        'fields': {},
+    }
+    names = []
+    for _, fields in rows:
+        names.extend([name for name in fields if name not in names])
+    # a row without the field
+    missing = [numpy.inf, -numpy.inf, 0.0, 0]
+    for field in names:
+        summaries = numpy.array([fields.get(field, missing) for _, fields in rows], numpy.float64)
+        result['fields'][field] = _aggregate_summaries(summaries, inverse.ravel(), len(keys), funcs)
+    return result
+
+
+def _aggregate_summaries(summaries, groups, size, funcs):
+    counts = numpy.bincount(groups, weights=summaries[:, 3], minlength=size).astype(numpy.int64)
+    present = counts > 0
+
+    def reduce(ufunc, column, initial):
+        reduced = numpy.full(size, initial)
+        ufunc.at(reduced, groups, summaries[:, column])
+        reduced[~present] = numpy.nan
+        return reduced
+
+    output = {}
+    for func in funcs:
+        if func == 'count':
+            output[func] = counts
+        elif func == 'sum':
+            output[func] = numpy.bincount(groups, weights=summaries[:, 2], minlength=size)
+        elif func == 'avg':
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                output[func] = numpy.bincount(groups, weights=summaries[:, 2], minlength=size) / counts
+        elif func == 'min':
+            output[func] = reduce(numpy.minimum, 0, numpy.inf)
+        else:
+            output[func] = reduce(numpy.maximum, 1, -numpy.inf)
+    return output
+
+
+def _aggregate_field(values, groups, size, funcs):
+    valid = ~numpy.isnan(values)
+    values, groups = values[valid], groups[valid]
+    order = numpy.lexsort((values, groups))
+    values, groups = values[order], groups[order]
+
+    counts = numpy.bincount(groups, minlength=size)
+    offsets = numpy.cumsum(counts) - counts
+    present = counts > 0
+
+    def pick(positions):
+        picked = numpy.full(size, numpy.nan)
+        picked[present] = values[positions[present]]
+        return picked
+
+    output = {}
+    for func in funcs:
+        if func == 'count':
+            output[func] = counts
+        elif func == 'sum':
+            output[func] = numpy.bincount(groups, weights=values, minlength=size)
+        elif func == 'avg':
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                output[func] = numpy.bincount(groups, weights=values, minlength=size) / counts
+        elif func == 'min':
+            output[func] = pick(offsets)
+        elif func == 'max':
+            output[func] = pick(offsets + counts - 1)
+        else:
+            output[func] = _percentile(values, offsets, counts, present, int(func[1:]) / 100.0)
+    return output
+
+
+def _percentile(values, offsets, counts, present, quantile):
+    """
+    Linear interpolation between closest ranks like numpy.percentile
+    """
+    result = numpy.full(len(counts), numpy.nan)
+    position = offsets[present] + (counts[present] - 1) * quantile
+    lower = numpy.floor(position).astype(numpy.int64)
+    upper = numpy.ceil(position).astype(numpy.int64)
+    result[present] = values[lower] + (values[upper] - values[lower]) * (position - lower)
+    return result
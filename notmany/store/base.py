@@ -1,10 +1,14 @@
 from __future__ import print_function, division
 
+import heapq
+import time
 import six
 
 from abc import ABCMeta, abstractmethod
 from datetime import datetime, timedelta
 from functools import partial, total_ordering
+from itertools import groupby
+from operator import itemgetter
 
 __all__ = [
     'StoreBase',
@@ -13,6 +17,8 @@ __all__ = [
     'Interval',
     'FORMAT',
     'get_datetime',
+    'get_tstamp',
+    'bucket_start',
 ]
 
 # bucket size in seconds
@@ -20,6 +26,7 @@ BUCKET_SIZE = 600
 SEC_IN_DAY = 3600 * 24
 
 FORMAT = "%Y-%m-%dT%H:%M:%S"
+EPOCH = datetime(1970, 1, 1)
 
 def dt(date):
     return datetime.strptime(date, FORMAT)
@@ -66,15 +73,101 @@ def get_datetime(timestamp):
 
 
 def naive_tstamp(dt):
-    return (dt - datetime(1970, 1, 1)).total_seconds()
+    return (dt - EPOCH).total_seconds()
 
 
-def record_to_data(record):
+def parse_tstamp(timestamp):
+    """
+    Naive timestamp of '2018-03-03T12:30:00[.ffffff]' taken from the
+    digits at fixed positions, much cheaper than strptime
+    :return: None when the string does not match FORMAT
+    """
+    length = len(timestamp)
+    if length < 19 or timestamp[4] != '-' or timestamp[7] != '-' or timestamp[10] != 'T' or \
+            timestamp[13] != ':' or timestamp[16] != ':':
+        return None
+    microsecond = 0
+    if length > 19:
+        fraction = timestamp[20:]
+        if timestamp[19] != '.' or not 0 < len(fraction) <= 6 or not fraction.isdigit():
+            return None
+        microsecond = int(fraction.ljust(6, '0'))
+    try:
+        return naive_tstamp(datetime(
+            int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]),
+            int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19]), microsecond))
+    except ValueError:
+        return None
+
+
+def get_tstamp(timestamp):
+    """
+    Naive timestamp, same as naive_tstamp(get_datetime(timestamp)) without
+    building a datetime for epoch numbers when local time is UTC and
+    without strptime for strings in FORMAT
+    :param timestamp: datetime, FORMAT string or epoch seconds
+    :rtype: float
+    """
+    kind = type(timestamp)
+    if kind is float or kind is int:
+        if not time.timezone and not time.daylight:
+            # datetime keeps only microseconds
+            return float(timestamp) if kind is int else round(timestamp, 6)
+        return naive_tstamp(datetime.fromtimestamp(timestamp))
+    if kind is str:
+        tstamp = parse_tstamp(timestamp)
+        if tstamp is not None:
+            return tstamp
+    return naive_tstamp(get_datetime(timestamp))
+
+
+def bucket_start(tstamp, bucket_size):
+    """
+    Start of the bucket holding the timestamp, same as StoreBase._get_bucket
+    buckets restart every hour or every day for buckets larger than an hour
+    :param tstamp: naive timestamp in seconds
+    :param bucket_size: in seconds
+    :return: naive timestamp of the bucket start
+    :rtype: int
+    """
+    period = 3600 if bucket_size <= 3600 else SEC_IN_DAY
+    offset = tstamp % period
+    return int(tstamp - offset) + int(offset // bucket_size) * bucket_size
+
+
+def project_data(record, fields):
+    """
+    Only the given fields of the record, they are looked up without
+    splitting the whole record
+    :param record: 'cpu:7.5,foo:8'
+    :param fields: field names
+    :return: 'cpu:7.5' for ['cpu'], empty when no field is present
+    """
+    pairs = []
+    for field in fields:
+        key = field + ':'
+        if record.startswith(key):
+            start = 0
+        else:
+            start = record.find(',' + key) + 1
+            if not start:
+                continue
+        end = record.find(',', start)
+        pairs.append(record[start:] if end < 0 else record[start:end])
+    return ','.join(pairs)
+
+
+def record_to_data(record, fields=None):
     """
 
     :param record: 'cpu:7.5,foo:8'
+    :param fields: parse only these fields, all by default
     :return:
     """
+    if fields is not None:
+        record = project_data(record, fields)
+        if not record:
+            return {}
     data = {}
     for pair in record.split(','):
         elem = pair.split(':')
@@ -82,6 +175,36 @@ def record_to_data(record):
     return data
 
 
+def _tagged(index, stream):
+    for records in stream:
+        for tstamp, data in records:
+            yield tstamp, index, data
+
+
+def merge_series(names, streams, wide=False):
+    """
+    Heap based k-way merge of series into one stream ordered by timestamp,
+    records of equal timestamps come in the order of names
+    :param names: series names
+    :param streams: per name iterable of lists of records sorted by
+        timestamp, one list per bucket
+    :param wide: one row per timestamp with data of every series
+    :return: Generator of (name, timestamp, data) or with wide of
+        (timestamp, [data or None for every name])
+    """
+    merged = heapq.merge(*[_tagged(index, stream) for index, stream in enumerate(streams)])
+    if not wide:
+        for tstamp, index, data in merged:
+            yield names[index], tstamp, data
+        return
+
+    for tstamp, group in groupby(merged, key=itemgetter(0)):
+        row = [None] * len(names)
+        for _, index, data in group:
+            row[index] = data
+        yield tstamp, row
+
+
 class StoreSetupError(Exception):
     pass
 
@@ -89,12 +212,18 @@ class StoreSetupError(Exception):
 @six.add_metaclass(ABCMeta)
 class StoreBase(object):
 
-    def __init__(self, bucket_size=BUCKET_SIZE):
+    def __init__(self, bucket_size=BUCKET_SIZE, stats=None):
+        """
+        :param bucket_size: seconds of one bucket
+        :param stats: count calls and time them, no bookkeeping when None
+        :type stats: notmany.store.stats.Stats | None
+        """
         if bucket_size % 60:
             raise NotImplementedError('Currently buckets have to be in minutes')
         if bucket_size > 3600 * 24:
             raise NotImplementedError('We do not support buckets larger than 24 h')
         self._bucket_size = bucket_size
+        self.stats = stats
 
     @property
     def bucket_size(self):
@@ -108,9 +237,87 @@ class StoreBase(object):
         :param data:
         :return:
         """
-        dt = get_datetime(timestamp)
-        bucket = self._get_bucket(name, dt)
-        bucket.append(naive_tstamp(dt), data)
+        if self.stats is None:
+            self._record_tstamps(name, [(get_tstamp(timestamp), data)])
+            return
+        start = time.perf_counter()
+        self._record_tstamps(name, [(get_tstamp(timestamp), data)])
+        self.stats.observe('record', time.perf_counter() - start)
+        self.stats.incr('record.points')
+
+    def record_many(self, name, points):
+        """
+        Record many data points of one series, points are grouped by
+        bucket so every bucket is written once
+        :param name:
+        :param points: iterable of (timestamp, data)
+        :return:
+        """
+        if self.stats is None:
+            self._record_tstamps(name, [(get_tstamp(timestamp), data) for timestamp, data in points])
+            return
+        start = time.perf_counter()
+        records = [(get_tstamp(timestamp), data) for timestamp, data in points]
+        self._record_tstamps(name, records)
+        self.stats.observe('record_many', time.perf_counter() - start)
+        self.stats.incr('record.points', len(records))
+
+    def _record_tstamps(self, name, records):
+        """
+        Write records of one series, grouped by bucket
+        :param name:
+        :param records: list of (naive timestamp, data)
+        """
+        if len(records) == 1:
+            tstamp, data = records[0]
+            self._write_bucket(name, bucket_start(tstamp, self._bucket_size)).append(tstamp, data)
+            self._appended(name, records)
+            return
+
+        groups = {}
+        for tstamp, data in records:
+            key = bucket_start(tstamp, self._bucket_size)
+            try:
+                groups[key].append((tstamp, data))
+            except KeyError:
+                groups[key] = [(tstamp, data)]
+
+        for key in sorted(groups):
+            bucket = self._write_bucket(name, key)
+            bucket.extend(groups[key])
+            self._appended(name, groups[key])
+
+    def record_many_series(self, records):
+        """
+        Record data points of many series at once
+        :param records: iterable of (name, timestamp, data)
+        :return:
+        """
+        series = {}
+        for name, timestamp, data in records:
+            try:
+                series[name].append((timestamp, data))
+            except KeyError:
+                series[name] = [(timestamp, data)]
+
+        for name, points in series.items():
+            self.record_many(name, points)
+
+    def _write_bucket(self, name, start):
+        """
+        Bucket new records go to
+        :param name:
+        :param start: naive timestamp of the bucket start
+        :rtype: BucketBase
+        """
+        return self._create_bucket(name=name, start=EPOCH + timedelta(seconds=start))
+
+    def _appended(self, name, records):
+        """
+        Called after records of one bucket got appended
+        :param name:
+        :param records: list of (naive timestamp, data)
+        """
 
     def _get_bucket(self, name, dt):
         """
@@ -121,24 +328,8 @@ class StoreBase(object):
         :return:
         :rtype: BucketBase
         """
-
-        base = dt.replace(minute=0, second=0, microsecond=0)
-
-        if self._bucket_size < 3600:
-            minutes_in_bucket = int(self._bucket_size / 60)
-            return self._create_bucket(
-                name=name,
-                start=base.replace(
-                    minute=int(dt.minute / minutes_in_bucket) * minutes_in_bucket))
-
-        if self._bucket_size == 3600:
-            return self._create_bucket(name=name, start=base)
-
-        if self._bucket_size > 3600:
-            h_in_bucket = int(self._bucket_size / 3600)
-            return self._create_bucket(
-                name=name,
-                start=base.replace(hour=int(dt.hour / h_in_bucket) * h_in_bucket))
+        start = bucket_start(naive_tstamp(dt), self._bucket_size)
+        return self._create_bucket(name=name, start=EPOCH + timedelta(seconds=start))
 
     @abstractmethod
     def _create_bucket(self, name, start):
@@ -181,6 +372,16 @@ class StoreBase(object):
             if bucket.start > interval.end:
                 break
 
+    def flush(self):
+        """
+        Make sure everything recorded so far is persisted
+        """
+
+    def close(self):
+        """
+        Flush and release resources held by the store
+        """
+
     @abstractmethod
     def get_all(self, name):
         """
@@ -190,12 +391,37 @@ class StoreBase(object):
         """
 
     @abstractmethod
-    def retrieve(self, name, interval=None):
+    def retrieve(self, name, interval=None, fields=None):
         """
         Retrieve all data points in given interval
+        :param fields: only these fields, records without any of them are
+            skipped, all fields by default
         :returns: Iterable
         """
 
+    def _sorted_buckets(self, name, interval=None, fields=None):
+        """
+        Records of the series sorted by timestamp
+        :return: Generator of lists of records, one per bucket
+        """
+        for _, records in groupby(self.retrieve(name=name, interval=interval, fields=fields),
+                                  key=lambda record: bucket_start(record[0], self._bucket_size)):
+            yield sorted(records, key=itemgetter(0))
+
+    def retrieve_many(self, names, interval=None, wide=False, fields=None):
+        """
+        Retrieve many series as one stream ordered by timestamp
+        :param names: series names
+        :param interval:
+        :type interval: Interval | None
+        :param wide: one row per timestamp with data of every series
+        :param fields: only these fields, all by default
+        :return: Generator of (name, timestamp, data) or with wide of
+            (timestamp, [data or None for every name])
+        """
+        return merge_series(
+            names, [self._sorted_buckets(name=name, interval=interval, fields=fields) for name in names], wide)
+
     @abstractmethod
     def forget(self, name, interval=None):
         """
@@ -221,15 +447,78 @@ class BucketBase(object):
     def __iter__(self):
         return self.read()
 
+    @property
+    def end(self):
+        return self.start + timedelta(seconds=self.length)
+
+    @property
+    def closed(self):
+        """
+        Time window of the bucket has passed so it should not change any more
+        :rtype: bool
+        """
+        return self.end <= datetime.now()
+
     @abstractmethod
     def append(self, timestamp, data):
         pass
 
+    def extend(self, records):
+        """
+        Append many records, implementations should write them at once
+        :param records: list of (timestamp, data)
+        """
+        for timestamp, data in records:
+            self.append(timestamp, data)
+
     @abstractmethod
     def read(self):
         for item in []:
             yield item
 
+    def read_range(self, low, high, ordered=False):
+        """
+        Records with low <= timestamp <= high
+        :param low: naive timestamp
+        :param high: naive timestamp
+        :param ordered: records are known to be sorted by timestamp
+        :return: Generator
+        """
+        for record in self.read():
+            if low <= record[0] <= high:
+                yield record
+
+    def project(self, fields, bounds=None):
+        """
+        Records with only the given fields, records without any of them
+        are skipped
+        :param fields: field names
+        :param bounds: None or (low, high, ordered) of read_range
+        :return: Generator
+        """
+        records = self.read() if bounds is None else self.read_range(*bounds)
+        for tstamp, data in records:
+            data = project_data(data, fields)
+            if data:
+                yield tstamp, data
+
+    @property
+    def sealed(self):
+        """
+        Bucket was sorted by timestamp and nothing was appended since
+        :rtype: bool
+        """
+        return False
+
+    def seal(self, dedupe=False):
+        """
+        Sort the bucket by timestamp and mark it sealed
+        :param dedupe: keep only the last record written for a timestamp
+        :return: sorted timestamps
+        :rtype: list
+        """
+        raise NotImplementedError('Bucket {} can not be sealed'.format(type(self).__name__))
+
     @abstractmethod
     def delete(self):
         pass
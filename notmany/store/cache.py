@@ -0,0 +1,117 @@
+import os
+import threading
+from collections import OrderedDict
+
+__all__ = [
+    'BucketCache',
+    'file_stamp',
+]
+
+MAX_BYTES = 64 * 1024 * 1024
+# rough memory of one (timestamp, data) tuple besides the data string
+RECORD_OVERHEAD = 120
+
+
+def file_stamp(path):
+    """
+    Identity of the file content, changes when the file is appended to or
+    replaced
+    :return: None when the file does not exist
+    :rtype: tuple | None
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def records_size(records):
+    return sum([RECORD_OVERHEAD + len(data) for _, data in records])
+
+
+def arrays_size(arrays):
+    timestamps, columns = arrays
+    return timestamps.nbytes + sum([column.nbytes for column in columns.values()])
+
+
+class BucketCache(object):
+    """
+    Parsed bucket contents, as lists of records or as columns, bounded by
+    their approximate size in bytes with least recently used ones evicted
+    first. Entries are valid while the file stamp they were read with
+    matches the file.
+    """
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        # (path, kind) -> (stamp, value, size)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, stamp):
+        """
+        :param key: (path, kind)
+        :param stamp: current file stamp
+        :return: None when not cached or cached for another stamp
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] != stamp:
+                self._remove(key)
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, stamp, value, size):
+        """
+        :param key: (path, kind)
+        :param stamp: file stamp taken before the value was read
+        :param size: approximate size of value in bytes
+        """
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (stamp, value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        self.bytes -= self._entries.pop(key)[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """
+        :rtype: dict
+        """
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
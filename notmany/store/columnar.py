@@ -0,0 +1,235 @@
+import os
+import struct
+
+import numpy
+
+from .base import record_to_data
+from .file import Bucket, CHUNK_SIZE, path_exists, chunks, trim_arrays
+
+__all__ = [
+    'ColumnarBucket',
+]
+
+MAGIC = b'NMC1'
+# magic, length of the comma separated field names that follow
+HEADER = struct.Struct('<4sI')
+# number of rows in a block
+BLOCK = struct.Struct('<I')
+DTYPE = numpy.dtype('<f8')
+NAN = float('nan')
+
+
+class ColumnarBucket(Bucket):
+    """
+    Bucket keeping data in fixed width float64 columns.
+
+    File starts with a header listing the field names followed by blocks,
+    each block is a row count, the timestamp column and one column per
+    field in header order. Every ``extend`` call writes one block, missing
+    fields are stored as NaN.
+    """
+    __slots__ = []
+
+    def append(self, timestamp, data):
+        self.extend([(timestamp, data)])
+
+    def extend(self, records):
+        timestamps = []
+        rows = []
+        for timestamp, data in records:
+            timestamps.append(timestamp)
+            rows.append(data if isinstance(data, dict) else record_to_data(data))
+
+        new_fields = []
+        for row in rows:
+            for field in row:
+                if field not in new_fields:
+                    new_fields.append(field)
+
+        if not path_exists(self.dir):
+            os.makedirs(self.dir, exist_ok=True)
+        self._prepare_write()
+
+        fields = self.fields()
+        if fields is None:
+            fields = new_fields
+            with open(self.full_path, 'wb') as fp:
+                fp.write(encode_header(fields))
+        elif not set(new_fields).issubset(fields):
+            fields = fields + [f for f in new_fields if f not in fields]
+            self._widen(fields)
+
+        columns = [[row.get(field, NAN) for row in rows] for field in fields]
+        with open(self.full_path, 'ab') as fp:
+            fp.write(encode_block(timestamps, columns))
+
+    def fields(self):
+        """
+        Field names from the header
+        :return: None when bucket does not exist
+        :rtype: list | None
+        """
+        fp = self._open('rb')
+        if fp is None:
+            return None
+        with fp:
+            head = fp.read(HEADER.size)
+            head += fp.read(HEADER.unpack(head)[1])
+        return decode_header(head)[0]
+
+    def _arrays(self, fields=None):
+        """
+        Read the bucket as columns, closed buckets are memory mapped so
+        single block columns are read only views of the file, compressed
+        ones are decompressed into memory
+        :param fields: only these fields, all by default
+        :return: timestamps and dictionary of field name to column
+        :rtype: (numpy.ndarray, dict)
+        """
+        content = self._map() if self.closed else None
+        if content is None:
+            fp = self._open('rb')
+            if fp is not None:
+                with fp:
+                    content = fp.read()
+
+        if not content:
+            return numpy.empty(0, DTYPE), {}
+        return decode(content, fields)
+
+    def read(self):
+        return self._records(*self.arrays())
+
+    def read_range(self, low, high, ordered=False):
+        return self._records(*trim_arrays(*self.arrays(), low=low, high=high, ordered=ordered))
+
+    def project(self, fields, bounds=None):
+        """
+        Records with only the given fields, only their columns are decoded
+        and rows where all of them are NaN are skipped
+        """
+        timestamps, columns = self.arrays(fields)
+        if bounds is not None:
+            timestamps, columns = trim_arrays(timestamps, columns, *bounds)
+        for record in self._records(timestamps, columns):
+            if record[1]:
+                yield record
+
+    def raw(self, size=CHUNK_SIZE):
+        return chunks(self.read(), size)
+
+    def raw_range(self, low, high, ordered=False, size=CHUNK_SIZE):
+        return chunks(self.read_range(low, high, ordered), size)
+
+    @property
+    def stored_gzip(self):
+        """
+        Stored columns are not raw content, they are never sent as stored
+        """
+        return None
+
+    @staticmethod
+    def _records(timestamps, columns):
+        names = list(columns)
+        values = [columns[name].tolist() for name in names]
+        for i, timestamp in enumerate(timestamps.tolist()):
+            yield timestamp, format_data(names, [column[i] for column in values])
+
+    def seal(self, dedupe=False):
+        self._release()
+        self._decompress()
+        fields = self.fields()
+        if fields is None:
+            return []
+
+        timestamps, columns = self.arrays()
+        order = numpy.argsort(timestamps, kind='stable')
+        timestamps = timestamps[order]
+        if dedupe and len(timestamps):
+            # keep the last written one of equal timestamps
+            keep = numpy.append(timestamps[1:] != timestamps[:-1], True)
+            order, timestamps = order[keep], timestamps[keep]
+
+        self._rewrite(fields, timestamps, [columns[field][order] for field in fields])
+        self._mark_sealed()
+        return timestamps.tolist()
+
+    def _widen(self, fields):
+        timestamps, columns = self.arrays()
+        nan = numpy.full(len(timestamps), NAN)
+        self._rewrite(fields, timestamps, [columns.get(field, nan) for field in fields])
+
+    def _rewrite(self, fields, timestamps, columns):
+        content = encode_header(fields)
+        if len(timestamps):
+            content += encode_block(timestamps, columns)
+        self._replace(content, mode='wb')
+
+
+def format_data(names, values):
+    """
+    Text representation of one row, NaN values are skipped
+    :return: 'cpu:7.0,mem:8.0'
+    """
+    return ','.join(['{}:{!r}'.format(name, value) for name, value in zip(names, values) if value == value])
+
+
+def encode_header(fields):
+    names = ','.join(fields).encode('utf-8')
+    return HEADER.pack(MAGIC, len(names)) + names
+
+
+def decode_header(content):
+    """
+    :return: field names and offset of the first block
+    :rtype: (list, int)
+    """
+    magic, length = HEADER.unpack_from(content, 0)
+    if magic != MAGIC:
+        raise ValueError('Not a columnar bucket')
+    offset = HEADER.size + length
+    names = bytes(content[HEADER.size:offset]).decode('utf-8')
+    return (names.split(',') if names else []), offset
+
+
+def encode_block(timestamps, columns):
+    parts = [BLOCK.pack(len(timestamps)), numpy.asarray(timestamps, DTYPE).tobytes()]
+    for column in columns:
+        parts.append(numpy.asarray(column, DTYPE).tobytes())
+    return b''.join(parts)
+
+
+def decode(content, fields=None):
+    """
+    Decode the whole bucket content into columns, a single block bucket
+    gives views over content without copying
+    :param content: bucket file content
+    :type content: bytes | mmap.mmap
+    :param fields: only these fields, all by default
+    :return: timestamps and dictionary of field name to column
+    :rtype: (numpy.ndarray, dict)
+    """
+    names, offset = decode_header(content)
+    wanted = names if fields is None else [name for name in names if name in fields]
+    indexes = [names.index(name) for name in wanted]
+
+    timestamps = []
+    columns = [[] for _ in wanted]
+    size = len(content)
+    while offset < size:
+        count, = BLOCK.unpack_from(content, offset)
+        offset += BLOCK.size
+        timestamps.append(numpy.frombuffer(content, DTYPE, count, offset))
+        for column, index in zip(columns, indexes):
+            column.append(numpy.frombuffer(content, DTYPE, count, offset + (index + 1) * count * DTYPE.itemsize))
+        offset += (len(names) + 1) * count * DTYPE.itemsize
+
+    return _join(timestamps), dict(zip(wanted, [_join(column) for column in columns]))
+
+
+def _join(chunks):
+    if not chunks:
+        return numpy.empty(0, DTYPE)
+    if len(chunks) == 1:
+        return chunks[0]
+    return numpy.concatenate(chunks)
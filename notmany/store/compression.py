@@ -0,0 +1,94 @@
+import gzip
+import lzma
+import os
+import zlib
+
+__all__ = [
+    'CODECS',
+    'SUFFIXES',
+    'check_codec',
+    'compress_file',
+    'decompress_file',
+    'open_compressed',
+    'GzipStream',
+]
+
+# codec name -> file suffix
+CODECS = {
+    'zlib': '.gz',
+    'lzma': '.xz',
+}
+SUFFIXES = tuple(CODECS.values())
+GZIP_SUFFIX = CODECS['zlib']
+# gzip framing for zlib.compressobj
+GZIP_WBITS = 31
+
+
+def check_codec(codec):
+    """
+    :raises ValueError: for unknown codec
+    """
+    if codec not in CODECS:
+        raise ValueError('Unknown codec {}, use one of {}'.format(codec, ', '.join(sorted(CODECS))))
+
+
+def open_compressed(path, mode='rt'):
+    """
+    Open compressed file for streaming read, codec is chosen by suffix
+    """
+    if path.endswith(GZIP_SUFFIX):
+        return gzip.open(path, mode)
+    return lzma.open(path, mode)
+
+
+def compress_file(path, codec):
+    """
+    Replace the file with its compressed version, zlib buckets are written
+    in gzip format so they can be sent to HTTP clients as they are
+    :return: path of the compressed file
+    """
+    check_codec(codec)
+    target = path + CODECS[codec]
+    tmp_path = target + '.tmp'
+    with open(path, 'rb') as source:
+        if codec == 'zlib':
+            compressed = gzip.open(tmp_path, 'wb')
+        else:
+            compressed = lzma.open(tmp_path, 'wb')
+        with compressed:
+            for chunk in iter(lambda: source.read(65536), b''):
+                compressed.write(chunk)
+    os.replace(tmp_path, target)
+    os.remove(path)
+    return target
+
+
+def decompress_file(path):
+    """
+    Replace the compressed file with the plain one
+    :return: path of the plain file
+    """
+    target = path.rsplit('.', 1)[0]
+    tmp_path = target + '.tmp'
+    with open_compressed(path, 'rb') as source, open(tmp_path, 'wb') as plain:
+        for chunk in iter(lambda: source.read(65536), b''):
+            plain.write(chunk)
+    os.replace(tmp_path, target)
+    os.remove(path)
+    return target
+
+
+class GzipStream(object):
+    """
+    Incremental gzip member, text goes in and compressed bytes come out
+    """
+    __slots__ = ['_compressor']
+
+    def __init__(self, level=1):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+
+    def write(self, text):
+        return self._compressor.compress(text.encode('utf-8'))
+
+    def finish(self):
+        return self._compressor.flush()
@@ -0,0 +1,238 @@
+from .base import record_to_data
+
+__all__ = [
+    'LTTB',
+    'MinMax',
+    'downsample',
+    'METHODS',
+]
+
+# points of an LTTB bucket kept before they get reduced to their hull
+MAX_CANDIDATES = 256
+
+
+class LTTB(object):
+    """
+    Largest Triangle Three Buckets over time buckets of an interval in one
+    pass. The interval is split into points - 2 buckets of equal length,
+    the first and the last point are kept and from every non empty bucket
+    the point forming the largest triangle with the point kept from the
+    previous bucket and the average of the next non empty bucket. Only
+    the bucket being decided and the next one are held, see Candidates.
+    """
+
+    def __init__(self, start, end, points):
+        """
+        :param start: naive timestamp of the interval start
+        :param end: naive timestamp of the interval end
+        :param points: most points kept, at least 3
+        """
+        if points < 3:
+            raise ValueError('LTTB needs at least 3 points')
+        self.start = start
+        self.count = points - 2
+        self.width = float(end - start) / self.count or 1.0
+        self.result = []
+        # candidates of the bucket to decide and of the next one
+        self._current = None
+        self._following = None
+        self._last = None
+
+    def _index(self, tstamp):
+        return min(max(int((tstamp - self.start) / self.width), 0), self.count - 1)
+
+    def add(self, tstamp, value):
+        if not self.result:
+            self.result.append((tstamp, value))
+            return
+
+        point = self._last = (tstamp, value)
+        index = self._index(tstamp)
+        if self._current is None or index <= self._current.index:
+            if self._current is None:
+                self._current = Candidates(index)
+            self._current.add(point)
+        elif self._following is None or index <= self._following.index:
+            if self._following is None:
+                self._following = Candidates(index)
+            self._following.add(point)
+        else:
+            self._select(self._current.points, self._following.average())
+            self._current, self._following = self._following, Candidates(index)
+            self._following.add(point)
+
+    def _select(self, candidates, following):
+        """
+        Keep the candidate with the largest triangle between the last kept
+        point and following
+        """
+        a_x, a_y = self.result[-1]
+        c_x, c_y = following
+        best, largest = None, -1.0
+        for point in candidates:
+            area = abs((a_x - c_x) * (point[1] - a_y) - (a_x - point[0]) * (c_y - a_y))
+            if area > largest:
+                best, largest = point, area
+        self.result.append(best)
+
+    def finish(self):
+        """
+        :return: list of (timestamp, value) kept
+        """
+        pending = [candidates for candidates in (self._current, self._following) if candidates is not None]
+        if pending:
+            pending[-1].remove(self._last)
+            pending = [candidates for candidates in pending if candidates.count]
+            if len(pending) == 2:
+                self._select(pending[0].points, pending[1].average())
+            if pending:
+                self._select(pending[-1].points, self._last)
+            self.result.append(self._last)
+        self._current = self._following = self._last = None
+        return self.result
+
+
+class Candidates(object):
+    """
+    Points of one LTTB bucket as far as the selection needs them, running
+    sums for the average and the points that can form the largest
+    triangle. The area is linear in the point so the largest one has its
+    corner on the convex hull of the bucket, points inside the hull are
+    dropped whenever MAX_CANDIDATES pile up. A hull larger than half of
+    MAX_CANDIDATES keeps only every n-th vertex, so memory stays bounded
+    for any bucket at the cost of an approximate choice in that case.
+    """
+    __slots__ = ['index', 'points', 'count', 'sum_x', 'sum_y']
+
+    def __init__(self, index):
+        self.index = index
+        self.points = []
+        self.count = 0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+
+    def add(self, point):
+        self.points.append(point)
+        self.count += 1
+        self.sum_x += point[0]
+        self.sum_y += point[1]
+        if len(self.points) >= MAX_CANDIDATES:
+            points = hull(self.points)
+            step = -(-len(points) // (MAX_CANDIDATES // 2))
+            self.points = points[::step]
+
+    def remove(self, point):
+        if point in self.points:
+            self.points.remove(point)
+        self.count -= 1
+        self.sum_x -= point[0]
+        self.sum_y -= point[1]
+
+    def average(self):
+        return self.sum_x / self.count, self.sum_y / self.count
+
+
+class MinMax(object):
+    """
+    Minimum and maximum of every one of points / 2 time buckets of an
+    interval, kept in time order
+    """
+
+    def __init__(self, start, end, points):
+        """
+        :param start: naive timestamp of the interval start
+        :param end: naive timestamp of the interval end
+        :param points: most points kept, at least 2
+        """
+        if points < 2:
+            raise ValueError('Min max decimation needs at least 2 points')
+        self.start = start
+        self.count = points // 2
+        self.width = float(end - start) / self.count or 1.0
+        # bucket index -> [minimum, maximum] as (timestamp, value)
+        self._buckets = {}
+
+    def add(self, tstamp, value):
+        index = min(max(int((tstamp - self.start) / self.width), 0), self.count - 1)
+        extremes = self._buckets.get(index)
+        if extremes is None:
+            self._buckets[index] = [(tstamp, value), (tstamp, value)]
+        elif value < extremes[0][1]:
+            extremes[0] = (tstamp, value)
+        elif value > extremes[1][1]:
+            extremes[1] = (tstamp, value)
+
+    def finish(self):
+        """
+        :return: list of (timestamp, value) kept
+        """
+        result = []
+        for index in sorted(self._buckets):
+            low, high = sorted(self._buckets[index])
+            result.append(low)
+            if high != low:
+                result.append(high)
+        return result
+
+
+METHODS = {
+    'lttb': LTTB,
+    'minmax': MinMax,
+}
+
+
+def cross(origin, a, b):
+    return (a[0] - origin[0]) * (b[1] - origin[1]) - (a[1] - origin[1]) * (b[0] - origin[0])
+
+
+def hull(points):
+    """
+    Convex hull by the monotone chain
+    :return: vertices of the hull in counter clockwise order
+    :rtype: list
+    """
+    points = sorted(set(points))
+    if len(points) < 3:
+        return points
+    lower, upper = [], []
+    for point in points:
+        while len(lower) > 1 and cross(lower[-2], lower[-1], point) <= 0:
+            lower.pop()
+        lower.append(point)
+    for point in reversed(points):
+        while len(upper) > 1 and cross(upper[-2], upper[-1], point) <= 0:
+            upper.pop()
+        upper.append(point)
+    return lower[:-1] + upper[:-1]
+
+
+def downsample(records, start, end, points, method='lttb', fields=None):
+    """
+    Downsample every field of records in one pass, memory is bounded by
+    the points kept and for LTTB by candidates of two time buckets
+    :param records: iterable of (naive timestamp, data) in time order
+    :param start: naive timestamp of the interval start
+    :param end: naive timestamp of the interval end
+    :param points: most points kept of every field
+    :param method: lttb or minmax
+    :param fields: only these fields, all by default
+    :return: field name to list of (timestamp, value)
+    :rtype: dict
+    :raises ValueError: for unknown method or too few points
+    """
+    if method not in METHODS:
+        raise ValueError('Unknown downsampling method {}'.format(method))
+    sampler_class = METHODS[method]
+    # check points before reading any record
+    sampler_class(start, end, points)
+
+    samplers = {}
+    for tstamp, data in records:
+        for field, value in record_to_data(data, fields).items():
+            if value != value:
+                continue
+            sampler = samplers.get(field)
+            if sampler is None:
+                sampler = samplers[field] = sampler_class(start, end, points)
+            sampler.add(tstamp, value)
+    return dict((field, sampler.finish()) for field, sampler in samplers.items())
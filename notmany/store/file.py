@@ -1,18 +1,49 @@
 
+import mmap
 import os
-from datetime import datetime
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from functools import partial
+from itertools import chain, islice
+from operator import itemgetter
 from tempfile import gettempdir
+from time import perf_counter
 
 import shutil
 
 import errno
+import threading
+import numpy
 
-from .base import StoreBase, BucketBase, StoreSetupError
+from .base import (
+    StoreBase, BucketBase, StoreSetupError, EPOCH, record_to_data, naive_tstamp, bucket_start, SEC_IN_DAY,
+    get_datetime, get_tstamp, merge_series, Interval)
+from .manifest import Manifest
+from . import rollup, compression
+from .wal import fsync_path, FSYNC_NEVER
+from .compression import check_codec
+from .cache import file_stamp, records_size, arrays_size
+from .retention import Tombstones
+from .aggregate import aggregate, aggregate_rollup, check_funcs, concatenate, FUNCS
 
 DEFAULT_DIR_NAME = 'notmany_store'
+SEALED_SUFFIX = '.sealed'
 CHUNK_SIZE = 65536
 MAX_DELTA = 86400 * 7
+# seconds between applying write ahead log records to buckets
+APPLY_INTERVAL = 0.1
+# age in seconds after which closed buckets get compressed
+COMPRESS_AFTER = SEC_IN_DAY
+# tombstoned paths deleted at once by the background retention
+RECLAIM_BATCH = 100
+# buckets written to recently kept so their paths are built once
+WRITE_BUCKETS = 4096
+# threads reading series of retrieve_many when the store does not prefetch
+MANY_WORKERS = 8
+# kinds of parsed bucket contents kept in BucketCache
+CACHED_RECORDS = 'records'
+CACHED_ARRAYS = 'arrays'
 
 # petty optimisations
 path_exists = os.path.exists
@@ -21,108 +52,1563 @@ path_join = os.path.join
 #TODO add logging
 
 
+def run_periodically(interval, func, stopped):
+    """
+    Call func every interval seconds in a daemon thread until stopped is set
+    :type stopped: threading.Event
+    :rtype: threading.Thread
+    """
+    def loop():
+        while not stopped.wait(interval):
+            try:
+                func()
+            except (OSError, ValueError) as exc:
+                print('Background {} failed {}'.format(func.__name__, exc))
+
+    thread = threading.Thread(target=loop)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def prefetched(items, load, depth, executor):
+    """
+    Map load over items with up to depth items loaded ahead on the executor
+    :param items: iterable consumed lazily
+    :param depth: items loaded in advance of the one being yielded
+    :type executor: concurrent.futures.Executor
+    :return: Generator of results in the order of items
+    """
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(executor.submit(load, item))
+            if len(pending) > depth:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def map_file(path):
+    """
+    Map the file read only, the mapping stays valid after the file is closed
+    :return: None when the file does not exist or is empty
+    :rtype: mmap.mmap | None
+    """
+    if not path_exists(path):
+        return None
+    with open(path, 'rb') as fp:
+        try:
+            return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            return None
+
+
+def scan_names(directory, dirs):
+    """
+    Names of directories or files in directory
+    :param dirs: list directories if true otherwise files
+    :return: Generator of names
+    """
+    for entry in os.scandir(directory):
+        if entry.is_dir() == dirs:
+            yield entry.name
+
+
+def scan_days(base):
+    """
+    Day directories of a series directory in chronological order
+    :return: Generator of (day directory, day start datetime)
+    """
+    for day in sorted(scan_names(base, dirs=True)):
+        try:
+            year, month, day_of_month = [int(part) for part in day.split('_')]
+        except ValueError:
+            continue
+        yield path_join(base, day), datetime(year, month, day_of_month)
+
+
+def scan_buckets(day_dir, day):
+    """
+    Buckets of a day directory in chronological order, compressed ones
+    are listed under the name of their plain file
+    :return: list of (file name, bucket start datetime)
+    """
+    file_names = set()
+    for file_name in scan_names(day_dir, dirs=False):
+        if file_name.endswith(compression.SUFFIXES):
+            file_name = file_name.rsplit('.', 1)[0]
+        file_names.add(file_name)
+    buckets = []
+    for file_name in sorted(file_names):
+        try:
+            hour, minute, second = [int(part) for part in file_name.split('_')]
+        except ValueError:
+            continue
+        buckets.append((file_name, day.replace(hour=hour, minute=minute, second=second)))
+    return buckets
+
+
+def seek_line(content, tstamp, after=False):
+    """
+    Bisect content of a sorted text bucket
+    :param content: bucket content
+    :type content: mmap.mmap | bytes
+    :param tstamp: naive timestamp
+    :param after: look for the first line with timestamp greater than
+        tstamp instead of greater or equal
+    :return: offset of the first matching line
+    :rtype: int
+    """
+    low, high = 0, len(content)
+    while low < high:
+        middle = (low + high) // 2
+        line_start = content.rfind(b'\n', low, middle) + 1 or low
+        line_end = content.find(b'\n', line_start)
+        if line_end < 0:
+            line_end = len(content)
+        value = float(content[line_start:content.find(b' ', line_start, line_end)])
+        if value < tstamp or (after and value == tstamp):
+            low = line_end + 1
+        else:
+            high = line_start
+    return min(low, len(content))
+
+
+def trim_arrays(timestamps, columns, low, high, ordered=False):
+    """
+    Keep only rows with low <= timestamp <= high
+    :return: timestamps and columns
+    :rtype: (numpy.ndarray, dict)
+    """
+    if ordered:
+        selection = slice(numpy.searchsorted(timestamps, low, 'left'),
+                          numpy.searchsorted(timestamps, high, 'right'))
+    else:
+        selection = (timestamps >= low) & (timestamps <= high)
+    return timestamps[selection], dict((key, column[selection]) for key, column in columns.items())
+
+
+def records_to_arrays(records, fields=None):
+    """
+    Parse text records into columns, fields missing in a record are NaN
+    :param records: iterable of (timestamp, data)
+    :param fields: only these fields, all by default
+    :return: timestamps and dictionary of field name to column
+    :rtype: (numpy.ndarray, dict)
+    """
+    timestamps = []
+    rows = []
+    keys = set()
+    for timestamp, data in records:
+        row = record_to_data(data, fields)
+        timestamps.append(timestamp)
+        rows.append(row)
+        keys.update(row)
+
+    if fields is not None:
+        keys.intersection_update(fields)
+
+    nan = numpy.nan
+    return numpy.array(timestamps, numpy.float64), dict(
+        (key, numpy.array([row.get(key, nan) for row in rows], numpy.float64)) for key in keys)
+
+
+def bucket_records(bucket, bounds, fields=None):
+    """
+    :param bounds: None or (low, high, ordered) to trim the bucket to
+    :param fields: only these fields, all by default
+    :return: iterable of records
+    """
+    if fields is not None:
+        return bucket.project(fields, bounds)
+    return bucket if bounds is None else bucket.read_range(*bounds)
+
+
+def read_bucket(bucket, bounds, fields=None):
+    """
+    :param bounds: None or (low, high, ordered) to trim the bucket to
+    :param fields: only these fields, all by default
+    :return: list of records
+    """
+    return list(bucket_records(bucket, bounds, fields))
+
+
+def sorted_bucket(bucket, bounds, fields=None):
+    """
+    :param bounds: None or (low, high, ordered) to trim the bucket to
+    :param fields: only these fields, all by default
+    :return: list of records sorted by timestamp
+    """
+    records = read_bucket(bucket, bounds, fields)
+    records.sort(key=itemgetter(0))
+    return records
+
+
+def bucket_arrays(bucket, bounds, fields=None):
+    """
+    :param bounds: None or (low, high, ordered) to trim the bucket to
+    :return: timestamps and columns
+    :rtype: (numpy.ndarray, dict)
+    """
+    timestamps, columns = bucket.arrays(fields=fields)
+    if bounds is not None:
+        timestamps, columns = trim_arrays(timestamps, columns, *bounds)
+    return timestamps, columns
+
+
+def record_key(tstamp, data):
+    """
+    Comparable form of a record independent of number formatting
+    """
+    try:
+        return tstamp, tuple(sorted(record_to_data(data).items()))
+    except (ValueError, IndexError):
+        return tstamp, data
+
+
+def file_chunks(path, size):
+    """
+    Bytes of the file in pieces of size bytes
+    :return: Generator of bytes
+    """
+    with open(path, 'rb') as fp:
+        for chunk in iter(partial(fp.read, size), b''):
+            yield chunk
+
+
+def gzip_chunks(pieces):
+    """
+    Compress text pieces into one gzip member
+    :return: Generator of bytes
+    """
+    stream = compression.GzipStream()
+    for piece in pieces:
+        compressed = stream.write(piece)
+        if compressed:
+            yield compressed
+    yield stream.finish()
+
+
+def chunks(records, size):
+    """
+    Text of the records in pieces of at least size characters
+    :param records: iterable of (timestamp, data)
+    :return: Generator of str
+    """
+    return join_lines(('{} {}\n'.format(timestamp, data) for timestamp, data in records), size)
+
+
+def join_lines(lines, size):
+    """
+    Join lines into pieces of at least size characters
+    :return: Generator of str
+    """
+    pending = []
+    length = 0
+    for line in lines:
+        pending.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(pending)
+            pending, length = [], 0
+    if pending:
+        yield ''.join(pending)
+
+
 class Store(StoreBase):
 
-    def __init__(self, directory=None, **kwargs):
+    def __init__(self, directory=None, writer=None, bucket_class=None, manifest=False, auto_seal=False,
+                 dedupe=False, rollups=(), wal=None, apply_interval=APPLY_INTERVAL, compression=None,
+                 compress_after=COMPRESS_AFTER, compress_interval=None, cache=None, prefetch=0, retention=None,
+                 retention_interval=None, stats_interval=None, **kwargs):
+        """
+        :param directory: root of the store, defaults to temp directory
+        :param writer: keep bucket files open and buffer appends
+        :type writer: notmany.store.writer.Writer | None
+        :param bucket_class: bucket format, text Bucket by default
+        :type bucket_class: type | None
+        :param manifest: keep per series manifest of existing buckets so
+            interval queries touch only those, assumes this store is the
+            only writer of the directory
+        :type manifest: bool
+        :param auto_seal: seal the previous bucket of a series once records
+            for a later bucket arrive and its time window has passed
+        :type auto_seal: bool
+        :param dedupe: keep only the last record of a timestamp when sealing
+        :type dedupe: bool
+        :param rollups: resolutions in seconds of min/max/sum/count rollups
+            maintained for every series, e.g. (60, 600, 3600)
+        :type rollups: tuple
+        :param wal: records are committed to the log and applied to bucket
+            files in background, records left in the log are replayed
+        :type wal: notmany.store.wal.WriteAheadLog | None
+        :param apply_interval: seconds between background applies of the log
+        :param compression: codec of old buckets, zlib or lzma
+        :type compression: str | None
+        :param compress_after: seconds after the end of a bucket when it
+            gets sealed and compressed
+        :param compress_interval: seconds between background compressions
+            of all series, compress is only called explicitly when None
+        :param cache: keep parsed contents of read buckets in memory
+        :type cache: notmany.store.cache.BucketCache | None
+        :param prefetch: buckets read and parsed ahead on a thread pool by
+            retrieve and retrieve_arrays, 0 reads them one after another
+        :param retention: Retention of every series or dictionary of series
+            name to Retention where the None key applies to other series
+        :type retention: notmany.store.retention.Retention | dict | None
+        :param retention_interval: seconds between background expiry of
+            buckets past retention and reclaim of tombstones, expire and
+            reclaim are only called explicitly when None
+        :param stats_interval: seconds between recording stats of the store
+            into its own series prefixed notmany., needs stats
+        """
         StoreBase.__init__(self, **kwargs)
         self.directory = directory
+        self.writer = writer
+        self.bucket_class = bucket_class or Bucket
+        self.cache = cache
+        self.prefetch = prefetch
+        self._executor = ThreadPoolExecutor(max_workers=prefetch) if prefetch > 0 else None
+        self.manifest = manifest
+        self._manifests = {}
+        # names of series whose manifest got new buckets since it was saved
+        self._grown = set()
+        self.auto_seal = auto_seal
+        self.dedupe = dedupe
+        self._last_starts = {}
+        self.rollups = tuple(sorted(rollups))
+        self._rollups = {}
+        for resolution in self.rollups:
+            if SEC_IN_DAY % resolution:
+                raise ValueError('Rollup resolution has to divide a day')
         self.set_up(directory)
+        self.tombstones = Tombstones(self.directory)
+        self._reclaim_lock = threading.Lock()
+        self.retention = retention if isinstance(retention, dict) else {None: retention}
+
+        if compression is not None:
+            check_codec(compression)
+        self.compression = compression
+        self.compress_after = compress_after
+
+        self.wal = wal
+        # held by writes, log apply and bucket maintenance, buckets,
+        # manifests and rollup states are not safe to change concurrently
+        self._apply_lock = threading.RLock()
+        self._touched = set()
+        # (name, start) -> Bucket
+        self._write_buckets = OrderedDict()
+        self._stopped = threading.Event()
+        self._threads = []
+        if wal is not None:
+            self._replay(wal.replay())
+            self.checkpoint()
+            self._threads.append(run_periodically(apply_interval, self._drain, self._stopped))
+        if compression is not None and compress_interval is not None:
+            self._threads.append(run_periodically(compress_interval, self.compress_all, self._stopped))
+        if retention_interval is not None:
+            self._threads.append(run_periodically(retention_interval, self.apply_retention, self._stopped))
+        if self.stats is not None and stats_interval is not None:
+            self._threads.append(run_periodically(stats_interval, self.record_stats, self._stopped))
 
     def set_up(self, directory):
         if directory is None:
             directory = path_join(gettempdir(), DEFAULT_DIR_NAME)
         self.directory = directory
-        if not path_exists(directory):
-            try:
-                os.makedirs(directory)
-            except OSError as exc:
-                raise StoreSetupError(str(exc))
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as exc:
+            raise StoreSetupError(str(exc))
 
     def _create_bucket(self, name, start):
-        return Bucket(name=name, start=start, length=self.bucket_size, base=self.directory)
+        return self.bucket_class(name=name, start=start, length=self.bucket_size,
+                                 base=self.directory, writer=self.writer, cache=self.cache, stats=self.stats)
 
-    def get_all(self, name):
+    def _record_tstamps(self, name, records):
+        if self.wal is None:
+            with self._apply_lock:
+                StoreBase._record_tstamps(self, name, records)
+                self._save_grown()
+            return
+        self.wal.append([(name, tstamp, data) for tstamp, data in records])
+
+    def record_many_series(self, records):
+        if self.wal is None:
+            return StoreBase.record_many_series(self, records)
+        if self.stats is None:
+            self.wal.append([(name, get_tstamp(timestamp), data) for name, timestamp, data in records])
+            return
+        start = perf_counter()
+        records = [(name, get_tstamp(timestamp), data) for name, timestamp, data in records]
+        self.wal.append(records)
+        self.stats.observe('record_many_series', perf_counter() - start)
+        self.stats.incr('record.points', len(records))
+
+    def _write_bucket(self, name, start):
+        if self.manifest:
+            # loaded or rebuilt before the write, a rebuild afterwards
+            # would count the records again in _appended
+            self.get_manifest(name)
+        key = (name, start)
+        bucket = self._write_buckets.get(key)
+        if bucket is None:
+            bucket = self._write_buckets[key] = StoreBase._write_bucket(self, name, start)
+            if len(self._write_buckets) > WRITE_BUCKETS:
+                self._write_buckets.popitem(last=False)
+        if len(self.tombstones) and self._buried(bucket):
+            self._exhume(bucket)
+        if self.wal is not None:
+            self._touched.add(bucket.full_path)
+        return bucket
+
+    def _apply(self, records):
         """
-        List directory and create buckets form files ?
-        :param name:
-        :return:
+        Write log records to buckets
+        :param records: list of (name, naive timestamp, data)
+        """
+        series = {}
+        for name, tstamp, data in records:
+            try:
+                series[name].append((tstamp, data))
+            except KeyError:
+                series[name] = [(tstamp, data)]
+        with self._apply_lock:
+            for name, points in series.items():
+                StoreBase._record_tstamps(self, name, points)
+            self._save_grown()
+
+    def _replay(self, records):
+        """
+        Apply records left in the log, records already written to their
+        bucket before the crash are skipped
+        :param records: list of (name, naive timestamp, data)
+        """
+        existing = {}
+        fresh = []
+        for name, tstamp, data in records:
+            key = name, bucket_start(tstamp, self.bucket_size)
+            written = existing.get(key)
+            if written is None:
+                bucket = self._create_bucket(name=name, start=EPOCH + timedelta(seconds=key[1]))
+                written = existing[key] = set([record_key(*record) for record in bucket.read()])
+            if record_key(tstamp, data) not in written:
+                fresh.append((name, tstamp, data))
+        self._apply(fresh)
+
+    def _drain(self):
+        """
+        Apply records committed to the log so far, checkpoint once the log
+        grows over its limit
+        """
+        if self.wal is None:
+            return
+        with self._apply_lock:
+            records, _ = self.wal.take()
+            if records:
+                self._apply(records)
+            if self.wal.size >= self.wal.max_size:
+                self.checkpoint()
+
+    def checkpoint(self):
+        """
+        Apply and persist everything in the log to bucket files and drop it
+        from the log
+        """
+        if self.wal is None:
+            return
+        with self._apply_lock:
+            records, offset = self.wal.take()
+            if records:
+                self._apply(records)
+            self._flush()
+            if self.wal.fsync != FSYNC_NEVER:
+                paths = self._touched | set([manifest.path for manifest in self._manifests.values()])
+                for path in paths:
+                    fsync_path(path)
+                for directory in set([os.path.dirname(path) for path in paths]):
+                    fsync_path(directory)
+            self._touched = set()
+            self.wal.truncate(offset)
+
+    def _series_dir(self, name):
+        return path_join(self.directory, name, str(self.bucket_size))
+
+    def get_manifest(self, name):
+        """
+        Manifest of the series, loaded or rebuilt from the directory tree
+        on first use
+        :rtype: Manifest
+        """
+        manifest = self._manifests.get(name)
+        if manifest is not None:
+            return manifest
+        with self._apply_lock:
+            manifest = self._manifests.get(name)
+            if manifest is None:
+                manifest = Manifest(self._series_dir(name))
+                if not manifest.load():
+                    manifest.rebuild(self.get_all(name))
+                self._manifests[name] = manifest
+        return manifest
+
+    def rebuild_manifest(self, name):
+        """
+        Recreate manifest of the series from the directory tree
+        :rtype: Manifest
+        """
+        with self._apply_lock:
+            self.flush()
+            manifest = self._manifests[name] = Manifest(self._series_dir(name))
+            manifest.rebuild(self.get_all(name))
+            manifest.save()
+        return manifest
+
+    def _save_grown(self):
+        """
+        Save manifests that got new buckets right away, buckets missing in
+        a manifest stay invisible to interval queries after a crash
         """
-        # for file in os walk yield bucket from file
-        return []
+        while self._grown:
+            name = self._grown.pop()
+            manifest = self._manifests.get(name)
+            if manifest is not None:
+                manifest.save()
+
+    def _appended(self, name, records):
+        start = bucket_start(records[0][0], self.bucket_size)
+        if self.manifest and self.get_manifest(name).update(start, [record[0] for record in records]):
+            self._grown.add(name)
+
+        if self.auto_seal:
+            last = self._last_starts.get(name)
+            if last is None or start > last:
+                self._last_starts[name] = start
+                if last is not None:
+                    bucket = self._create_bucket(name=name, start=EPOCH + timedelta(seconds=last))
+                    if bucket.closed:
+                        self._seal(name, bucket)
+
+        if self.rollups:
+            self._roll_up(name, records)
 
-    def forget(self, name, interval=None):
+    def _roll_up(self, name, records):
+        for tstamp, data in records:
+            try:
+                values = record_to_data(data)
+            except (ValueError, IndexError):
+                continue
+            for resolution in self.rollups:
+                state = self._rollups.get((name, resolution))
+                if state is None:
+                    state = self._rollups[name, resolution] = rollup.Rollup(resolution)
+                for slot, fields in state.add(tstamp, values):
+                    self._write_rollup(name, resolution, slot, fields)
+
+    def _write_rollup(self, name, resolution, slot, fields):
+        bucket = RollupBucket(name=name, start=EPOCH + timedelta(seconds=slot - slot % SEC_IN_DAY),
+                              resolution=resolution, base=self.directory, writer=self.writer)
+        if len(self.tombstones) and self._buried(bucket):
+            self._exhume(bucket)
+        bucket.append(slot, rollup.encode(fields))
+        if self.wal is not None:
+            self._touched.add(bucket.full_path)
+
+    def retrieve_rollup(self, name, resolution, interval=None):
         """
-        Will delete all day directories touched by the interval so be
-        # TODO we should delte only buckets in interval if the
-        # days in the interval are the same os we would not delte all day
-        # heen just the individual buckets
+        Retrieve rollup of the series, partial rows of a slot are merged
         :param name:
+        :param resolution: one of the store rollups
+        :param interval:
+        :type interval: Interval | None
+        :return: Generator of (slot, {field: [min, max, sum, count]}) in slot order
+        """
+        if resolution not in self.rollups:
+            raise ValueError('Store has no rollup of resolution {}'.format(resolution))
+
+        self._drain()
+        directory = path_join(self.directory, name, rollup.ROLLUP_DIR.format(resolution))
+        if interval is None:
+            low, high = float('-inf'), float('inf')
+            days = [datetime.strptime(day, '%Y_%m_%d') for day in sorted(scan_names(directory, dirs=True))
+                    ] if path_exists(directory) else []
+        else:
+            low, high = naive_tstamp(interval.start), naive_tstamp(interval.end)
+            first = int(low - low % SEC_IN_DAY)
+            days = [EPOCH + timedelta(seconds=day) for day in range(first, int(high) + 1, SEC_IN_DAY)]
+
+        state = self._rollups.get((name, resolution))
+        if interval is None and state is not None and state.slot is not None:
+            # the day of the slot in progress may have nothing written yet
+            current = EPOCH + timedelta(seconds=state.slot - state.slot % SEC_IN_DAY)
+            if current not in days:
+                days = sorted(days + [current])
+        for day in days:
+            slots = {}
+            bucket = RollupBucket(name=name, start=day, resolution=resolution, base=self.directory,
+                                  writer=self.writer)
+            if len(self.tombstones) and self._buried(bucket):
+                continue
+            for slot, data in bucket.read():
+                if low <= slot <= high:
+                    rollup.merge_rows(slots.setdefault(slot, {}), rollup.decode(data))
+            # current slot is not written yet
+            if state is not None and state.slot is not None and low <= state.slot <= high and \
+                    state.slot - state.slot % SEC_IN_DAY == naive_tstamp(day):
+                rollup.merge_rows(slots.setdefault(state.slot, {}), state.fields)
+            for slot in sorted(slots):
+                yield int(slot), slots[slot]
+
+    def rollup_resolution(self, interval, step, whole=True):
+        """
+        Coarsest rollup whose slots tile the interval and are not longer
+        than step
         :param interval:
         :type interval: Interval
+        :param step: seconds
+        :param whole: every step has to be made of whole slots
+        :return: resolution or None when no rollup fits
+        :rtype: int | None
+        """
+        low, high = naive_tstamp(interval.start), naive_tstamp(interval.end)
+        for resolution in reversed(self.rollups):
+            if resolution > step or low % resolution or high % resolution:
+                continue
+            if not whole or step % resolution == 0:
+                return resolution
+        return None
+
+    def rollup_rows(self, name, resolution, interval, fields=None):
+        """
+        Rollup rows covering the interval, the slot at the interval end
+        reaches past it so the points right at the end are summarized from
+        raw records instead
+        :param name:
+        :param resolution: one of the store rollups
+        :param interval: aligned to the resolution
+        :type interval: Interval
+        :param fields: only these fields, all by default
+        :return: list of (slot, {field: [min, max, sum, count]}) in slot order
+        """
+        high = naive_tstamp(interval.end)
+        rows = []
+        for slot, summaries in self.retrieve_rollup(name, resolution, interval):
+            if slot >= high:
+                break
+            if fields is not None:
+                summaries = dict((field, summary) for field, summary in summaries.items() if field in fields)
+            if summaries:
+                rows.append((slot, summaries))
+
+        last = {}
+        for _, data in self.retrieve(name, Interval(start=interval.end, end=interval.end), fields):
+            try:
+                rollup.merge_values(last, record_to_data(data))
+            except (ValueError, IndexError):
+                continue
+        if last:
+            rows.append((high, last))
+        return rows
+
+    def compact(self, name, before=None):
+        """
+        Seal buckets of the series whose time window ended before given time
+        :param name:
+        :param before: defaults to now, later times are taken as now
+        :return: number of buckets sealed
+        :rtype: int
+        """
+        # buckets still open would keep their .sealed marker when appended to
+        now = datetime.now()
+        before = now if before is None else min(get_datetime(before), now)
+        count = 0
+        with self._apply_lock:
+            for bucket in self.get_all(name):
+                if bucket.end > before:
+                    break
+                if not bucket.sealed:
+                    self._seal(name, bucket)
+                    count += 1
+        return count
+
+    def compress(self, name, before=None):
+        """
+        Seal and compress buckets of the series that ended compress_after
+        seconds before given time
+        :param name:
+        :param before: defaults to now, later times are taken as now
+        :return: number of buckets compressed
+        :rtype: int
+        """
+        if self.compression is None:
+            raise ValueError('Store has no compression codec')
+        now = datetime.now()
+        before = now if before is None else min(get_datetime(before), now)
+        before -= timedelta(seconds=self.compress_after)
+        count = 0
+        with self._apply_lock:
+            for bucket in self.get_all(name):
+                if bucket.end > before:
+                    break
+                if not bucket.sealed:
+                    self._seal(name, bucket)
+                self._write_buckets.pop((name, int(naive_tstamp(bucket.start))), None)
+                if bucket.compress(self.compression):
+                    count += 1
+        return count
+
+    def compress_all(self):
+        """
+        Compress old buckets of every series
+        :return: number of buckets compressed
+        :rtype: int
+        """
+        return sum([self.compress(name) for name in self.names()])
+
+    def names(self):
+        """
+        Names of series stored with the bucket size of this store
+        :rtype: list
+        """
+        return sorted([name for name in scan_names(self.directory, dirs=True)
+                       if path_exists(self._series_dir(name)) and not self._tombstoned(self._series_dir(name))])
+
+    def _seal(self, name, bucket):
+        self._write_buckets.pop((name, int(naive_tstamp(bucket.start))), None)
+        timestamps = bucket.seal(dedupe=self.dedupe)
+        if self.manifest:
+            self.get_manifest(name).replace(int(naive_tstamp(bucket.start)), timestamps)
+
+    def _interval_buckets(self, name, interval):
+        if not self.manifest:
+            buckets = StoreBase._interval_buckets(self, name=name, interval=interval)
+        else:
+            low = bucket_start(naive_tstamp(interval.start), self.bucket_size)
+            buckets = (self._create_bucket(name=name, start=EPOCH + timedelta(seconds=start))
+                       for start in self.get_manifest(name).starts(low, naive_tstamp(interval.end)))
+        for bucket in buckets:
+            if not len(self.tombstones) or not self._buried(bucket):
+                yield bucket
+
+    def flush(self):
+        with self._apply_lock:
+            self._drain()
+            self._flush()
+
+    def _flush(self, final=False):
+        """
+        :param final: write rollup slots still in progress too, otherwise
+            only slots whose period ended are written
+        """
+        now = get_tstamp(datetime.now())
+        for (name, resolution), state in self._rollups.items():
+            if state.slot is not None and (final or state.slot + resolution <= now):
+                self._write_rollup(name, resolution, *state.pop())
+        if self.writer is not None:
+            self.writer.flush()
+        for manifest in self._manifests.values():
+            if manifest.dirty:
+                manifest.save()
+
+    def close(self):
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        with self._apply_lock:
+            self._drain()
+            self._flush(final=True)
+        if self.wal is not None:
+            self.checkpoint()
+            self.wal.close()
+        if self.writer is not None:
+            self.writer.close()
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def get_all(self, name):
+        """
+        All buckets of the series in chronological order, the tree is
+        scanned one day directory at a time
+        :param name:
+        :return: Generator of Bucket
+        """
+        self.flush()
+        base = self._series_dir(name)
+        if not path_exists(base) or self._tombstoned(base):
+            return
+
+        for day_dir, day in scan_days(base):
+            if self._tombstoned(day_dir):
+                continue
+            for file_name, start in scan_buckets(day_dir, day):
+                if not self._tombstoned(path_join(day_dir, file_name)):
+                    yield self._create_bucket(name=name, start=start)
+
+    def forget(self, name, interval=None, lazy=False):
+        """
+        Delete buckets touched by the interval, whole day directories when
+        the interval covers the day, rollup rows of slots overlapping the
+        deleted buckets are recomputed from the records left
+        :param name:
+        :param interval: everything of the series when None
+        :type interval: Interval | None
+        :param lazy: only tombstone the buckets, readers skip them at once
+            and reclaim deletes them later
         :return: None
         """
-        buckets = self._get_buckets(name=name, interval=interval)
+        with self._apply_lock:
+            self.flush()
+            if interval is None:
+                directories = [self._series_dir(name)] + [
+                    path_join(self.directory, name, rollup.ROLLUP_DIR.format(resolution))
+                    for resolution in self.rollups]
+                covered = [(directory, float('-inf'), float('inf')) for directory in directories
+                           if path_exists(directory) and not self._tombstoned(directory)]
+                for resolution in self.rollups:
+                    self._rollups.pop((name, resolution), None)
+                self._bury(name, covered, lazy)
+                return
 
-        for directory in set([bucket.dir for bucket in buckets]):
-            if os.path.exists(directory):
-                shutil.rmtree(directory)
+            low = bucket_start(naive_tstamp(interval.start), self.bucket_size)
+            high = bucket_start(naive_tstamp(interval.end), self.bucket_size) + self.bucket_size
+            covered = self._covered(self._series_dir(name), self.bucket_size, low, high)
+            self._bury(name, covered, lazy)
+            if covered:
+                self._recompute_rollups(name, low, high)
 
-        parents = [
-            path_join(self.directory, name, str(self.bucket_size)),
-            path_join(self.directory, name)
-        ]
+    def _recompute_rollups(self, name, low, high):
+        """
+        Rewrite rollup rows of slots overlapping [low, high) where records
+        were deleted, rows are rebuilt from records left around the range
+        """
+        for resolution in self.rollups:
+            first, last = low - low % resolution, high + (-high % resolution)
+            state = self._rollups.pop((name, resolution), None)
+            if state is not None and state.slot is not None and not first <= state.slot < last:
+                self._write_rollup(name, resolution, *state.pop())
+
+            rows = {}
+            for tstamp, data in self._records_between(name, first, low) + self._records_between(name, high, last):
+                try:
+                    values = record_to_data(data)
+                except (ValueError, IndexError):
+                    continue
+                rollup.merge_values(rows.setdefault(int(tstamp - tstamp % resolution), {}), values)
 
-        for directory in parents:
+            directory = path_join(self.directory, name, rollup.ROLLUP_DIR.format(resolution))
+            if not path_exists(directory) or self._tombstoned(directory):
+                continue
+            for day_dir, day in scan_days(directory):
+                start = naive_tstamp(day)
+                if start + SEC_IN_DAY <= first or start >= last or self._tombstoned(day_dir):
+                    continue
+                bucket = RollupBucket(name=name, start=day, resolution=resolution, base=self.directory,
+                                      writer=self.writer)
+                kept = [(int(slot), data) for slot, data in bucket.read() if not first <= slot < last]
+                kept += [(slot, rollup.encode(fields)) for slot, fields in rows.items()
+                         if start <= slot < start + SEC_IN_DAY]
+                bucket._release()
+                if kept:
+                    bucket._replace(''.join(['{} {}\n'.format(slot, data) for slot, data in sorted(kept)]))
+                else:
+                    self._remove([bucket.full_path])
+
+    def _records_between(self, name, low, high):
+        """
+        :return: records of the series with low <= timestamp < high
+        :rtype: list
+        """
+        if low >= high:
+            return []
+        interval = Interval(start=EPOCH + timedelta(seconds=low), end=EPOCH + timedelta(seconds=high))
+        return [(tstamp, data) for tstamp, data in self._retrieve(name, interval, None) if low <= tstamp < high]
+
+    def _covered(self, base, length, low, high):
+        """
+        Day directories and buckets of a series directory entirely inside
+        [low, high), days are listed as a whole when they are covered
+        :param base: series or rollup directory
+        :param length: bucket length in seconds
+        :return: list of (path, start, end)
+        """
+        covered = []
+        if not path_exists(base) or self._tombstoned(base):
+            return covered
+        for day_dir, day in scan_days(base):
+            start = naive_tstamp(day)
+            if start + SEC_IN_DAY <= low or start >= high or self._tombstoned(day_dir):
+                continue
+            if low <= start and start + SEC_IN_DAY <= high:
+                covered.append((day_dir, start, start + SEC_IN_DAY))
+                continue
+            for file_name, bucket_start_dt in scan_buckets(day_dir, day):
+                start = naive_tstamp(bucket_start_dt)
+                path = path_join(day_dir, file_name)
+                if low <= start and start + length <= high and not self._tombstoned(path):
+                    covered.append((path, start, start + length))
+        return covered
+
+    def _bury(self, name, covered, lazy):
+        """
+        Delete or tombstone covered paths of the series
+        :param covered: list of (path, start, end)
+        """
+        if not covered:
+            return
+        series_dir = self._series_dir(name)
+        if self.manifest:
+            if series_dir in [path for path, _, _ in covered]:
+                self._manifests.pop(name, None)
+            else:
+                manifest = self.get_manifest(name)
+                for path, start, end in covered:
+                    if path.startswith(series_dir + os.sep):
+                        manifest.remove(start, end)
+                manifest.save()
+
+        paths = [path for path, _, _ in covered]
+        if lazy:
+            self.tombstones.add(paths)
+        else:
+            self._remove(paths)
+
+    def _tombstoned(self, *paths):
+        return len(self.tombstones) > 0 and self.tombstones.covers(*paths)
+
+    def _buried(self, bucket):
+        """
+        :return: True when the bucket, its day or its series is tombstoned
+        :rtype: bool
+        """
+        return self.tombstones.covers(bucket.full_path, bucket.dir, os.path.dirname(bucket.dir))
+
+    def _exhume(self, bucket):
+        """
+        Reclaim tombstones covering the bucket before it gets written to
+        """
+        with self._reclaim_lock:
+            series_dir = os.path.dirname(bucket.dir)
+            paths = [path for path in (bucket.full_path, bucket.dir, series_dir) if path in self.tombstones]
+            self._remove(paths)
+            self.tombstones.discard(paths)
+            if series_dir in paths:
+                self._manifests.pop(bucket.name, None)
+
+    def _remove(self, paths):
+        """
+        Delete bucket files or directories and parents left empty
+        """
+        for path in paths:
+            if self.writer is not None:
+                self.writer.discard(path)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                for suffix in ('', SEALED_SUFFIX) + compression.SUFFIXES:
+                    try:
+                        os.remove(path + suffix)
+                    except OSError as exc:
+                        if exc.errno != errno.ENOENT:
+                            raise exc
+            self._prune(os.path.dirname(path))
+
+    def _prune(self, directory):
+        while directory.startswith(self.directory.rstrip(os.sep) + os.sep):
             try:
                 os.rmdir(directory)
             except OSError as exc:
-                if exc.errno != errno.ENOTEMPTY:
+                if exc.errno not in (errno.ENOTEMPTY, errno.EEXIST, errno.ENOENT):
                     raise exc
                 return
+            directory = os.path.dirname(directory)
+
+    def reclaim(self, limit=None):
+        """
+        Delete tombstoned buckets
+        :param limit: most tombstones reclaimed, all by default
+        :return: number of reclaimed tombstones
+        :rtype: int
+        """
+        with self._reclaim_lock:
+            paths = self.tombstones.take(limit)
+            self._remove(paths)
+            self.tombstones.discard(paths)
+        return len(paths)
+
+    def retention_of(self, name):
+        """
+        :rtype: notmany.store.retention.Retention | None
+        """
+        return self.retention.get(name, self.retention.get(None))
+
+    def expire(self, now=None):
+        """
+        Tombstone buckets and rollup days that ended longer ago than the
+        retention of their series
+        :param now: defaults to now
+        :return: number of tombstoned paths
+        :rtype: int
+        """
+        now = get_tstamp(datetime.now() if now is None else now)
+        count = 0
+        for name in self.names():
+            retention = self.retention_of(name)
+            if retention is None:
+                continue
+            covered = []
+            if retention.raw is not None:
+                covered += self._covered(self._series_dir(name), self.bucket_size, float('-inf'), now - retention.raw)
+            for resolution, keep in retention.rollups.items():
+                directory = path_join(self.directory, name, rollup.ROLLUP_DIR.format(resolution))
+                covered += self._covered(directory, SEC_IN_DAY, float('-inf'), now - keep)
+            with self._apply_lock:
+                self._bury(name, covered, lazy=True)
+            count += len(covered)
+        return count
+
+    def record_stats(self):
+        """
+        Record counters and latency since the previous call into series
+        of this store
+        """
+        self.record_many_series(self.stats.points(get_tstamp(datetime.now())))
+
+    def apply_retention(self):
+        """
+        Expire buckets past retention and reclaim tombstones in batches
+        """
+        self.expire()
+        while not self._stopped.is_set() and self.reclaim(RECLAIM_BATCH):
+            pass
+
+    def _ranged_buckets(self, name, interval=None):
+        """
+        Buckets of the interval, edge buckets not fully inside the interval
+        come with the range they have to be trimmed to
+        :return: Generator of (bucket, None or (low, high, ordered))
+        """
+        if interval is None:
+            for bucket in self.get_all(name):
+                if self.stats is not None:
+                    self.stats.incr('buckets.touched')
+                yield bucket, None
+            return
+
+        self._drain()
+        low, high = naive_tstamp(interval.start), naive_tstamp(interval.end)
+        for bucket in self._interval_buckets(name=name, interval=interval):
+            if self.stats is not None:
+                self.stats.incr('buckets.touched')
+            start = naive_tstamp(bucket.start)
+            if low <= start and start + bucket.length <= high:
+                yield bucket, None
+            else:
+                yield bucket, (low, high, self._ordered(name, bucket))
+
+    def _ordered(self, name, bucket):
+        """
+        :return: True when records of the bucket are known to be sorted
+        :rtype: bool
+        """
+        if self.manifest and self.get_manifest(name).ordered(int(naive_tstamp(bucket.start))):
+            return True
+        return bucket.sealed
+
+    def _read_ahead(self, name, interval, load):
+        """
+        :param load: function of bucket and bounds
+        :return: Generator of load results in bucket order
+        """
+        buckets = self._ranged_buckets(name=name, interval=interval)
+        if self._executor is None:
+            return (load(bucket, bounds) for bucket, bounds in buckets)
+        return prefetched(buckets, lambda item: load(*item), self.prefetch, self._executor)
+
+    def retrieve(self, name, interval=None, fields=None):
+        records = self._retrieve(name, interval, fields)
+        if self.stats is None:
+            return records
+        return self.stats.timed('retrieve', records, 'retrieve.records')
+
+    def _retrieve(self, name, interval, fields):
+        if self._executor is None:
+            for bucket, bounds in self._ranged_buckets(name=name, interval=interval):
+                for item in bucket_records(bucket, bounds, fields):
+                    yield item
+            return
 
-    def retrieve(self, name, interval=None):
-        for bucket in self._get_buckets(name=name, interval=interval):
-            for item in bucket:
+        for records in self._read_ahead(name, interval, partial(read_bucket, fields=fields)):
+            for item in records:
                 yield item
 
-    def retrieve_raw(self, name, interval=None):
-        for bucket in self._get_buckets(name=name, interval=interval):
-            for item in bucket.raw():
+    def retrieve_many(self, names, interval=None, wide=False, fields=None):
+        """
+        Retrieve many series as one stream ordered by timestamp, the series
+        are read concurrently with at least one bucket read ahead each
+        :param names: series names
+        :param interval:
+        :type interval: Interval | None
+        :param wide: one row per timestamp with data of every series
+        :param fields: only these fields, all by default
+        :return: Generator of (name, timestamp, data) or with wide of
+            (timestamp, [data or None for every name])
+        """
+        executor = self._executor
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=max(min(len(names), MANY_WORKERS), 1))
+        streams = [prefetched(self._ranged_buckets(name=name, interval=interval),
+                              lambda item: sorted_bucket(*item, fields=fields), max(self.prefetch, 1), executor)
+                   for name in names]
+        try:
+            for item in merge_series(names, streams, wide):
                 yield item
+        finally:
+            for stream in streams:
+                stream.close()
+            if executor is not self._executor:
+                executor.shutdown(wait=False)
+
+    def retrieve_arrays(self, name, interval=None, fields=None):
+        """
+        Retrieve data as columns, one item per non empty bucket, closed
+        columnar buckets are memory mapped and not copied
+        :param name:
+        :param interval:
+        :param fields: only these fields, all by default
+        :return: Generator of (timestamps, {field: column}) numpy arrays
+        """
+        for timestamps, columns in self._read_ahead(name, interval, partial(bucket_arrays, fields=fields)):
+            if len(timestamps):
+                yield timestamps, columns
+
+    def aggregate(self, name, interval, step, funcs=('avg', 'min', 'max'), fields=None):
+        """
+        Aggregate values of the series in steps of the interval
+        :param name:
+        :param interval:
+        :type interval: Interval
+        :param step: step length in seconds
+        :param funcs: min, max, sum, count, avg or percentile like p95
+        :param fields: only these fields, all by default
+        :return: {'timestamps': step starts, 'fields': {field: {func: values}}}
+        :rtype: dict
+        """
+        check_funcs(funcs)
+
+        # steps made of whole rollup slots are summed up from them unless a
+        # percentile needs the raw values
+        if step > 0 and all(func in FUNCS for func in funcs):
+            resolution = self.rollup_resolution(interval, step)
+            if resolution is not None:
+                rows = self.rollup_rows(name, resolution, interval, fields)
+                return aggregate_rollup(rows, start=naive_tstamp(interval.start), step=step, funcs=funcs)
+
+        parts = self.retrieve_arrays(name=name, interval=interval, fields=fields)
+        return aggregate(*concatenate(parts), start=naive_tstamp(interval.start), step=step, funcs=funcs)
+
+    def retrieve_raw(self, name, interval=None, fields=None):
+        """
+        Content of buckets as stored, lines are rebuilt from projected
+        records when fields are given
+        :param fields: only these fields, all by default
+        :return: Generator of str
+        """
+        pieces = self._retrieve_raw(name, interval, fields)
+        if self.stats is None:
+            return pieces
+        return self.stats.timed('retrieve_raw', pieces, 'retrieve_raw.bytes', size=len)
+
+    def _retrieve_raw(self, name, interval, fields):
+        if fields is not None:
+            for chunk in chunks(self._retrieve(name, interval, fields), CHUNK_SIZE):
+                yield chunk
+            return
+
+        for bucket, bounds in self._ranged_buckets(name=name, interval=interval):
+            pieces = bucket.raw() if bounds is None else bucket.raw_range(*bounds)
+            for item in pieces:
+                yield item
+
+    def retrieve_gzip(self, name, interval=None, fields=None):
+        """
+        Raw content as a single gzip member, tornado's HTTP client and
+        other decoders stop after the first member of a concatenated
+        stream. A bucket stored compressed with zlib is sent as stored only
+        when it is the whole response
+        :param fields: only these fields, all by default
+        :return: Generator of bytes
+        """
+        if fields is not None:
+            for chunk in gzip_chunks(self.retrieve_raw(name=name, interval=interval, fields=fields)):
+                yield chunk
+            return
+
+        buckets = self._ranged_buckets(name=name, interval=interval)
+        head = list(islice(buckets, 2))
+        if len(head) == 1 and head[0][1] is None:
+            stored = head[0][0].stored_gzip
+            if stored is not None:
+                for chunk in file_chunks(stored, CHUNK_SIZE):
+                    yield chunk
+                return
+
+        pieces = (piece for bucket, bounds in chain(head, buckets)
+                  for piece in (bucket.raw() if bounds is None else bucket.raw_range(*bounds)))
+        for chunk in gzip_chunks(pieces):
+            yield chunk
 
 
 class Bucket(BucketBase):
-    __slots__ = ['dir', 'file_name']
+    __slots__ = ['dir', 'file_name', 'full_path', 'writer', 'cache', 'stats', 'writable']
 
-    def __init__(self, name, start, length, base):
+    def __init__(self, name, start, length, base, writer=None, cache=None, stats=None):
         BucketBase.__init__(self, name=name, start=start, length=length)
+        self.writer = writer
+        self.cache = cache
+        self.stats = stats
+        # known to be neither sealed nor compressed, set by the first write
+        self.writable = False
         self.file_name = self.start.strftime('%H_%M_%S')
         self.dir = path_join(base, name, str(self.length), self.start.strftime('%Y_%m_%d'))
+        self.full_path = path_join(self.dir, self.file_name)
+
+    @property
+    def sealed_path(self):
+        return self.full_path + SEALED_SUFFIX
 
     @property
-    def full_path(self):
-        return path_join(self.dir, self.file_name)
+    def sealed(self):
+        return path_exists(self.sealed_path)
+
+    @property
+    def compressed_path(self):
+        """
+        Path of the compressed file, only closed buckets get compressed
+        :return: None when the bucket is not compressed
+        """
+        if not self.closed:
+            return None
+        return self._find_compressed()
+
+    def _find_compressed(self):
+        for suffix in compression.SUFFIXES:
+            if path_exists(self.full_path + suffix):
+                return self.full_path + suffix
+        return None
+
+    @property
+    def stored_gzip(self):
+        """
+        Path of the file of a bucket kept only compressed with zlib, its
+        bytes are a gzip member of the raw content
+        :return: None when the bucket is not stored that way
+        """
+        compressed = self.compressed_path
+        if compressed is not None and compressed.endswith(compression.GZIP_SUFFIX) and \
+                not path_exists(self.full_path):
+            return compressed
+        return None
+
+    def _open(self, mode='r'):
+        """
+        Open plain or compressed bucket file for reading
+        :return: None when the bucket does not exist
+        """
+        self._flush()
+        if self.stats is not None:
+            self.stats.incr('buckets.opened')
+        if path_exists(self.full_path):
+            return open(self.full_path, mode)
+        compressed = self.compressed_path
+        if compressed is not None:
+            return compression.open_compressed(compressed, mode + 't' if mode == 'r' else mode)
+        if self.stats is not None:
+            self.stats.incr('buckets.missing')
+        return None
+
+    def _map(self):
+        """
+        Map the plain bucket file, counted like buckets opened by _open
+        :rtype: mmap.mmap | None
+        """
+        mapped = map_file(self.full_path)
+        if mapped is not None and self.stats is not None:
+            self.stats.incr('buckets.opened')
+        return mapped
+
+    def compress(self, codec):
+        """
+        Replace the bucket file with a compressed one, appending to the
+        bucket decompresses it again
+        :param codec: zlib or lzma
+        :return: False when there was nothing to compress
+        :rtype: bool
+        """
+        self._release()
+        if not path_exists(self.full_path):
+            return False
+        compression.compress_file(self.full_path, codec)
+        self.writable = False
+        return True
+
+    def _decompress(self):
+        compressed = self._find_compressed()
+        if compressed is not None:
+            compression.decompress_file(compressed)
+
+    def _prepare_write(self):
+        """
+        Unseal and decompress a closed bucket before the first write, later
+        writes through the same instance skip the file checks
+        """
+        if self.writable:
+            return
+        if self.closed:
+            self._unseal()
+            self._decompress()
+        self.writable = True
 
     def append(self, timestamp, data):
-        if not path_exists(path_join(self.dir)):
-            os.makedirs(self.dir)
-        with open(self.full_path, 'a+') as fp:
-            fp.write('{} {}\n'.format(timestamp, data))
+        self._prepare_write()
+        if self.writer is not None:
+            self.writer.write(self.dir, self.full_path, '{} {}\n'.format(timestamp, data))
+            return
+        self._write('{} {}\n'.format(timestamp, data))
+
+    def extend(self, records):
+        self._prepare_write()
+        content = ''.join(['{} {}\n'.format(timestamp, data) for timestamp, data in records])
+        if self.writer is not None:
+            self.writer.write(self.dir, self.full_path, content)
+            return
+        self._write(content)
+
+    def _write(self, content):
+        try:
+            fp = open(self.full_path, 'a')
+        except OSError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+            os.makedirs(self.dir, exist_ok=True)
+            fp = open(self.full_path, 'a')
+        with fp:
+            fp.write(content)
+
+    def _flush(self):
+        if self.writer is not None:
+            self.writer.flush(self.full_path)
+
+    def _release(self):
+        """
+        Flush and close the pooled handle before the file gets replaced
+        """
+        if self.writer is not None:
+            self.writer.flush(self.full_path)
+            self.writer.discard(self.full_path)
+
+    def _unseal(self):
+        try:
+            os.remove(self.sealed_path)
+        except OSError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+
+    def _mark_sealed(self):
+        open(self.sealed_path, 'w').close()
+        self.writable = False
+
+    def _replace(self, content, mode='w'):
+        tmp_path = self.full_path + '.tmp'
+        with open(tmp_path, mode) as fp:
+            fp.write(content)
+        os.replace(tmp_path, self.full_path)
+
+    def seal(self, dedupe=False):
+        self._release()
+        self._decompress()
+        if not path_exists(self.full_path):
+            return []
+
+        lines = []
+        with open(self.full_path, 'r') as fp:
+            for line in fp:
+                try:
+                    lines.append((float(line[:line.index(' ')]), line))
+                except ValueError as exc:
+                    print('Broken line {} {}'.format(line, exc))
+
+        lines.sort(key=itemgetter(0))
+        if dedupe:
+            lines = [line for line, following in zip(lines, lines[1:] + [(None, None)]) if line[0] != following[0]]
+
+        self._replace(''.join([line for _, line in lines]))
+        self._mark_sealed()
+        return [timestamp for timestamp, _ in lines]
+
+    def _stamp(self):
+        """
+        :return: stamp of the plain or compressed file, None when the
+            bucket does not exist
+        """
+        stamp = file_stamp(self.full_path)
+        if stamp is None:
+            compressed = self.compressed_path
+            if compressed is not None:
+                stamp = file_stamp(compressed)
+        return stamp
+
+    def _cached(self, kind, load, size):
+        """
+        Parsed content from the cache, loaded and cached when the file
+        changed since it was cached
+        :param kind: CACHED_RECORDS or CACHED_ARRAYS
+        :param load: function parsing the bucket
+        :param size: function estimating bytes of the parsed content
+        """
+        self._flush()
+        # stamp is taken before loading so content appended meanwhile
+        # only invalidates the entry
+        stamp = self._stamp()
+        if stamp is None:
+            return load()
+        key = (self.full_path, kind)
+        value = self.cache.get(key, stamp)
+        if value is None:
+            value = load()
+            self.cache.put(key, stamp, value, size(value))
+        return value
 
     def read(self):
-        if path_exists(self.full_path):
-            with open(self.full_path, 'r') as fp:
-                for line in fp:
-                    try:
-                        yield self.line_to_record(line)
-                    except (ValueError, IndexError) as exc:
-                        print('Broken line {} {}'.format(line, exc))
+        if self.cache is None:
+            return self._read()
+        return iter(self._cached(CACHED_RECORDS, lambda: list(self._read()), records_size))
+
+    def _read(self):
+        fp = self._open()
+        if fp is None:
+            return
+        with fp:
+            for line in fp:
+                try:
+                    yield self.line_to_record(line)
+                except (ValueError, IndexError) as exc:
+                    print('Broken line {} {}'.format(line, exc))
 
     def raw(self, size=CHUNK_SIZE):
-        if path_exists(self.full_path):
-            with open(self.full_path, 'r') as fp:
-                for chunk in iter(partial(fp.read, size), ''):
-                    yield chunk
+        fp = self._open()
+        if fp is None:
+            return
+        with fp:
+            for chunk in iter(partial(fp.read, size), ''):
+                yield chunk
+
+    def gzip_raw(self, size=CHUNK_SIZE):
+        """
+        Raw content as one gzip member, a bucket compressed with zlib is
+        sent as it is stored
+        :return: Generator of bytes
+        """
+        stored = self.stored_gzip
+        pieces = file_chunks(stored, size) if stored is not None else gzip_chunks(self.raw(size))
+        for chunk in pieces:
+            yield chunk
+
+    def read_range(self, low, high, ordered=False):
+        if not ordered or self.cache is not None:
+            for record in BucketBase.read_range(self, low, high):
+                yield record
+            return
+
+        for line in self._range_content(low, high).splitlines(True):
+            try:
+                yield self.line_to_record(line)
+            except (ValueError, IndexError) as exc:
+                print('Broken line {} {}'.format(line, exc))
+
+    def raw_range(self, low, high, ordered=False, size=CHUNK_SIZE):
+        """
+        Raw content of records with low <= timestamp <= high
+        :return: Generator of str
+        """
+        if not ordered:
+            for chunk in join_lines(self._lines_in_range(low, high), size):
+                yield chunk
+            return
+
+        content = self._range_content(low, high)
+        for offset in range(0, len(content), size):
+            yield content[offset:offset + size]
+
+    def _lines_in_range(self, low, high, ordered=False):
+        """
+        Lines of records with low <= timestamp <= high, ordered content is
+        not read past high
+        """
+        fp = self._open()
+        if fp is None:
+            return
+        with fp:
+            for line in fp:
+                try:
+                    tstamp = float(line[:line.index(' ')])
+                except ValueError as exc:
+                    print('Broken line {} {}'.format(line, exc))
+                    continue
+                if low <= tstamp <= high:
+                    yield line
+                elif ordered and tstamp > high:
+                    return
+
+    def _range_content(self, low, high):
+        self._flush()
+        mapped = self._map()
+        if mapped is None:
+            # compressed buckets are sealed so streaming stops at high
+            return ''.join(self._lines_in_range(low, high, ordered=True))
+        return mapped[seek_line(mapped, low):seek_line(mapped, high, after=True)].decode('utf-8')
+
+    def view(self):
+        """
+        Whole bucket content without copying it, a compressed bucket gets
+        decompressed into memory
+        :rtype: memoryview
+        """
+        self._flush()
+        mapped = self._map()
+        if mapped is None:
+            fp = self._open('rb')
+            if fp is not None:
+                with fp:
+                    return memoryview(fp.read())
+        return memoryview(mapped if mapped is not None else b'')
+
+    def arrays(self, fields=None):
+        """
+        Parse the bucket into columns, fields missing in a record are NaN,
+        cached columns are read only
+        :param fields: only these fields, all by default
+        :return: timestamps and dictionary of field name to column
+        :rtype: (numpy.ndarray, dict)
+        """
+        if self.cache is None:
+            return self._arrays(fields)
+        timestamps, columns = self._cached(CACHED_ARRAYS, self._cacheable_arrays, arrays_size)
+        if fields is not None:
+            columns = dict((field, column) for field, column in columns.items() if field in fields)
+        return timestamps, columns
+
+    def _cacheable_arrays(self):
+        timestamps, columns = self._arrays()
+        for array in [timestamps] + list(columns.values()):
+            array.flags.writeable = False
+        return timestamps, columns
+
+    def _arrays(self, fields=None):
+        return records_to_arrays(self._read(), fields)
 
     @staticmethod
     def line_to_record(line):
@@ -131,15 +1617,22 @@ class Bucket(BucketBase):
         return float(parts[0]), parts[1]
 
     def delete(self):
+        if self.writer is not None:
+            self.writer.discard(self.full_path)
         if path_exists(self.full_path):
             os.remove(self.full_path)
+        compressed = self.compressed_path
+        if compressed is not None:
+            os.remove(compressed)
+        self._unseal()
 
-    @staticmethod
-    def create(base, file_path):
+    @classmethod
+    def create(cls, base, file_path, writer=None):
         """
         Creates a Bucket instance from its file path
         :param base:
         :param file_path:
+        :param writer:
         :return:
         """
         description = file_path.replace(base, '').lstrip(os.sep)
@@ -147,4 +1640,17 @@ class Bucket(BucketBase):
 
         start = datetime.strptime('{} {}'.format(el[2], el[3]), '%Y_%m_%d %H_%M_%S')
 
-        return Bucket(name=el[0], start=start, length=int(el[1]), base=base)
+        return cls(name=el[0], start=start, length=int(el[1]), base=base, writer=writer)
+
+
+class RollupBucket(Bucket):
+    """
+    One day of rollup rows of a series, stored next to the raw buckets
+    under <name>/rollup_<resolution>/<day>/00_00_00
+    """
+    __slots__ = []
+
+    def __init__(self, name, start, resolution, base, writer=None):
+        Bucket.__init__(self, name=name, start=start, length=SEC_IN_DAY, base=base, writer=writer)
+        self.dir = path_join(base, name, rollup.ROLLUP_DIR.format(resolution), self.start.strftime('%Y_%m_%d'))
+        self.full_path = path_join(self.dir, self.file_name)
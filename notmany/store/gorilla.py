@@ -0,0 +1,442 @@
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy
+
+from .aggregate import concatenate
+from .base import record_to_data
+from .columnar import ColumnarBucket, DTYPE, NAN
+from .file import path_exists
+
+__all__ = [
+    'GorillaBucket',
+]
+
+MAGIC = b'NMG1'
+# points, length of the comma separated field names, bits of the stream
+FRAME = struct.Struct('<HHI')
+MAX_POINTS = 4096
+# width and control bits of delta of delta tiers, anything larger is stored
+# as 64 bits after WIDE_DOD
+DOD_TIERS = ((7, '10'), (9, '110'), (12, '1110'), (32, '11110'))
+WIDE_DOD = '11111'
+MASK64 = (1 << 64) - 1
+DOUBLE = struct.Struct('<d')
+UINT64 = struct.Struct('<Q')
+# encoders of frames still being appended to, keyed by bucket path
+MAX_ENCODERS = 1024
+_encoders = OrderedDict()
+# held while an encoder is taken from _encoders, written and put back and
+# while a bucket with an encoder is read, its last frame is rewritten in place
+_encoders_lock = threading.Lock()
+
+
+class GorillaBucket(ColumnarBucket):
+    """
+    Bucket compressed like Facebook Gorilla, timestamps are stored as delta
+    of delta of microseconds and every field as XOR of the previous value.
+
+    File is a magic followed by frames of at most MAX_POINTS points sharing
+    one set of fields, each frame is a header, field names and a bit stream
+    of points. Appends continue the last frame where the encoder state of
+    recently written buckets is kept in memory, only the frame header and
+    the last partial byte are rewritten. A record with a field unknown to
+    the frame starts a new one.
+    """
+    __slots__ = []
+
+    def extend(self, records):
+        rows = [(int(round(timestamp * 1e6)), data if isinstance(data, dict) else record_to_data(data))
+                for timestamp, data in records]
+        if not rows:
+            return
+
+        if not path_exists(self.dir):
+            os.makedirs(self.dir, exist_ok=True)
+        self._prepare_write()
+
+        path = self.full_path
+        with _encoders_lock:
+            size = os.path.getsize(path) if path_exists(path) else 0
+            encoder = _encoders.pop(path, None)
+            if encoder is not None and encoder.end != size:
+                encoder = None
+
+            with open(path, 'r+b' if size else 'wb') as fp:
+                if not size:
+                    fp.write(MAGIC)
+                    size = len(MAGIC)
+                for tstamp, values in rows:
+                    if encoder is None or encoder.count >= MAX_POINTS or not encoder.accepts(values):
+                        if encoder is not None:
+                            size = encoder.write(fp)
+                        encoder = Encoder(list(values), offset=size)
+                    encoder.add(tstamp, values)
+                encoder.write(fp)
+
+            _encoders[path] = encoder
+            while len(_encoders) > MAX_ENCODERS:
+                _encoders.popitem(last=False)
+
+    def fields(self):
+        """
+        Field names of all frames
+        :return: None when bucket does not exist
+        :rtype: list | None
+        """
+        content = self._content()
+        if content is None:
+            return None
+        fields = []
+        for names, _, _, _ in frames(content):
+            fields.extend([name for name in names if name not in fields])
+        return fields
+
+    def _content(self):
+        with _encoders_lock:
+            content = self._map() if self.closed and self.full_path not in _encoders else None
+            if content is None:
+                fp = self._open('rb')
+                if fp is not None:
+                    with fp:
+                        content = fp.read()
+        return content
+
+    def _arrays(self, fields=None):
+        """
+        Decode the bucket into columns, fields missing in a frame are NaN
+        :param fields: only these fields, all by default
+        :return: timestamps and dictionary of field name to column
+        :rtype: (numpy.ndarray, dict)
+        """
+        content = self._content()
+        if not content:
+            return numpy.empty(0, DTYPE), {}
+        return decode(content, fields)
+
+    def _rewrite(self, fields, timestamps, columns):
+        with _encoders_lock:
+            _encoders.pop(self.full_path, None)
+        timestamps = [int(round(timestamp * 1e6)) for timestamp in timestamps.tolist()]
+        columns = [column.tolist() for column in columns]
+        content = [MAGIC]
+        for first in range(0, len(timestamps), MAX_POINTS):
+            encoder = Encoder(fields, offset=0)
+            for i in range(first, min(first + MAX_POINTS, len(timestamps))):
+                encoder.add(timestamps[i], dict(zip(fields, [column[i] for column in columns])))
+            content.append(encoder.frame())
+        self._replace(b''.join(content), mode='wb')
+
+    def delete(self):
+        with _encoders_lock:
+            _encoders.pop(self.full_path, None)
+        ColumnarBucket.delete(self)
+
+
+class Encoder(object):
+    """
+    State of one frame being encoded
+    """
+    __slots__ = ['fields', 'names', 'offset', 'count', 'written', 'tail', 'pending',
+                 'tstamp', 'delta', 'values', 'leading', 'trailing']
+
+    def __init__(self, fields, offset):
+        """
+        :param fields: field names of the frame
+        :param offset: position of the frame in the file
+        """
+        self.fields = fields
+        self.names = ','.join(fields).encode('utf-8')
+        self.offset = offset
+        self.count = 0
+        # whole bytes of the stream in the file
+        self.written = 0
+        # bits of the last partial byte
+        self.tail = ''
+        self.pending = []
+        self.tstamp = None
+        self.delta = 0
+        self.values = [None] * len(fields)
+        self.leading = [None] * len(fields)
+        self.trailing = [None] * len(fields)
+
+    @property
+    def end(self):
+        """
+        File position after the frame
+        """
+        return self.offset + FRAME.size + len(self.names) + self.written + (1 if self.tail else 0)
+
+    def accepts(self, values):
+        for field in values:
+            if field not in self.fields:
+                return False
+        return True
+
+    def add(self, tstamp, values):
+        """
+        :param tstamp: timestamp in microseconds
+        :param values: field name to value
+        """
+        pending = self.pending
+        if self.tstamp is None:
+            pending.append(format(tstamp & MASK64, '064b'))
+        else:
+            delta = tstamp - self.tstamp
+            pending.append(encode_dod(delta - self.delta))
+            self.delta = delta
+        self.tstamp = tstamp
+
+        for i, field in enumerate(self.fields):
+            bits = float_bits(values.get(field, NAN))
+            previous = self.values[i]
+            if previous is None:
+                pending.append(format(bits, '064b'))
+            else:
+                code, self.leading[i], self.trailing[i] = encode_xor(
+                    bits ^ previous, self.leading[i], self.trailing[i])
+                pending.append(code)
+            self.values[i] = bits
+        self.count += 1
+
+    def _take(self):
+        stream = self.tail + ''.join(self.pending)
+        self.pending = []
+        return stream
+
+    def frame(self):
+        """
+        Whole frame as bytes
+        """
+        stream = self._take()
+        return FRAME.pack(self.count, len(self.names), len(stream)) + self.names + bits_to_bytes(stream)
+
+    def write(self, fp):
+        """
+        Write the header and bits added since the last write
+        :return: file position after the frame
+        """
+        stream = self._take()
+        nbits = self.written * 8 + len(stream)
+        fp.seek(self.offset)
+        fp.write(FRAME.pack(self.count, len(self.names), nbits) + self.names)
+        fp.seek(self.offset + FRAME.size + len(self.names) + self.written)
+        fp.write(bits_to_bytes(stream))
+        full = len(stream) // 8
+        self.written += full
+        self.tail = stream[full * 8:]
+        return self.end
+
+
+def float_bits(value):
+    return UINT64.unpack(DOUBLE.pack(value))[0]
+
+
+def bits_to_bytes(stream):
+    """
+    Bit string to bytes, the last byte is padded with zeros
+    """
+    if not stream:
+        return b''
+    size = (len(stream) + 7) // 8
+    return int(stream.ljust(size * 8, '0'), 2).to_bytes(size, 'big')
+
+
+def encode_dod(dod):
+    """
+    :return: bits of delta of delta
+    """
+    if dod == 0:
+        return '0'
+    for width, control in DOD_TIERS:
+        half = 1 << (width - 1)
+        if -half < dod <= half:
+            return control + format(dod + half - 1, '0{}b'.format(width))
+    return WIDE_DOD + format(dod & MASK64, '064b')
+
+
+def encode_xor(xor, leading, trailing):
+    """
+    Bits of a value XOR previous one, meaningful bits are stored in the
+    previous window when they fit
+    :return: bits, leading and trailing zeros of the window
+    """
+    if xor == 0:
+        return '0', leading, trailing
+    lead = min(64 - xor.bit_length(), 31)
+    trail = (xor & -xor).bit_length() - 1
+    if leading is not None and lead >= leading and trail >= trailing:
+        return '10' + format(xor >> trailing, '0{}b'.format(64 - leading - trailing)), leading, trailing
+    length = 64 - lead - trail
+    return '11' + format(lead, '05b') + format(length & 63, '06b') + format(xor >> trail, '0{}b'.format(length)), \
+        lead, trail
+
+
+def frames(content):
+    """
+    :return: Generator of (field names, points, bits, offset of the stream)
+    """
+    if bytes(content[:len(MAGIC)]) != MAGIC:
+        raise ValueError('Not a gorilla bucket')
+    offset = len(MAGIC)
+    size = len(content)
+    while offset < size:
+        count, length, nbits = FRAME.unpack_from(content, offset)
+        offset += FRAME.size
+        names = bytes(content[offset:offset + length]).decode('utf-8')
+        offset += length
+        yield (names.split(',') if names else []), count, nbits, offset
+        offset += (nbits + 7) // 8
+
+
+def decode(content, fields=None):
+    """
+    Decode the whole bucket content into columns
+    :param content: bucket file content
+    :type content: bytes | mmap.mmap
+    :param fields: only these fields, all by default
+    :return: timestamps and dictionary of field name to column
+    :rtype: (numpy.ndarray, dict)
+    """
+    parts = []
+    for names, count, nbits, offset in frames(content):
+        timestamps, columns = decode_frame(content[offset:offset + (nbits + 7) // 8], count, len(names))
+        parts.append((
+            timestamps / 1e6,
+            dict((name, column.view(DTYPE))
+                 for name, column in zip(names, columns) if fields is None or name in fields)))
+    return concatenate(parts)
+
+
+def _dod_tiers():
+    """
+    Control bits, width and bias of delta of delta codes by their leading ones
+    """
+    controls, widths, biases = [1], [0], [0]
+    for width, control in DOD_TIERS:
+        controls.append(len(control))
+        widths.append(width)
+        biases.append((1 << (width - 1)) - 1)
+    controls.append(len(WIDE_DOD))
+    widths.append(64)
+    biases.append(0)
+    return numpy.array(controls), numpy.array(widths), numpy.array(biases)
+
+
+def _code_tables():
+    """
+    Tables of what the 16 bits at the start of a code tell
+    :return: leading ones of a delta of delta code, length of a XOR code
+        where '10' is 0 as its window is not known, the window length and
+        shift of a XOR code storing its window
+    """
+    word = numpy.arange(1 << 16)
+    ones = numpy.zeros(1 << 16, numpy.int64)
+    run = numpy.ones(1 << 16, numpy.int64)
+    for bit in range(len(WIDE_DOD)):
+        run &= (word >> (15 - bit)) & 1
+        ones += run
+    windows = (((word >> 3) & 63) - 1) % 64 + 1
+    shifts = numpy.clip(64 - ((word >> 9) & 31) - windows, 0, 63)
+    lengths = numpy.where(word >> 15 == 0, 1, numpy.where((word >> 14) & 1 == 0, 0, 13 + windows))
+    return ones.astype(numpy.uint8), lengths.astype(numpy.uint8), windows, shifts.astype(numpy.uint64)
+
+
+U64 = numpy.uint64
+DOD_CONTROLS, DOD_WIDTHS, DOD_BIASES = _dod_tiers()
+DOD_LENGTHS = (DOD_CONTROLS + DOD_WIDTHS).astype(numpy.uint8)
+LEADING_ONES, XOR_LENGTHS, WINDOW_LENGTHS, WINDOW_SHIFTS = _code_tables()
+DOD_STEPS = DOD_LENGTHS[LEADING_ONES]
+BYTE_SHIFTS = numpy.arange(8, 0, -1)
+
+
+def gather_bits(starts, padded, positions, lengths):
+    """
+    :param starts: big endian word starting at every byte
+    :param padded: bytes followed by at least 8 zero bytes
+    :param positions: bit positions
+    :param lengths: number of bits, from 1 to 64
+    :return: bits from every position as unsigned integers
+    :rtype: numpy.ndarray
+    """
+    skip = (positions & 7).astype(U64)
+    index = positions >> 3
+    # 72 bits from the byte of a value hold all of it
+    bits = starts[index] << skip
+    bits |= padded[index + 8].astype(U64) >> (U64(8) - skip)
+    return bits >> (U64(64) - lengths.astype(U64))
+
+
+def decode_frame(data, count, width):
+    """
+    Only code lengths are walked point by point, looked up in tables of the
+    16 bits at every position of the stream. Timestamps and values are then
+    read at the code positions and summed up or XORed as arrays.
+    :param data: bytes of the frame stream
+    :param count: number of points
+    :param width: number of fields
+    :return: timestamps in microseconds and value bits of every field
+    :rtype: (numpy.ndarray, list)
+    """
+    padded = numpy.frombuffer(bytes(data) + bytes(16), numpy.uint8)
+    starts = numpy.ndarray((len(data) + 8,), '>u8', padded, 0, (1,)).astype(U64)
+    # 16 bits starting at every bit of the stream
+    words = (((starts[:len(data)] >> U64(40)).astype(numpy.int64)[:, None] >> BYTE_SHIFTS) & 0xffff).ravel()
+    xor_lengths = XOR_LENGTHS[words]
+    dod_steps = DOD_STEPS[words].tobytes()
+    xor_steps = xor_lengths.tobytes()
+
+    rows = count - 1
+    marks = [0] * rows
+    windows = [0] * width
+    fields = range(width)
+    position = 64 * (width + 1)
+    for row in range(rows):
+        marks[row] = position
+        position += dod_steps[position]
+        for i in fields:
+            length = xor_steps[position]
+            if length > 1:
+                windows[i] = length - 11
+                position += length
+            else:
+                position += length or windows[i]
+
+    positions = numpy.array(marks, numpy.int64)
+    timestamps = numpy.empty(count, numpy.int64)
+    timestamps[:1] = starts[:1].view(numpy.int64)
+    tiers = LEADING_ONES[words[positions]]
+    if tiers.any():
+        widths = DOD_WIDTHS[tiers]
+        values = gather_bits(starts, padded, positions + DOD_CONTROLS[tiers], numpy.maximum(widths, 1))
+        dods = numpy.where(widths, values.view(numpy.int64) - DOD_BIASES[tiers], 0)
+        timestamps[1:] = timestamps[0] + numpy.cumsum(numpy.cumsum(dods))
+    else:
+        timestamps[1:] = timestamps[0]
+    positions += DOD_LENGTHS[tiers]
+
+    reads = numpy.empty((rows, width), numpy.int64)
+    lengths = numpy.empty((rows, width), numpy.int64)
+    shifts = numpy.empty((rows, width), U64)
+    unchanged = numpy.empty((rows, width), bool)
+    index = numpy.arange(rows)
+    for i in fields:
+        codes = xor_lengths[positions]
+        new = codes > 1
+        # the window is the one of the last code that stored it
+        heads = words[positions[numpy.maximum.accumulate(numpy.where(new, index, 0))]]
+        lengths[:, i] = WINDOW_LENGTHS[heads]
+        shifts[:, i] = WINDOW_SHIFTS[heads]
+        unchanged[:, i] = codes == 1
+        skip = numpy.where(new, 13, 2)
+        reads[:, i] = positions + skip
+        positions += numpy.where(unchanged[:, i], 1, skip + lengths[:, i])
+
+    columns = numpy.empty((width, count), U64)
+    columns[:, 0] = starts[8:8 * (width + 1):8]
+    values = gather_bits(starts, padded, reads, lengths) << shifts
+    values[unchanged] = 0
+    columns[:, 1:] = values.T
+    return timestamps, list(numpy.bitwise_xor.accumulate(columns, axis=1))
@@ -0,0 +1,150 @@
+import json
+import os
+from bisect import bisect_left, bisect_right
+
+from .base import naive_tstamp
+
+__all__ = [
+    'Manifest',
+]
+
+FILE_NAME = 'manifest.json'
+
+
+class Manifest(object):
+    """
+    Buckets existing in one series with their point count, min and max
+    timestamp and whether records were appended in order, keyed by bucket
+    start naive timestamp
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: series directory <base>/<name>/<bucket_size>
+        """
+        self.directory = directory
+        self.entries = {}
+        self.dirty = False
+        self._starts = None
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, FILE_NAME)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, start):
+        return start in self.entries
+
+    def update(self, start, timestamps):
+        """
+        Account records appended to the bucket
+        :param start: bucket start
+        :param timestamps: timestamps of appended records
+        :return: True when the bucket is new or stopped being ordered, the
+            saved manifest would hide or mistrim its records
+        :rtype: bool
+        """
+        entry = self.entries.get(start)
+        grown = entry is None
+        if entry is None:
+            entry = self.entries[start] = [0, float('inf'), float('-inf'), True]
+            self._starts = None
+        ordered = entry[3] and timestamps[0] >= entry[2] and all(
+            a <= b for a, b in zip(timestamps, timestamps[1:]))
+        grown = grown or ordered != entry[3]
+        entry[3] = ordered
+        entry[0] += len(timestamps)
+        entry[1] = min(entry[1], min(timestamps))
+        entry[2] = max(entry[2], max(timestamps))
+        self.dirty = True
+        return grown
+
+    def replace(self, start, timestamps):
+        """
+        Account the bucket anew after it was rewritten
+        :param start: bucket start
+        :param timestamps: all timestamps of the bucket
+        """
+        self.entries.pop(start, None)
+        self._starts = None
+        self.dirty = True
+        if len(timestamps):
+            self.update(start, timestamps)
+
+    def remove(self, low, high):
+        """
+        Remove buckets starting in [low, high)
+        """
+        for start in self.starts(low, high):
+            if start < high:
+                del self.entries[start]
+        self._starts = None
+        self.dirty = True
+
+    def starts(self, low, high):
+        """
+        Sorted starts of existing buckets between low and high inclusive
+        :rtype: list
+        """
+        if self._starts is None:
+            self._starts = sorted(self.entries)
+        return self._starts[bisect_left(self._starts, low):bisect_right(self._starts, high)]
+
+    def stats(self, start):
+        """
+        :return: count, min and max timestamp of the bucket
+        :rtype: (int, float, float) | None
+        """
+        entry = self.entries.get(start)
+        return tuple(entry[:3]) if entry is not None else None
+
+    def ordered(self, start):
+        """
+        :return: True when records of the bucket are sorted by timestamp
+        :rtype: bool
+        """
+        entry = self.entries.get(start)
+        return entry is not None and entry[3]
+
+    def load(self):
+        """
+        :return: False when there is nothing to load
+        :rtype: bool
+        """
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, 'r') as fp:
+            self.entries = dict((int(key), value) for key, value in json.load(fp).items())
+        self._starts = None
+        self.dirty = False
+        return True
+
+    def save(self):
+        if not self.entries:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.dirty = False
+            return
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(dict((str(key), value) for key, value in self.entries.items()), fp)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def rebuild(self, buckets):
+        """
+        Recreate entries from buckets found on disk
+        :param buckets: iterable of BucketBase
+        """
+        self.entries = {}
+        self._starts = None
+        for bucket in buckets:
+            timestamps = [timestamp for timestamp, _ in bucket.read()]
+            if timestamps:
+                self.update(int(naive_tstamp(bucket.start)), timestamps)
+        self.dirty = True
+
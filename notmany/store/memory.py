@@ -0,0 +1,288 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+from .aggregate import aggregate, check_funcs, concatenate
+from .base import StoreBase, BucketBase, Interval, EPOCH, naive_tstamp, bucket_start
+from .file import CHUNK_SIZE, chunks, gzip_chunks, records_to_arrays
+
+__all__ = [
+    'MemoryStore',
+    'MemoryBucket',
+]
+
+# buckets kept per series
+RING_SIZE = 3
+
+
+class MemoryBucket(BucketBase):
+    """
+    Bucket held in memory, timestamps in a compact array of doubles
+    """
+    __slots__ = ['timestamps', 'values', 'ordered', 'written']
+
+    def __init__(self, name, start, length):
+        BucketBase.__init__(self, name=name, start=start, length=length)
+        self.timestamps = array('d')
+        self.values = []
+        self.ordered = True
+        # leading records the backend already has
+        self.written = 0
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def append(self, timestamp, data):
+        if self.ordered and self.timestamps and timestamp < self.timestamps[-1]:
+            self.ordered = False
+        self.timestamps.append(timestamp)
+        self.values.append(data)
+
+    def extend(self, records):
+        for timestamp, data in records:
+            self.append(timestamp, data)
+
+    def read(self):
+        return zip(self.timestamps, self.values)
+
+    def read_range(self, low, high, ordered=False):
+        if not ordered:
+            return BucketBase.read_range(self, low, high)
+        first = bisect_left(self.timestamps, low)
+        last = bisect_right(self.timestamps, high)
+        return zip(self.timestamps[first:last], self.values[first:last])
+
+    def raw(self, size=CHUNK_SIZE):
+        return chunks(self.read(), size)
+
+    def raw_range(self, low, high, ordered=False, size=CHUNK_SIZE):
+        return chunks(self.read_range(low, high, ordered), size)
+
+    def arrays(self, fields=None):
+        return records_to_arrays(self.read(), fields)
+
+    def copy(self):
+        """
+        Snapshot of the records for reading while others append
+        :rtype: MemoryBucket
+        """
+        bucket = MemoryBucket(name=self.name, start=self.start, length=self.length)
+        bucket.timestamps = array('d', self.timestamps)
+        bucket.values = list(self.values)
+        bucket.ordered = self.ordered
+        bucket.written = self.written
+        return bucket
+
+    def delete(self):
+        self.timestamps = array('d')
+        self.values = []
+        self.ordered = True
+        self.written = 0
+
+
+class MemoryStore(StoreBase):
+    """
+    Keeps the most recent buckets of every series in memory.
+
+    Every series has a ring of at most ``buckets`` buckets, when a newer
+    bucket is needed the oldest one is written through to the backend
+    store. A new ring bucket starts with the records the backend already
+    has for it, so the ring alone answers for its buckets. Records older
+    than the ring go straight to the backend, without a backend they are
+    dropped. Recent windows are answered from memory, older parts of an
+    interval from the backend.
+    """
+
+    def __init__(self, backend=None, buckets=RING_SIZE, **kwargs):
+        """
+        :param backend: store for data leaving the ring
+        :type backend: StoreBase | None
+        :param buckets: number of buckets kept per series
+        """
+        if backend is not None:
+            kwargs.setdefault('bucket_size', backend.bucket_size)
+            if kwargs['bucket_size'] != backend.bucket_size:
+                raise ValueError('Bucket size has to be the same as bucket size of the backend')
+        StoreBase.__init__(self, **kwargs)
+        if buckets < 1:
+            raise ValueError('Memory store needs at least one bucket')
+        self.backend = backend
+        self.max_buckets = buckets
+        # name -> {start: MemoryBucket}
+        self._rings = {}
+        # held while rings change and while readers take their snapshot
+        self._lock = threading.RLock()
+
+    @property
+    def cache(self):
+        """
+        Cache of the backend, ring buckets need none
+        """
+        return None if self.backend is None else self.backend.cache
+
+    def _create_bucket(self, name, start):
+        with self._lock:
+            bucket = self._rings.get(name, {}).get(int(naive_tstamp(start)))
+        if bucket is None:
+            bucket = MemoryBucket(name=name, start=start, length=self.bucket_size)
+        return bucket
+
+    def _record_tstamps(self, name, records):
+        with self._lock:
+            StoreBase._record_tstamps(self, name, records)
+
+    def _write_bucket(self, name, start):
+        ring = self._rings.setdefault(name, {})
+        bucket = ring.get(start)
+        if bucket is not None:
+            return bucket
+
+        bucket = MemoryBucket(name=name, start=EPOCH + timedelta(seconds=start), length=self.bucket_size)
+        if len(ring) >= self.max_buckets and start < min(ring):
+            # older than the ring, _appended hands the records to the backend
+            return bucket
+
+        if self.backend is not None:
+            bucket.extend(self.backend.retrieve(
+                name, interval=Interval(start=bucket.start, end=bucket.end - timedelta(microseconds=1))))
+            bucket.written = len(bucket)
+        ring[start] = bucket
+        while len(ring) > self.max_buckets:
+            self._write_through(ring.pop(min(ring)))
+        return bucket
+
+    def _appended(self, name, records):
+        if self.backend is not None and bucket_start(records[0][0], self.bucket_size) not in self._rings.get(name, {}):
+            self.backend._record_tstamps(name, records)
+
+    def _write_through(self, bucket):
+        if self.backend is not None and len(bucket) > bucket.written:
+            self.backend._record_tstamps(bucket.name, list(bucket.read())[bucket.written:])
+
+    def _split(self, name, interval):
+        """
+        Split interval into the part older than the ring answered by the
+        backend and snapshots of ring buckets with their trim range
+        :return: whether to query the backend, interval for the backend
+            and list of (bucket, low, high)
+        :rtype: (bool, Interval | None, list)
+        """
+        with self._lock:
+            return self._split_ring(name, interval)
+
+    def _split_ring(self, name, interval):
+        ring = self._rings.get(name, {})
+        starts = sorted(ring)
+        low, high = float('-inf'), float('inf')
+        if interval is not None:
+            low, high = naive_tstamp(interval.start), naive_tstamp(interval.end)
+
+        query = self.backend is not None and (not starts or low < starts[0])
+        backend_interval = interval
+        if query and starts:
+            start = interval.start if interval is not None else self._first_backend_start(name)
+            end = EPOCH + timedelta(seconds=starts[0]) - timedelta(microseconds=1)
+            if interval is not None:
+                end = min(interval.end, end)
+            query = start is not None and start <= end
+            backend_interval = Interval(start=start, end=end) if query else None
+
+        buckets = [
+            (ring[start].copy(), low, high) for start in starts
+            if start + self.bucket_size > low and start <= high]
+        return query, backend_interval, buckets
+
+    def _first_backend_start(self, name):
+        """
+        :return: start of the oldest backend bucket or None
+        :rtype: datetime | None
+        """
+        for bucket in self.backend.get_all(name):
+            return bucket.start
+        return None
+
+    def get_all(self, name):
+        with self._lock:
+            ring = dict(self._rings.get(name, {}))
+        if self.backend is not None:
+            for bucket in self.backend.get_all(name):
+                if int(naive_tstamp(bucket.start)) not in ring:
+                    yield bucket
+        for start in sorted(ring):
+            yield ring[start]
+
+    def retrieve(self, name, interval=None, fields=None):
+        query, backend_interval, buckets = self._split(name, interval)
+        if query:
+            for item in self.backend.retrieve(name, interval=backend_interval, fields=fields):
+                yield item
+        for bucket, low, high in buckets:
+            records = bucket.read_range(low, high, bucket.ordered) if fields is None else \
+                bucket.project(fields, (low, high, bucket.ordered))
+            for item in records:
+                yield item
+
+    def retrieve_raw(self, name, interval=None, fields=None):
+        query, backend_interval, buckets = self._split(name, interval)
+        if query:
+            for item in self.backend.retrieve_raw(name, interval=backend_interval, fields=fields):
+                yield item
+        for bucket, low, high in buckets:
+            pieces = bucket.raw_range(low, high, bucket.ordered) if fields is None else \
+                chunks(bucket.project(fields, (low, high, bucket.ordered)), CHUNK_SIZE)
+            for item in pieces:
+                yield item
+
+    def retrieve_gzip(self, name, interval=None, fields=None):
+        """
+        Raw content as a single gzip member
+        :return: Generator of bytes
+        """
+        return gzip_chunks(self.retrieve_raw(name=name, interval=interval, fields=fields))
+
+    def retrieve_arrays(self, name, interval=None, fields=None):
+        query, backend_interval, buckets = self._split(name, interval)
+        if query:
+            for item in self.backend.retrieve_arrays(name, interval=backend_interval, fields=fields):
+                yield item
+        for bucket, low, high in buckets:
+            timestamps, columns = records_to_arrays(bucket.read_range(low, high, bucket.ordered), fields)
+            if len(timestamps):
+                yield timestamps, columns
+
+    def aggregate(self, name, interval, step, funcs=('avg', 'min', 'max'), fields=None):
+        check_funcs(funcs)
+        parts = self.retrieve_arrays(name=name, interval=interval, fields=fields)
+        return aggregate(*concatenate(parts), start=naive_tstamp(interval.start), step=step, funcs=funcs)
+
+    def forget(self, name, interval=None):
+        with self._lock:
+            ring = self._rings.get(name, {})
+            if interval is None:
+                ring.clear()
+            else:
+                low = bucket_start(naive_tstamp(interval.start), self.bucket_size)
+                high = naive_tstamp(interval.end)
+                for start in [start for start in ring if low <= start <= high]:
+                    del ring[start]
+            if not ring:
+                self._rings.pop(name, None)
+            if self.backend is not None:
+                self.backend.forget(name, interval=interval)
+
+    def flush(self):
+        if self.backend is not None:
+            self.backend.flush()
+
+    def close(self):
+        """
+        Write every ring through to the backend
+        """
+        with self._lock:
+            for ring in self._rings.values():
+                for start in sorted(ring):
+                    self._write_through(ring[start])
+            self._rings = {}
+        if self.backend is not None:
+            self.backend.close()
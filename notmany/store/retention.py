@@ -0,0 +1,104 @@
+import os
+import threading
+
+__all__ = [
+    'Retention',
+    'Tombstones',
+]
+
+FILE_NAME = '.tombstones'
+
+
+class Retention(object):
+    """
+    How long data of a series is kept
+    """
+    __slots__ = ['raw', 'rollups']
+
+    def __init__(self, raw=None, rollups=None):
+        """
+        :param raw: seconds raw buckets are kept after they end, forever
+            when None
+        :param rollups: rollup resolution to seconds its days are kept,
+            e.g. {3600: 365 * 86400}
+        :type rollups: dict | None
+        """
+        self.raw = raw
+        self.rollups = dict(rollups or {})
+
+
+class Tombstones(object):
+    """
+    Bucket files and directories that are deleted but not reclaimed yet.
+    Readers skip everything under them, paths are kept relative to the
+    store directory in a file appended on every delete and rewritten when
+    paths get reclaimed.
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: store directory
+        """
+        self.directory = directory
+        self._paths = set()
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as fp:
+                self._paths = set([os.path.join(directory, line.rstrip('\n')) for line in fp if line.strip()])
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, FILE_NAME)
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __contains__(self, path):
+        return path in self._paths
+
+    def add(self, paths):
+        """
+        :param paths: absolute paths of bucket files or directories
+        """
+        paths = [path for path in paths if path not in self._paths]
+        if not paths:
+            return
+        with self._lock:
+            with open(self.path, 'a') as fp:
+                fp.write(''.join([os.path.relpath(path, self.directory) + '\n' for path in paths]))
+            self._paths.update(paths)
+
+    def covers(self, *paths):
+        """
+        :return: True when any of paths is tombstoned
+        :rtype: bool
+        """
+        for path in paths:
+            if path in self._paths:
+                return True
+        return False
+
+    def take(self, limit=None):
+        """
+        :param limit: most paths returned, all by default
+        :return: tombstoned paths, they stay tombstoned until discarded
+        :rtype: list
+        """
+        with self._lock:
+            paths = sorted(self._paths)
+        return paths if limit is None else paths[:limit]
+
+    def discard(self, paths):
+        """
+        Forget reclaimed paths
+        """
+        with self._lock:
+            self._paths.difference_update(paths)
+            if not self._paths:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                return
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as fp:
+                fp.write(''.join([os.path.relpath(path, self.directory) + '\n' for path in sorted(self._paths)]))
+            os.replace(tmp_path, self.path)
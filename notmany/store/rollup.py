@@ -0,0 +1,133 @@
+__all__ = [
+    'Rollup',
+    'to_records',
+]
+
+ROLLUP_DIR = 'rollup_{}'
+
+
+class Rollup(object):
+    """
+    Incremental min, max, sum and count of every field over slots of
+    resolution seconds. Only the current slot is kept, a point for a later
+    slot finishes it and a late point for an earlier slot becomes its own
+    partial row, rows of the same slot are merged on read.
+    """
+    __slots__ = ['resolution', 'slot', 'fields']
+
+    def __init__(self, resolution):
+        self.resolution = resolution
+        self.slot = None
+        self.fields = {}
+
+    def add(self, tstamp, values):
+        """
+        :param tstamp: naive timestamp
+        :param values: field to value
+        :type values: dict
+        :return: finished rows
+        :rtype: list of (slot, fields)
+        """
+        slot = int(tstamp - tstamp % self.resolution)
+        if self.slot is not None and slot < self.slot:
+            late = {}
+            merge_values(late, values)
+            return [(slot, late)]
+
+        finished = []
+        if self.slot is not None and slot > self.slot:
+            finished.append(self.pop())
+        self.slot = slot
+        merge_values(self.fields, values)
+        return finished
+
+    def pop(self):
+        """
+        Take the current slot out
+        :rtype: (int, dict)
+        """
+        row = self.slot, self.fields
+        self.slot = None
+        self.fields = {}
+        return row
+
+
+def merge_values(fields, values):
+    for field, value in values.items():
+        summary = fields.get(field)
+        if summary is None:
+            fields[field] = [value, value, value, 1]
+        else:
+            if value < summary[0]:
+                summary[0] = value
+            if value > summary[1]:
+                summary[1] = value
+            summary[2] += value
+            summary[3] += 1
+
+
+def merge_rows(fields, other):
+    """
+    Merge summaries of other into fields
+    """
+    for field, (low, high, total, count) in other.items():
+        summary = fields.get(field)
+        if summary is None:
+            fields[field] = [low, high, total, count]
+        else:
+            summary[0] = min(summary[0], low)
+            summary[1] = max(summary[1], high)
+            summary[2] += total
+            summary[3] += count
+
+
+def encode(fields):
+    """
+    :return: 'cpu.min:1.0,cpu.max:3.0,cpu.sum:6.0,cpu.count:3'
+    """
+    return ','.join([
+        '{0}.min:{1!r},{0}.max:{2!r},{0}.sum:{3!r},{0}.count:{4}'.format(field, *summary)
+        for field, summary in sorted(fields.items())])
+
+
+def decode(data):
+    """
+    Reverse of encode
+    :rtype: dict
+    """
+    fields = {}
+    for pair in data.split(','):
+        key, value = pair.split(':')
+        field, func = key.rsplit('.', 1)
+        summary = fields.get(field)
+        if summary is None:
+            summary = fields[field] = [None, None, 0.0, 0]
+        if func == 'count':
+            summary[3] = int(value)
+        else:
+            summary[('min', 'max', 'sum').index(func)] = float(value)
+    return fields
+
+
+def summary_value(summary, func):
+    """
+    :param summary: [min, max, sum, count]
+    :param func: min, max, sum, count or avg
+    """
+    if func == 'avg':
+        return summary[2] / summary[3]
+    return summary[('min', 'max', 'sum', 'count').index(func)]
+
+
+def to_records(rows, funcs=('avg',)):
+    """
+    Rollup rows as records, every row gives a record for every function
+    with that function of each field
+    :param rows: iterable of (slot, {field: [min, max, sum, count]})
+    :param funcs: min, max, sum, count or avg
+    :return: Generator of (slot, data)
+    """
+    for slot, fields in rows:
+        for func in funcs:
+            yield slot, ','.join(['{}:{!r}'.format(field, summary_value(summary, func))
+                                  for field, summary in sorted(fields.items())])
@@ -0,0 +1,186 @@
+import threading
+from time import perf_counter
+
+__all__ = [
+    'Stats',
+    'Histogram',
+]
+
+# power of two microsecond buckets, the last one takes everything slower
+HISTOGRAM_BUCKETS = 32
+PERCENTILES = (50, 90, 99)
+# prefix of series stats are recorded into
+SERIES_PREFIX = 'notmany.'
+
+
+class Histogram(object):
+    """
+    Latency histogram with bucket i counting calls that took less than
+    2 ** i microseconds and at least half of that
+    """
+    __slots__ = ['counts', 'count', 'total', 'max']
+
+    def __init__(self):
+        self.counts = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[min(int(seconds * 1e6).bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percent):
+        """
+        :return: upper bound in seconds of the bucket the percentile falls
+            into, 0 when empty
+        """
+        rank = self.count * percent / 100.0
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return (2 ** index) / 1e6
+        return 0.0
+
+    def copy(self):
+        histogram = Histogram()
+        histogram.counts = list(self.counts)
+        histogram.count, histogram.total, histogram.max = self.count, self.total, self.max
+        return histogram
+
+    def since(self, previous):
+        """
+        Calls observed after previous was copied from this histogram, max
+        is kept as the maximum of all calls
+        :type previous: Histogram | None
+        :rtype: Histogram
+        """
+        histogram = self.copy()
+        if previous is not None:
+            histogram.counts = [count - old for count, old in zip(self.counts, previous.counts)]
+            histogram.count -= previous.count
+            histogram.total -= previous.total
+        return histogram
+
+    def to_dict(self):
+        """
+        :return: count, times in milliseconds and non empty buckets keyed
+            by their upper bound in microseconds
+        :rtype: dict
+        """
+        result = {
+            'count': self.count,
+            'sum': self.total * 1000,
+            'max': self.max * 1000,
+            'buckets': dict((str(2 ** index), count) for index, count in enumerate(self.counts) if count),
+        }
+        for percent in PERCENTILES:
+            result['p{}'.format(percent)] = self.percentile(percent) * 1000
+        return result
+
+
+class Stats(object):
+    """
+    Counters and latency histograms of a store shared by all threads using
+    it. Instrumented code checks for a Stats instance first so a store
+    created without one does no bookkeeping at all.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+        # counters and histograms as they were when points were last taken
+        self._taken = ({}, {})
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        """
+        :param seconds: duration of one call
+        """
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def timed(self, name, items, counter, size=None):
+        """
+        Pass items through, timing only the work of producing them so a
+        slow consumer does not count
+        :param name: histogram of whole iterations
+        :param items: iterable, closed when the generator is closed
+        :param counter: counter of items, or of their size
+        :param size: function of item giving its size, 1 by default
+        :return: Generator of items
+        """
+        items = iter(items)
+        took = 0.0
+        count = 0
+        try:
+            while True:
+                start = perf_counter()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    break
+                finally:
+                    took += perf_counter() - start
+                count += 1 if size is None else size(item)
+                yield item
+        finally:
+            close = getattr(items, 'close', None)
+            if close is not None:
+                close()
+            self.observe(name, took)
+            self.incr(counter, count)
+
+    def snapshot(self):
+        """
+        :return: counters and latency histograms, JSON serializable
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'latency': dict((name, histogram.to_dict()) for name, histogram in self.histograms.items()),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+            self._taken = ({}, {})
+
+    def points(self, timestamp, prefix=SERIES_PREFIX):
+        """
+        Records of counter increments and latency since the previous call,
+        one series per counter and histogram
+        :param timestamp: timestamp of the records
+        :return: list of (name, timestamp, data)
+        """
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = dict((name, histogram.copy()) for name, histogram in self.histograms.items())
+            old_counters, old_histograms = self._taken
+            self._taken = (counters, histograms)
+
+        records = []
+        for name in sorted(counters):
+            value = counters[name] - old_counters.get(name, 0)
+            if value:
+                records.append((prefix + name, timestamp, 'count:{}'.format(value)))
+        for name in sorted(histograms):
+            histogram = histograms[name].since(old_histograms.get(name))
+            if histogram.count:
+                records.append((prefix + name, timestamp, 'count:{},sum:{!r},p50:{!r},p99:{!r}'.format(
+                    histogram.count, histogram.total * 1000,
+                    histogram.percentile(50) * 1000, histogram.percentile(99) * 1000)))
+        return records
@@ -0,0 +1,224 @@
+import os
+import threading
+from time import time
+
+__all__ = [
+    'WriteAheadLog',
+    'fsync_path',
+]
+
+FILE_NAME = 'wal.log'
+# fsync policies
+FSYNC_ALWAYS = 'always'
+FSYNC_INTERVAL = 'interval'
+FSYNC_NEVER = 'never'
+FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER)
+SYNC_INTERVAL = 1.0
+# log size that triggers a checkpoint
+MAX_SIZE = 64 * 1024 * 1024
+
+
+def fsync_path(path):
+    """
+    Force file or directory content to disk, missing paths are skipped
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:  # directories can not be synced everywhere
+        pass
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog(object):
+    """
+    Single append only log of recorded points of a store.
+
+    Appends use group commit, callers arriving while another one writes and
+    syncs the log queue their records and the next writer commits all of
+    them with one write and at most one fsync. With ``fsync='always'`` every
+    commit is synced so acknowledged points survive a crash, ``'interval'``
+    syncs at most once per ``sync_interval`` seconds and ``'never'`` leaves
+    it to the OS. Committed records wait in memory until the store takes
+    them to apply to bucket files.
+
+    Every line is 'name\\ttimestamp\\tdata'.
+    """
+
+    def __init__(self, directory, fsync=FSYNC_ALWAYS, sync_interval=SYNC_INTERVAL, max_size=MAX_SIZE):
+        """
+        :param directory: where the log file lives, created when needed
+        :param fsync: always, interval or never
+        :param sync_interval: seconds between syncs for interval policy
+        :param max_size: log size in bytes after which the store checkpoints
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError('Unknown fsync policy {}'.format(fsync))
+        self.directory = directory
+        self.fsync = fsync
+        self.sync_interval = sync_interval
+        self.max_size = max_size
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        # (content, records) waiting for commit
+        self._queue = []
+        self._enqueued = 0
+        self._committed = 0
+        # ticket -> error of a failed commit its records were part of
+        self._failed = {}
+        # committed records not yet taken by the store
+        self._pending = []
+        self._synced = time()
+        self._fp = open(self.path, 'ab')
+        self._written = self._fp.tell()
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, FILE_NAME)
+
+    @property
+    def size(self):
+        """
+        Bytes committed to the log
+        :rtype: int
+        """
+        return self._written
+
+    @property
+    def pending(self):
+        """
+        Number of committed records not taken yet
+        :rtype: int
+        """
+        return len(self._pending)
+
+    def append(self, records):
+        """
+        Commit records to the log, returns once they are written and synced
+        according to the fsync policy
+        :param records: list of (name, naive timestamp, data)
+        :raises OSError: when the commit carrying the records failed
+        """
+        content = ''.join(['{}\t{!r}\t{}\n'.format(name, tstamp, data) for name, tstamp, data in records])
+        with self._lock:
+            self._queue.append((content, records))
+            self._enqueued += 1
+            ticket = self._enqueued
+
+        with self._commit_lock:
+            if self._committed >= ticket:
+                # committed by another caller together with its own records
+                with self._lock:
+                    error = self._failed.pop(ticket, None)
+                if error is not None:
+                    raise OSError('Records were not written to the log: {}'.format(error))
+                return
+            with self._lock:
+                batch, self._queue = self._queue, []
+                first, last = self._committed + 1, self._enqueued
+
+            try:
+                self._fp.write(''.join([content for content, _ in batch]).encode('utf-8'))
+                self._fp.flush()
+                self._sync()
+            except Exception as exc:
+                self._drop_tail()
+                with self._lock:
+                    for waiting in range(first, last + 1):
+                        if waiting != ticket:
+                            self._failed[waiting] = exc
+                    self._committed = last
+                raise
+
+            with self._lock:
+                for _, committed in batch:
+                    self._pending.extend(committed)
+                self._written = self._fp.tell()
+                self._committed = last
+
+    def _drop_tail(self):
+        """
+        Cut the log back to what was committed before a failed write, so
+        replay does not apply records their callers were told failed
+        """
+        try:
+            self._fp.truncate(self._written)
+        except (OSError, ValueError):
+            pass
+
+    def _sync(self, force=False):
+        if self.fsync == FSYNC_NEVER and not force:
+            return
+        now = time()
+        if force or self.fsync == FSYNC_ALWAYS or now - self._synced >= self.sync_interval:
+            os.fsync(self._fp.fileno())
+            self._synced = now
+
+    def take(self):
+        """
+        Take committed records out to be applied
+        :return: records and log offset up to which all records were taken
+        :rtype: (list, int)
+        """
+        with self._lock:
+            records, self._pending = self._pending, []
+            return records, self._written
+
+    def replay(self):
+        """
+        Records found in the log, a torn last line is skipped
+        :return: list of (name, naive timestamp, data)
+        """
+        records = []
+        with open(self.path, 'rb') as fp:
+            content = fp.read().decode('utf-8')
+        for line in content.split('\n')[:-1]:
+            try:
+                name, tstamp, data = line.split('\t', 2)
+                records.append((name, float(tstamp), data))
+            except ValueError as exc:
+                print('Broken line {} {}'.format(line, exc))
+        return records
+
+    def truncate(self, offset):
+        """
+        Drop the log up to offset, records committed after it are kept
+        :param offset: as returned by take
+        """
+        with self._commit_lock:
+            self._fp.flush()
+            tail = b''
+            if self._fp.tell() > offset:
+                with open(self.path, 'rb') as fp:
+                    fp.seek(offset)
+                    tail = fp.read()
+            self._fp.close()
+
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'wb') as fp:
+                fp.write(tail)
+                fp.flush()
+                if self.fsync != FSYNC_NEVER:
+                    os.fsync(fp.fileno())
+            os.replace(tmp_path, self.path)
+            if self.fsync != FSYNC_NEVER:
+                fsync_path(self.directory)
+
+            self._fp = open(self.path, 'ab')
+            with self._lock:
+                self._written = self._fp.tell()
+
+    def close(self):
+        with self._commit_lock:
+            if not self._fp.closed:
+                self._fp.flush()
+                if self.fsync != FSYNC_NEVER:
+                    self._sync(force=True)
+                self._fp.close()
@@ -0,0 +1,164 @@
+import errno
+import os
+import threading
+from collections import OrderedDict
+from time import time
+
+from .file import run_periodically
+
+__all__ = [
+    'Writer',
+]
+
+MAX_OPEN = 128
+BUFFER_SIZE = 65536
+MAX_AGE = 1.0
+
+
+class Writer(object):
+    """
+    Pool of open append handles keyed by bucket path.
+
+    Data written for a path is kept in a per path buffer and reaches the file
+    when the buffer grows over ``buffer_size`` bytes, when the oldest pending
+    buffer is older than ``max_age`` seconds (checked on every write and
+    every ``max_age`` seconds in a background thread so idle paths get
+    written too), or on explicit ``flush``/``close``. At most ``max_open``
+    handles are kept open, least recently used ones get closed first.
+    """
+
+    def __init__(self, max_open=MAX_OPEN, buffer_size=BUFFER_SIZE, max_age=MAX_AGE):
+        if max_open < 1:
+            raise ValueError('Writer needs at least one open handle')
+        self.max_open = max_open
+        self.buffer_size = buffer_size
+        self.max_age = max_age
+        self._handles = OrderedDict()
+        # path -> [directory, chunks, size]
+        self._buffers = OrderedDict()
+        self._oldest = None
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._thread = None
+        if max_age > 0:
+            self._thread = run_periodically(max_age, self.flush_aged, self._stopped)
+
+    @property
+    def pending(self):
+        """
+        Number of bytes waiting in buffers
+        :rtype: int
+        """
+        return sum(buf[2] for buf in self._buffers.values())
+
+    def write(self, directory, path, data):
+        """
+        Buffer data to be appended to the file under path
+        :param directory: directory of the file, created when needed
+        :param path: full path of the file
+        :param data: text to append
+        :type data: str
+        """
+        with self._lock:
+            now = time()
+            buf = self._buffers.get(path)
+            if buf is None:
+                buf = self._buffers[path] = [directory, [], 0]
+                if self._oldest is None:
+                    self._oldest = now
+            buf[1].append(data)
+            buf[2] += len(data)
+
+            if buf[2] >= self.buffer_size:
+                self._flush_path(path)
+
+            self.flush_aged(now)
+
+    def flush_aged(self, now=None):
+        """
+        Flush all buffers when the oldest one is older than max_age
+        :param now: current time, taken when None
+        """
+        now = time() if now is None else now
+        with self._lock:
+            if self._oldest is not None and now - self._oldest >= self.max_age:
+                self.flush()
+
+    def flush(self, path=None):
+        """
+        Write pending buffers to their files
+        :param path: when given flush only this path
+        """
+        with self._lock:
+            if path is not None:
+                if path in self._buffers:
+                    self._flush_path(path)
+                return
+
+            for pending in list(self._buffers):
+                self._flush_path(pending)
+            self._oldest = None
+
+    def discard(self, prefix):
+        """
+        Drop buffers and close handles of every path starting with prefix,
+        use it before files get deleted
+        :param prefix: path or directory
+        """
+        def under(path):
+            return path == prefix or path.startswith(prefix.rstrip(os.sep) + os.sep)
+
+        with self._lock:
+            for path in [p for p in self._buffers if under(p)]:
+                del self._buffers[path]
+            for path in [p for p in self._handles if under(p)]:
+                self._handles.pop(path).close()
+            if not self._buffers:
+                self._oldest = None
+
+    def close(self):
+        """
+        Flush everything, close all handles and stop the background flush
+        """
+        self._stopped.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            self.flush()
+            while self._handles:
+                self._handles.popitem(last=False)[1].close()
+
+    def _flush_path(self, path):
+        """
+        Write the buffer of the path, it is dropped only once written so a
+        failed write is retried by the next flush
+        """
+        directory, chunks, _ = self._buffers[path]
+        fp = self._handle(directory, path)
+        try:
+            fp.write(''.join(chunks))
+            fp.flush()
+        except OSError:
+            self._handles.pop(path, None)
+            fp.close()
+            raise
+        del self._buffers[path]
+        if not self._buffers:
+            self._oldest = None
+
+    def _handle(self, directory, path):
+        fp = self._handles.pop(path, None)
+        if fp is None:
+            while len(self._handles) >= self.max_open:
+                self._handles.popitem(last=False)[1].close()
+            # the directory may be missing or removed meanwhile by a forget
+            try:
+                fp = open(path, 'a')
+            except OSError as exc:
+                if exc.errno != errno.ENOENT:
+                    raise
+                os.makedirs(directory, exist_ok=True)
+                fp = open(path, 'a')
+        self._handles[path] = fp
+        return fp
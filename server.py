@@ -1,66 +1,369 @@
+import json
+import zlib
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, datetime
+from functools import partial
 
 import tornado.web
 import tornado.ioloop
+from tornado.iostream import StreamClosedError
+from tornado.locks import Semaphore
 from bkcharts import TimeSeries, output_file, show, save
 
-from notmany.store.base import get_datetime, Interval, record_to_data
+from notmany.protocol import LineParser
+from notmany.store.base import get_datetime, Interval, record_to_data, naive_tstamp
+from notmany.store.downsample import downsample
+from notmany.store.rollup import to_records
+from notmany.store.stats import Stats
 
 # TODO proper input validation, and enforce max delta
-from notmany.store.file import Store, MAX_DELTA
+from notmany.store.file import Store, MAX_DELTA, CHUNK_SIZE, join_lines
 
-store = Store(directory='tests/store', bucket_size=600)
+# counters and latency of the store and the handlers served at /stats
+STATS = False
+stats = Stats() if STATS else None
+store = Store(directory='tests/store', bucket_size=600, stats=stats)
 
+# store I/O runs on this pool so the IOLoop keeps serving other clients, the
+# store serializes writes itself
+MAX_WORKERS = 8
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+# queries longer than this many seconds wait for one of MAX_HEAVY_QUERIES slots
+HEAVY_QUERY = 3600 * 6
+MAX_HEAVY_QUERIES = 2
+heavy_queries = Semaphore(MAX_HEAVY_QUERIES)
 
-class MetricHandler(tornado.web.RequestHandler):
-    def get(self, metric):
 
-        start = get_datetime(self.get_query_argument(name='start'))
-        delta = self.get_query_argument(name='delta', default=None)
-        end = self.get_query_argument(name='end', default=None)
+def run_blocking(func, *args, **kwargs):
+    """
+    Run store call on the executor
+    :return: awaitable result
+    """
+    return tornado.ioloop.IOLoop.current().run_in_executor(executor, partial(func, *args, **kwargs))
 
-        if delta is not None:
-            delta = min(int(delta), MAX_DELTA)
-            delta = timedelta(seconds=int(delta))
-        elif not end:
-            raise tornado.web.MissingArgumentError('You have to define delta or end')
 
-        interval = Interval(start=start, end=end, delta=delta)
+async def stream(handler, chunks):
+    """
+    Write chunks produced on the executor, every chunk is flushed before
+    the next one is read so slow clients slow down only their own query
+    :param handler:
+    :type handler: tornado.web.RequestHandler
+    :param chunks: iterable of chunks
+    """
+    chunks = iter(chunks)
+    try:
+        while True:
+            chunk = await run_blocking(next, chunks, None)
+            if chunk is None:
+                break
+            handler.write(chunk)
+            await handler.flush()
+    except StreamClosedError:
+        pass
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            await run_blocking(close)
+
+
+class Heavy(object):
+    """
+    Hold a heavy query slot when the interval is long, every series of a
+    query counts
+    """
+
+    def __init__(self, interval, series=1):
+        self.heavy = (interval.end - interval.start).total_seconds() * series > HEAVY_QUERY
+
+    async def __aenter__(self):
+        if self.heavy:
+            await heavy_queries.acquire()
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        if self.heavy:
+            heavy_queries.release()
+
+
+class Handler(tornado.web.RequestHandler):
+    """
+    Counts responses by status and times requests of every handler class
+    """
+
+    def on_finish(self):
+        if stats is not None:
+            stats.observe('http.{}'.format(type(self).__name__), self.request.request_time())
+            stats.incr('http.status.{}'.format(self.get_status()))
+
+
+class StatsHandler(Handler):
+    """
+    Counters and latency histograms of the store and handlers as JSON
+    """
+
+    def get(self):
+        if stats is None:
+            raise tornado.web.HTTPError(404, 'Stats are switched off')
+        result = stats.snapshot()
+        if store.cache is not None:
+            result['cache'] = store.cache.stats()
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps(result))
+
+
+class MetricHandler(Handler):
+
+    async def get(self, metric):
+        interval = get_interval(self)
+        fields = get_fields(self)
 
-        for chunk in store.retrieve_raw(name=metric, interval=interval):
-            self.write(chunk=chunk)
-        self.finish()
+        if 'gzip' in self.request.headers.get('Accept-Encoding', ''):
+            self.set_header('Content-Encoding', 'gzip')
+            chunks = store.retrieve_gzip(name=metric, interval=interval, fields=fields)
+        else:
+            chunks = store.retrieve_raw(name=metric, interval=interval, fields=fields)
 
-    def post(self, metric):
-        ts = get_datetime(self.get_body_argument("timestamp"))
+        async with Heavy(interval):
+            await stream(self, chunks)
+
+    async def post(self, metric):
+        try:
+            ts = get_datetime(self.get_body_argument("timestamp"))
+        except ValueError as exc:
+            raise tornado.web.HTTPError(400, str(exc))
         data = self.get_body_argument('data')
-        store.record(
+        await run_blocking(
+            store.record,
             name=metric,
             timestamp=ts,
             data=data
         )
 
-class ChartHandler(tornado.web.RequestHandler):
+# largest accepted /write body in bytes
+MAX_WRITE_BODY = 256 * 1024 * 1024
+# records handed to the store at once while the body streams in
+WRITE_BATCH = 10000
+
+
+@tornado.web.stream_request_body
+class WriteHandler(Handler):
+    """
+    Bulk ingest of newline delimited 'name timestamp field:value,...' lines,
+    optionally with Content-Encoding: gzip. Lines are parsed as the body
+    streams in and recorded grouped by series and bucket, the response
+    tells how many lines were accepted and rejected.
+    """
+
+    def prepare(self):
+        self.request.connection.set_max_body_size(MAX_WRITE_BODY)
+        self.parser = LineParser(compressed=self.request.headers.get('Content-Encoding') == 'gzip')
+        self.pending = []
+        self.broken = None
+
+    async def data_received(self, chunk):
+        if self.broken is not None:
+            return
+        try:
+            self.pending.extend(self.parser.feed(chunk))
+        except zlib.error as exc:
+            self.broken = 'Broken gzip body {}'.format(exc)
+            return
+        if len(self.pending) >= WRITE_BATCH:
+            await self.record()
+
+    async def record(self):
+        records, self.pending = self.pending, []
+        await run_blocking(store.record_many_series, records)
+
+    async def post(self):
+        if self.broken is None:
+            try:
+                self.pending.extend(self.parser.close())
+            except zlib.error as exc:
+                self.broken = 'Broken gzip body {}'.format(exc)
+        if self.broken is not None:
+            raise tornado.web.HTTPError(400, self.broken)
+        if self.pending:
+            await self.record()
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps(self.parser.summary()))
+
+
+# most series of one /many query
+MAX_SERIES = 100
+
+
+class ManyHandler(Handler):
+    """
+    Series listed in names merged by timestamp, sent as the
+    'name timestamp data' lines /write accepts, with wide=1 as JSON with
+    one row of timestamp and data of every series per timestamp
+    """
+
+    async def get(self):
+        names = [name for name in self.get_query_argument(name='names').split(',') if name]
+        if not names or len(names) > MAX_SERIES:
+            raise tornado.web.HTTPError(400, 'Expected 1 to {} names'.format(MAX_SERIES))
+        wide = self.get_query_argument(name='wide', default='0') not in ('0', 'false')
+        interval = get_interval(self)
+
+        records = store.retrieve_many(names=names, interval=interval, wide=wide, fields=get_fields(self))
+        if wide:
+            self.set_header('Content-Type', 'application/json')
+        async with Heavy(interval, series=len(names)):
+            await stream(self, join_lines(many_lines(names, records, wide), CHUNK_SIZE))
+
 
-    def get(self, name):
-        start = get_datetime(self.get_query_argument(name='start'))
-        delta = self.get_query_argument(name='delta', default=None)
-        end = self.get_query_argument(name='end', default=None)
+def many_lines(names, records, wide):
+    """
+    :param records: output of Store.retrieve_many
+    :return: Generator of str
+    """
+    if not wide:
+        for name, tstamp, data in records:
+            yield '{} {} {}\n'.format(name, tstamp, data)
+        return
 
+    yield '{{"names": {}, "rows": ['.format(json.dumps(names))
+    separator = ''
+    for tstamp, row in records:
+        yield separator + json.dumps([tstamp] + row)
+        separator = ','
+    yield ']}'
+
+
+class AggregateHandler(Handler):
+
+    async def get(self, name):
+        funcs = self.get_query_argument(name='funcs', default='avg,min,max').split(',')
+        interval = get_interval(self)
+        try:
+            step = int(self.get_query_argument(name='step'))
+            async with Heavy(interval):
+                result = await run_blocking(
+                    store.aggregate,
+                    name=name,
+                    interval=interval,
+                    step=step,
+                    funcs=funcs,
+                    fields=get_fields(self))
+        except ValueError as exc:
+            raise tornado.web.HTTPError(400, str(exc))
+
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps({
+            'timestamps': result['timestamps'].tolist(),
+            'fields': dict(
+                (field, dict((func, to_list(values)) for func, values in results.items()))
+                for field, results in result['fields'].items()),
+        }))
+
+
+def to_list(values):
+    """
+    Numpy array to list with NaN as None so it can be sent as JSON
+    """
+    return [None if value != value else value for value in values.tolist()]
+
+
+def get_interval(handler):
+    """
+    :raises tornado.web.HTTPError: 400 for malformed start, end or delta
+    """
+    start = handler.get_query_argument(name='start')
+    delta = handler.get_query_argument(name='delta', default=None)
+    end = handler.get_query_argument(name='end', default=None)
+
+    if delta is None and not end:
+        raise tornado.web.MissingArgumentError('You have to define delta or end')
+    try:
         if delta is not None:
-            delta = min(int(delta), MAX_DELTA)
-            delta = timedelta(seconds=int(delta))
-        elif not end:
-            raise tornado.web.MissingArgumentError('You have to define delta or end')
+            delta = timedelta(seconds=min(int(delta), MAX_DELTA))
+        return Interval(start=get_datetime(start), end=end, delta=delta)
+    except (ValueError, RuntimeError) as exc:
+        raise tornado.web.HTTPError(400, str(exc))
+
+
+def get_fields(handler):
+    """
+    :return: field names of the comma separated fields argument, None for all
+    """
+    fields = handler.get_query_argument(name='fields', default=None)
+    return fields.split(',') if fields else None
+
+
+# most points of one field a chart can ask for
+MAX_POINTS = 10000
+
 
-        interval = Interval(start=start, end=end, delta=delta)
-        data = chart_data(records=store.retrieve(name=name, interval=interval))
+# rollup values a downsampling method is fed with, one record per function
+ROLLUP_FUNCS = {
+    'lttb': ('avg',),
+    'minmax': ('min', 'max'),
+}
+
+
+class ChartHandler(Handler):
+    """
+    With points=N the fields are downsampled to at most N points each by
+    method=lttb (default) or minmax and sent as JSON, from rollup rows
+    when a rollup has at least N slots in the interval
+    """
+
+    async def get(self, name):
+        interval = get_interval(self)
+        fields = get_fields(self)
+        points = self.get_query_argument(name='points', default=None)
+        if points is not None:
+            await self.get_points(name, interval, fields, points)
+            return
+        async with Heavy(interval):
+            data = await run_blocking(
+                lambda: chart_data(records=store.retrieve(name=name, interval=interval, fields=fields)))
         # output_file("stocks_timeseries.html")
         # p = TimeSeries(data, title=name, ylabel='Foo')
         # save(p)
         self.write('ok')
 
+    async def get_points(self, name, interval, fields, points):
+        try:
+            points = min(int(points), MAX_POINTS)
+            method = self.get_query_argument(name='method', default='lttb')
+            start, end = naive_tstamp(interval.start), naive_tstamp(interval.end)
+            resolution = None
+            if points > 0 and method in ROLLUP_FUNCS:
+                resolution = store.rollup_resolution(interval, float(end - start) / points, whole=False)
+            async with Heavy(interval):
+                result = await run_blocking(
+                    lambda: downsample(
+                        records=chart_records(name, interval, fields, resolution, method),
+                        start=start,
+                        end=end,
+                        points=points,
+                        method=method))
+        except ValueError as exc:
+            raise tornado.web.HTTPError(400, str(exc))
+
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps({
+            'name': name,
+            'method': method,
+            'fields': dict(
+                (field, {'timestamps': [point[0] for point in kept], 'values': [point[1] for point in kept]})
+                for field, kept in result.items()),
+        }))
+
+
+def chart_records(name, interval, fields, resolution, method):
+    """
+    Raw records of the interval or with a resolution rollup rows as records
+    of the values the downsampling method needs
+    :return: iterable of (naive timestamp, data)
+    """
+    if resolution is None:
+        return store.retrieve(name=name, interval=interval, fields=fields)
+    return to_records(store.rollup_rows(name, resolution, interval, fields), ROLLUP_FUNCS[method])
+
 
 def chart_data(records):
     data = {
@@ -82,12 +385,21 @@ def chart_data(records):
                 data[key].append(value)
     return data
 
-if __name__ == "__main__":
-    port = 8887
-    application = tornado.web.Application([
+
+def make_app():
+    return tornado.web.Application([
         (r"/metric/(.*?)", MetricHandler),
         (r"/chart/(.*?)", ChartHandler),
+        (r"/aggregate/(.*?)", AggregateHandler),
+        (r"/write", WriteHandler),
+        (r"/many", ManyHandler),
+        (r"/stats", StatsHandler),
     ])
+
+
+if __name__ == "__main__":
+    port = 8887
+    application = make_app()
     print('Listen on {}'.format(port))
     application.listen(port=port)
     tornado.ioloop.IOLoop.current().start()
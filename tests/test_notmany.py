@@ -29,15 +29,18 @@ class SavingMetricsWeeksTestCase(TestCase):
         self.start = dt('2018-03-03T12:30:00')
 
     def save_days_of_metric(self, store, days):
-        cpu, mem = 10, 4400
         start = time()
         count = 3600 * 24 * days
+        store.record_many('temp', self.generate_points(count))
+        print('Saving records {} took {} bucket size {}'.format(count, time() - start, store.bucket_size))
+
+    def generate_points(self, count):
+        cpu, mem = 10, 4400
+        steps = [-2, -1, 0, 1, 2]
         for i in range(count):
-            steps = [-2, -1, 0, 1, 2]
             cpu += choice(steps)
             mem += choice(steps)
-            store.record('temp', timestamp=self.start + seconds(i), data='cpu:{},mem:{}'.format(cpu, mem))
-        print('Saving records {} took {} bucket size {}'.format(count, time() - start, store.bucket_size))
+            yield self.start + seconds(i), 'cpu:{},mem:{}'.format(cpu, mem)
 
     def retrieve(self, store):
         start = time()
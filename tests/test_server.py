@@ -1,5 +1,13 @@
 
-from unittest import TestCase
+import json
+from datetime import timedelta
+from unittest import TestCase, mock
+
+from tornado.testing import AsyncHTTPTestCase
+
+import server
+from notmany.store.file import Store
+from tests.utils import dt, temporary_directory
 
 
 class ServerBase(TestCase):
@@ -17,3 +25,45 @@ class ServerManyConnectionsTestCase(ServerBase):
 
     def test_I_can_send_metric_from_different_threads_simultaneously(self):
         self.fail()
+
+
+class RollupHandlersTestCase(AsyncHTTPTestCase):
+    start = dt('2018-03-03T12:00:00')
+    query = 'start=2018-03-03T12:00:00&delta=3600'
+
+    def setUp(self):
+        directory = temporary_directory()
+        self.store = Store(directory=directory.__enter__(), bucket_size=600, rollups=(60, 600))
+        self.addCleanup(directory.__exit__, None, None, None)
+        self.addCleanup(self.store.close)
+        self.store.record_many('foo', [(self.start + timedelta(seconds=10 * i), 'cpu:{}'.format(i % 6))
+                                       for i in range(360)])
+        patcher = mock.patch.object(server, 'store', self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super(RollupHandlersTestCase, self).setUp()
+
+    def get_app(self):
+        return server.make_app()
+
+    def get_json(self, url):
+        response = self.fetch(url)
+        self.assertEqual(200, response.code)
+        return json.loads(response.body.decode('utf-8'))
+
+    def test_aggregate_check_served_from_rollup(self):
+        with mock.patch.object(self.store, 'retrieve_arrays', side_effect=AssertionError('raw points read')):
+            result = self.get_json('/aggregate/foo?{}&step=1200&funcs=min,max,count,avg'.format(self.query))
+        self.assertEqual([1520078400.0, 1520079600.0, 1520080800.0], result['timestamps'])
+        self.assertEqual({'min': [0.0] * 3, 'max': [5.0] * 3, 'count': [120] * 3, 'avg': [2.5] * 3},
+                         result['fields']['cpu'])
+
+    def test_aggregate_with_percentile_check_raw(self):
+        result = self.get_json('/aggregate/foo?{}&step=1200&funcs=p50'.format(self.query))
+        self.assertEqual([2.5] * 3, result['fields']['cpu']['p50'])
+
+    def test_chart_points_check_served_from_rollup(self):
+        result = self.get_json('/chart/foo?{}&points=6&method=minmax'.format(self.query))
+        # raw points would have the maximum 50s after the minimum, rollup rows have both at the slot start
+        self.assertEqual({'timestamps': [1520078400, 1520078400, 1520079600, 1520079600, 1520080800, 1520080800],
+                          'values': [0.0, 5.0, 0.0, 5.0, 0.0, 5.0]}, result['fields']['cpu'])
@@ -0,0 +1,77 @@
+from datetime import timedelta
+from unittest import TestCase
+
+import numpy
+
+from notmany.store.aggregate import aggregate
+from notmany.store.base import Interval
+from notmany.store.file import Store
+from tests.utils import dt, temporary_directory
+
+
+class AggregateTestCase(TestCase):
+
+    def test_aggregate_check_same_as_numpy(self):
+        rand = numpy.random.RandomState(7)
+        timestamps = numpy.sort(rand.uniform(1000, 2000, 500))
+        values = rand.normal(size=500)
+        result = aggregate(timestamps, {'cpu': values}, 1000, 100, ['min', 'max', 'sum', 'count', 'avg', 'p95', 'p50'])
+
+        numpy.testing.assert_array_equal(result['timestamps'], numpy.arange(1000, 2000, 100))
+        cpu = result['fields']['cpu']
+        for i, start in enumerate(result['timestamps']):
+            group = values[(timestamps >= start) & (timestamps < start + 100)]
+            self.assertEqual(cpu['count'][i], len(group))
+            self.assertAlmostEqual(cpu['min'][i], group.min())
+            self.assertAlmostEqual(cpu['max'][i], group.max())
+            self.assertAlmostEqual(cpu['sum'][i], group.sum())
+            self.assertAlmostEqual(cpu['avg'][i], group.mean())
+            self.assertAlmostEqual(cpu['p95'][i], numpy.percentile(group, 95))
+            self.assertAlmostEqual(cpu['p50'][i], numpy.median(group))
+
+    def test_aggregate_with_missing_values_check_nan(self):
+        timestamps = numpy.array([0.0, 1.0, 10.0, 11.0])
+        result = aggregate(timestamps, {
+            'cpu': numpy.array([1.0, 3.0, numpy.nan, numpy.nan]),
+            'mem': numpy.array([1.0, 1.0, 5.0, numpy.nan]),
+        }, 0, 10, ['avg', 'max', 'count'])
+        cpu, mem = result['fields']['cpu'], result['fields']['mem']
+        self.assertEqual(2.0, cpu['avg'][0])
+        self.assertTrue(numpy.isnan(cpu['avg'][1]))
+        self.assertTrue(numpy.isnan(cpu['max'][1]))
+        self.assertEqual([2, 0], cpu['count'].tolist())
+        self.assertEqual([1.0, 5.0], mem['max'].tolist())
+
+    def test_aggregate_with_unknown_func_check_raises(self):
+        with self.assertRaises(ValueError):
+            aggregate(numpy.array([0.0]), {}, 0, 10, ['median'])
+        with self.assertRaises(ValueError):
+            aggregate(numpy.array([0.0]), {}, 0, 10, ['p101'])
+
+
+class StoreAggregateTestCase(TestCase):
+
+    def test_aggregate_check_steps_of_interval(self):
+        start = dt('2018-03-03T12:30:00')
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600)
+            store.record_many('foo', [(start + timedelta(minutes=i), 'cpu:{},mem:1'.format(i)) for i in range(60)])
+            store.record('foo', start + timedelta(minutes=61), 'cpu:100')
+
+            result = store.aggregate(
+                'foo', Interval(start=start + timedelta(minutes=5), delta=timedelta(minutes=60)),
+                step=1200, funcs=['avg', 'max', 'count'], fields=['cpu'])
+
+            self.assertEqual(['cpu'], list(result['fields']))
+            self.assertEqual([1520080500.0, 1520081700.0, 1520082900.0], result['timestamps'].tolist())
+            cpu = result['fields']['cpu']
+            self.assertEqual([20, 20, 16], cpu['count'].tolist())
+            self.assertEqual([14.5, 34.5, 55.0], cpu['avg'].tolist())
+            self.assertEqual([24.0, 44.0, 100.0], cpu['max'].tolist())
+
+    def test_aggregate_empty_check_empty_result(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600)
+            result = store.aggregate('foo', Interval(start=dt('2018-03-03T12:30:00'), delta=timedelta(hours=1)), 60)
+            self.assertEqual([], result['timestamps'].tolist())
+            self.assertEqual({}, result['fields'])
@@ -4,7 +4,9 @@ from datetime import timedelta
 from random import randint
 from unittest import TestCase
 
-from notmany.store.base import BucketBase, StoreBase, Interval
+from notmany.store.base import (
+    BucketBase, StoreBase, Interval, bucket_start, naive_tstamp, merge_series, project_data, record_to_data,
+    get_datetime, get_tstamp)
 from tests.utils import dt
 
 
@@ -271,6 +273,23 @@ class BaseStoreGetBucketsTestCase(TestCase):
                 self.assertEqual(same_bucket.start.minute, 0)
 
 
+class BucketStartTestCase(TestCase):
+
+    def test_bucket_start_check_same_as_get_bucket(self):
+        start = dt('2018-03-03T00:00:00')
+        for size in (60, 300, 420, 600, 3600, 7200, 3 * 3600, 5 * 3600, 24 * 3600):
+            store = DummyStore(bucket_size=size)
+            for _ in range(200):
+                date = start + timedelta(seconds=randint(0, 3 * 24 * 3600))
+                bucket = store._get_bucket('fufu', date)
+                self.assertEqual(
+                    bucket_start(naive_tstamp(date), size),
+                    naive_tstamp(bucket.start))
+
+    def test_bucket_start_with_fraction_check_int(self):
+        self.assertEqual(bucket_start(1520080211.5, 600), 1520080200)
+
+
 class BaseStoreTestCase(TestCase):
 
     def test_assignment_of_bucket_size_raises(self):
@@ -278,3 +297,49 @@ class BaseStoreTestCase(TestCase):
         with self.assertRaises(AttributeError):
             store.bucket_size = 1
 
+
+
+class MergeSeriesTestCase(TestCase):
+    streams = [
+        [[(1.0, 'a:1'), (3.0, 'a:3')], [(600.0, 'a:600')]],
+        [[(2.0, 'b:2'), (3.0, 'b:3')]],
+        [],
+    ]
+
+    def test_merge_series_check_ordered_by_timestamp(self):
+        self.assertEqual(
+            [('a', 1.0, 'a:1'), ('b', 2.0, 'b:2'), ('a', 3.0, 'a:3'), ('b', 3.0, 'b:3'), ('a', 600.0, 'a:600')],
+            list(merge_series(['a', 'b', 'c'], self.streams)))
+
+    def test_merge_series_wide_check_aligned_rows(self):
+        self.assertEqual(
+            [(1.0, ['a:1', None, None]), (2.0, [None, 'b:2', None]), (3.0, ['a:3', 'b:3', None]),
+             (600.0, ['a:600', None, None])],
+            list(merge_series(['a', 'b', 'c'], self.streams, wide=True)))
+
+
+class ProjectDataTestCase(TestCase):
+
+    def test_project_data_check_only_requested_fields(self):
+        record = 'cpu:7.5,mem:8,cpu_user:3,disk:1'
+        self.assertEqual('cpu:7.5', project_data(record, ['cpu']))
+        self.assertEqual('disk:1,cpu_user:3', project_data(record, ['disk', 'cpu_user']))
+        self.assertEqual('mem:8', project_data(record, ['mem', 'swap']))
+        self.assertEqual('', project_data(record, ['user']))
+
+    def test_record_to_data_with_fields_check_parsed(self):
+        self.assertEqual({'mem': 8.0}, record_to_data('cpu:7.5,mem:8', fields=['mem']))
+        self.assertEqual({}, record_to_data('cpu:7.5,mem:8', fields=['swap']))
+
+
+class GetTstampTestCase(TestCase):
+
+    def test_get_tstamp_check_same_as_datetime_path(self):
+        for timestamp in ('2018-03-03T12:30:00', '2018-03-03T12:30:00.5', '2016-02-29T23:59:59.000001',
+                          1520080200, 1520080200.25, 1520080200.1234567, dt('2018-03-03T12:30:00')):
+            self.assertEqual(naive_tstamp(get_datetime(timestamp)), get_tstamp(timestamp), timestamp)
+
+    def test_get_tstamp_with_invalid_string_check_raises(self):
+        for timestamp in ('2018-02-30T12:30:00', '2018-03-03 12:30:00', '2018-03-03T12:30:00.', '2018-03-03T25:00:00'):
+            with self.assertRaises(ValueError):
+                get_tstamp(timestamp)
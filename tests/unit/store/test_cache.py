@@ -0,0 +1,93 @@
+from datetime import timedelta
+from unittest import TestCase
+
+from notmany.store.base import Interval, naive_tstamp
+from notmany.store.cache import BucketCache
+from notmany.store.columnar import ColumnarBucket
+from notmany.store.file import Store, Bucket
+from tests.utils import dt, temporary_directory
+
+
+class BucketCacheTestCase(TestCase):
+
+    def test_get_check_counters_and_invalidation(self):
+        cache = BucketCache(max_bytes=100)
+        self.assertIsNone(cache.get(('a', 'records'), (1, 10, 5)))
+        cache.put(('a', 'records'), (1, 10, 5), ['x'], 10)
+        self.assertEqual(['x'], cache.get(('a', 'records'), (1, 10, 5)))
+        self.assertIsNone(cache.get(('a', 'records'), (1, 20, 6)))
+        self.assertEqual(0, len(cache))
+        self.assertEqual({'entries': 0, 'bytes': 0, 'max_bytes': 100, 'hits': 1, 'misses': 2, 'evictions': 0,
+                          'invalidations': 1}, cache.stats())
+
+    def test_put_check_least_recently_used_evicted(self):
+        cache = BucketCache(max_bytes=100)
+        for key in 'abc':
+            cache.put((key, 'records'), 1, key, 40)
+        self.assertIsNone(cache.get(('a', 'records'), 1))
+        self.assertEqual('b', cache.get(('b', 'records'), 1))
+        cache.put(('d', 'records'), 1, 'd', 40)
+        self.assertIsNone(cache.get(('c', 'records'), 1))
+        self.assertEqual('b', cache.get(('b', 'records'), 1))
+        self.assertEqual(80, cache.bytes)
+        self.assertEqual(2, cache.evictions)
+
+        cache.put(('e', 'records'), 1, 'e', 101)
+        self.assertIsNone(cache.get(('e', 'records'), 1))
+        self.assertEqual(2, len(cache))
+
+
+class CachedBucketTestCase(TestCase):
+    start = dt('2018-03-03T12:30:00')
+
+    def test_read_check_cached_until_appended(self):
+        for bucket_class in (Bucket, ColumnarBucket):
+            with temporary_directory() as tem_dir:
+                cache = BucketCache()
+                bucket = bucket_class(name='foo', start=self.start, length=600, base=tem_dir, cache=cache)
+                tstamp = naive_tstamp(self.start)
+                bucket.extend([(tstamp + i, 'cpu:{}'.format(i)) for i in range(10)])
+
+                records = list(bucket.read())
+                self.assertEqual(records, list(bucket.read()))
+                self.assertEqual(1, cache.hits)
+
+                bucket.append(tstamp + 10, 'cpu:10,mem:1')
+                self.assertEqual(11, len(list(bucket.read())))
+                self.assertEqual(1, cache.invalidations)
+
+                timestamps, columns = bucket.arrays(fields=['mem'])
+                self.assertEqual(['mem'], list(columns))
+                self.assertFalse(timestamps.flags.writeable)
+                self.assertEqual(records[2:5], list(bucket.read_range(tstamp + 2, tstamp + 4)))
+
+    def test_compress_check_invalidated(self):
+        with temporary_directory() as tem_dir:
+            cache = BucketCache()
+            bucket = Bucket(name='foo', start=self.start, length=600, base=tem_dir, cache=cache)
+            bucket.append(naive_tstamp(self.start), 'cpu:1')
+            records = list(bucket.read())
+            bucket.compress('zlib')
+            self.assertEqual(records, list(bucket.read()))
+            self.assertEqual(1, cache.invalidations)
+            self.assertEqual(records, list(bucket.read()))
+            self.assertEqual(1, cache.hits)
+
+
+class CachedStoreTestCase(TestCase):
+    start = dt('2018-03-03T12:00:00')
+
+    def test_retrieve_check_hits(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600, cache=BucketCache())
+            store.record_many('foo', [(self.start + timedelta(seconds=i), 'cpu:{}'.format(i)) for i in range(1200)])
+            interval = Interval(start=self.start + timedelta(seconds=300), delta=timedelta(seconds=600))
+
+            records = list(store.retrieve('foo', interval))
+            self.assertEqual(601, len(records))
+            self.assertEqual(records, list(store.retrieve('foo', interval)))
+            self.assertEqual({'hits': 2, 'misses': 2}, dict(
+                (key, value) for key, value in store.cache.stats().items() if key in ('hits', 'misses')))
+
+            store.record('foo', self.start + timedelta(seconds=301), 'cpu:-1')
+            self.assertEqual(602, len(list(store.retrieve('foo', interval))))
@@ -0,0 +1,131 @@
+import os
+from datetime import timedelta
+from unittest import TestCase
+
+import numpy
+
+from notmany.store.base import Interval
+from notmany.store.columnar import ColumnarBucket
+from notmany.store.file import Store
+from tests.utils import dt, temporary_directory
+
+
+class ColumnarBucketTestCase(TestCase):
+
+    def setUp(self):
+        self.start = dt('2018-03-03T12:30:00')
+
+    def make_buck(self, base):
+        return ColumnarBucket(name='some', start=self.start, length=300, base=base)
+
+    def test_read_with_no_file_check_return_value(self):
+        with temporary_directory() as temp_dir:
+            buck = self.make_buck(temp_dir)
+            self.assertEqual([], list(buck.read()))
+            self.assertIsNone(buck.fields())
+
+    def test_append_check_read_back(self):
+        with temporary_directory() as temp_dir:
+            buck = self.make_buck(temp_dir)
+            buck.append(123456, 'cpu:7,some:8.4')
+            buck.append(123457, 'cpu:8,some:8.5')
+            self.assertEqual(['cpu', 'some'], buck.fields())
+            self.assertEqual([
+                (123456.0, 'cpu:7.0,some:8.4'),
+                (123457.0, 'cpu:8.0,some:8.5'),
+            ], list(buck))
+            self.assertEqual(
+                ['123456.0 cpu:7.0,some:8.4\n123457.0 cpu:8.0,some:8.5\n'], list(buck.raw()))
+
+    def test_extend_check_fixed_width(self):
+        with temporary_directory() as temp_dir:
+            buck = self.make_buck(temp_dir)
+            buck.extend([(123456 + i, 'cpu:{},mem:4400'.format(i)) for i in range(10)])
+            size = os.path.getsize(buck.full_path)
+            buck.extend([(123466 + i, 'cpu:{},mem:4400'.format(i)) for i in range(10)])
+            # second block holds just the row count and 3 columns
+            self.assertEqual(os.path.getsize(buck.full_path) - size, 4 + 10 * 3 * 8)
+
+    def test_arrays_check_columns(self):
+        with temporary_directory() as temp_dir:
+            buck = self.make_buck(temp_dir)
+            buck.extend([(123456, 'cpu:7,mem:1'), (123457, 'cpu:8,mem:2')])
+            buck.append(123458, 'cpu:9,mem:3')
+            timestamps, columns = buck.arrays()
+            numpy.testing.assert_array_equal(timestamps, [123456, 123457, 123458])
+            numpy.testing.assert_array_equal(columns['cpu'], [7, 8, 9])
+            numpy.testing.assert_array_equal(columns['mem'], [1, 2, 3])
+
+            _, columns = buck.arrays(fields=['mem'])
+            self.assertEqual(['mem'], list(columns))
+
+    def test_arrays_of_closed_bucket_check_mapped_view(self):
+        with temporary_directory() as temp_dir:
+            buck = self.make_buck(temp_dir)
+            self.assertTrue(buck.closed)
+            buck.extend([(123456, 'cpu:7,mem:1'), (123457, 'cpu:8,mem:2')])
+            timestamps, columns = buck.arrays()
+            self.assertFalse(timestamps.flags.owndata)
+            self.assertFalse(columns['cpu'].flags.writeable)
+            numpy.testing.assert_array_equal(columns['cpu'], [7, 8])
+
+    def test_seal_check_single_sorted_block(self):
+        with temporary_directory() as temp_dir:
+            buck = self.make_buck(temp_dir)
+            buck.extend([(123458, 'cpu:9'), (123456, 'cpu:7')])
+            buck.append(123456, 'cpu:8')
+            self.assertEqual([123456.0, 123458.0], buck.seal(dedupe=True))
+            self.assertTrue(buck.sealed)
+            self.assertEqual([(123456.0, 'cpu:8.0'), (123458.0, 'cpu:9.0')], list(buck))
+            # header and one block with two rows
+            self.assertEqual(os.path.getsize(buck.full_path), 8 + 3 + 4 + 2 * 2 * 8)
+
+    def test_append_new_field_check_bucket_widened(self):
+        with temporary_directory() as temp_dir:
+            buck = self.make_buck(temp_dir)
+            buck.append(123456, 'cpu:7')
+            buck.append(123457, 'mem:2')
+            self.assertEqual(['cpu', 'mem'], buck.fields())
+            self.assertEqual([
+                (123456.0, 'cpu:7.0'),
+                (123457.0, 'mem:2.0'),
+            ], list(buck))
+
+    def test_read_not_columnar_file_check_raises(self):
+        with temporary_directory() as temp_dir:
+            buck = self.make_buck(temp_dir)
+            os.makedirs(buck.dir)
+            with open(buck.full_path, 'w') as fp:
+                fp.write('123456 cpu:7\n')
+            with self.assertRaises(ValueError):
+                list(buck.read())
+
+
+class ColumnarStoreTestCase(TestCase):
+
+    def test_retrieve_with_columnar_buckets_check_all_retrieved(self):
+        start = dt('2018-03-03T12:30:00')
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600, bucket_class=ColumnarBucket)
+            store.record_many('foo', [(start + timedelta(minutes=i), 'pending:{}'.format(i)) for i in range(20)])
+            store.record('foo', start + timedelta(minutes=20), 'pending:20')
+            records = list(store.retrieve('foo', interval=Interval(start=start, delta=timedelta(minutes=20))))
+            self.assertEqual(21, len(records))
+            self.assertEqual((1520080200.0, 'pending:0.0'), records[0])
+            self.assertEqual((1520081400.0, 'pending:20.0'), records[-1])
+
+            arrays = list(store.retrieve_arrays('foo', interval=Interval(start=start, delta=timedelta(minutes=20))))
+            self.assertEqual(3, len(arrays))
+            numpy.testing.assert_array_equal(arrays[0][1]['pending'], range(10))
+            numpy.testing.assert_array_equal(arrays[2][1]['pending'], [20])
+
+    def test_retrieve_with_fields_check_projected(self):
+        start = dt('2018-03-03T12:30:00')
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600, bucket_class=ColumnarBucket)
+            store.record_many('foo', [(start + timedelta(minutes=i), 'cpu:{},mem:1'.format(i)) for i in range(3)])
+            store.record('foo', start + timedelta(minutes=3), 'mem:2')
+            interval = Interval(start=start + timedelta(minutes=1), delta=timedelta(minutes=5))
+            self.assertEqual([(1520080260.0, 'cpu:1.0'), (1520080320.0, 'cpu:2.0')],
+                             list(store.retrieve('foo', interval=interval, fields=['cpu'])))
+            self.assertEqual(4, len(list(store.retrieve('foo', fields=['mem', 'cpu']))))
@@ -0,0 +1,141 @@
+import gzip
+import os
+import zlib
+from datetime import timedelta
+from unittest import TestCase
+
+from notmany.store.base import Interval, naive_tstamp
+from notmany.store.columnar import ColumnarBucket
+from notmany.store.file import Store, Bucket
+from tests.utils import dt, temporary_directory
+
+
+class CompressedBucketTestCase(TestCase):
+    start = dt('2018-03-03T12:30:00')
+
+    def make_bucket(self, tem_dir, bucket_class=Bucket):
+        bucket = bucket_class(name='foo', start=self.start, length=600, base=tem_dir)
+        tstamp = naive_tstamp(self.start)
+        bucket.extend([(tstamp + i, 'cpu:{}'.format(i)) for i in range(10)])
+        return bucket
+
+    def test_compress_check_reads_unchanged(self):
+        for codec, suffix in (('zlib', '.gz'), ('lzma', '.xz')):
+            with temporary_directory() as tem_dir:
+                bucket = self.make_bucket(tem_dir)
+                records = list(bucket.read())
+                raw = ''.join(bucket.raw())
+                low, high = records[2][0], records[4][0]
+
+                self.assertTrue(bucket.compress(codec))
+                self.assertFalse(os.path.exists(bucket.full_path))
+                self.assertEqual(bucket.full_path + suffix, bucket.compressed_path)
+
+                self.assertEqual(records, list(bucket.read()))
+                self.assertEqual(raw, ''.join(bucket.raw(size=7)))
+                self.assertEqual(records[2:5], list(bucket.read_range(low, high, ordered=True)))
+                self.assertEqual(records[2:5], list(bucket.read_range(low, high)))
+                self.assertEqual(
+                    '1520080202.0 cpu:2\n1520080203.0 cpu:3\n1520080204.0 cpu:4\n',
+                    ''.join(bucket.raw_range(low, high, ordered=True)))
+                self.assertEqual(raw.encode('utf-8'), bucket.view().tobytes())
+                self.assertFalse(bucket.compress(codec))
+
+    def test_append_to_compressed_check_decompressed(self):
+        with temporary_directory() as tem_dir:
+            bucket = self.make_bucket(tem_dir)
+            bucket.compress('zlib')
+            bucket.append(naive_tstamp(self.start) + 20, 'cpu:20')
+            self.assertIsNone(bucket.compressed_path)
+            self.assertEqual(11, len(list(bucket.read())))
+
+    def test_gzip_raw_check_stored_bytes_sent(self):
+        with temporary_directory() as tem_dir:
+            bucket = self.make_bucket(tem_dir)
+            raw = ''.join(bucket.raw())
+            self.assertEqual(raw, gzip.decompress(b''.join(bucket.gzip_raw())).decode('utf-8'))
+
+            bucket.compress('zlib')
+            with open(bucket.compressed_path, 'rb') as fp:
+                self.assertEqual(fp.read(), b''.join(bucket.gzip_raw()))
+
+    def test_gzip_raw_columnar_check_raw_content_sent(self):
+        with temporary_directory() as tem_dir:
+            bucket = self.make_bucket(tem_dir, ColumnarBucket)
+            raw = ''.join(bucket.raw())
+            bucket.compress('zlib')
+            self.assertIsNone(bucket.stored_gzip)
+            self.assertEqual(raw, gzip.decompress(b''.join(bucket.gzip_raw())).decode('utf-8'))
+
+    def test_compress_columnar_check_arrays(self):
+        with temporary_directory() as tem_dir:
+            bucket = self.make_bucket(tem_dir, ColumnarBucket)
+            timestamps, columns = bucket.arrays()
+            bucket.compress('lzma')
+            self.assertEqual(['cpu'], bucket.fields())
+            compressed_timestamps, compressed_columns = bucket.arrays()
+            self.assertEqual(timestamps.tolist(), compressed_timestamps.tolist())
+            self.assertEqual(columns['cpu'].tolist(), compressed_columns['cpu'].tolist())
+
+
+class StoreCompressionTestCase(TestCase):
+    start = dt('2018-03-03T12:00:00')
+
+    def make_store(self, tem_dir, **kwargs):
+        store = Store(directory=tem_dir, bucket_size=600, **kwargs)
+        store.record_many('foo', [(self.start + timedelta(seconds=30 * i), 'cpu:{}'.format(i)) for i in range(80)])
+        return store
+
+    def test_compress_check_old_buckets_compressed(self):
+        with temporary_directory() as tem_dir:
+            store = self.make_store(tem_dir, compression='zlib', compress_after=600)
+            records = list(store.retrieve('foo'))
+
+            # buckets ending 10 minutes before 12:30
+            self.assertEqual(2, store.compress('foo', before=self.start + timedelta(minutes=30)))
+            buckets = list(store.get_all('foo'))
+            self.assertEqual(4, len(buckets))
+            self.assertEqual([True, True, False, False], [bucket.compressed_path is not None for bucket in buckets])
+            self.assertEqual(records, list(store.retrieve('foo')))
+
+            interval = Interval(start=self.start + timedelta(minutes=5), delta=timedelta(minutes=20))
+            self.assertEqual(
+                [record for record in records if 300 <= record[0] - naive_tstamp(self.start) <= 1500],
+                list(store.retrieve('foo', interval)))
+
+    def test_retrieve_gzip_check_same_as_raw(self):
+        with temporary_directory() as tem_dir:
+            store = self.make_store(tem_dir, compression='zlib', compress_after=0)
+            store.compress('foo', before=self.start + timedelta(minutes=20))
+            interval = Interval(start=self.start + timedelta(minutes=5), delta=timedelta(minutes=30))
+            for interval in (Interval(start=self.start + timedelta(minutes=5), delta=timedelta(minutes=30)),
+                             None):
+                # single member, clients reading only the first one get it all
+                decompressor = zlib.decompressobj(31)
+                self.assertEqual(
+                    ''.join(store.retrieve_raw('foo', interval)),
+                    decompressor.decompress(b''.join(store.retrieve_gzip('foo', interval))).decode('utf-8'))
+                self.assertEqual(b'', decompressor.unused_data)
+
+            # a bucket making up the whole response is sent as stored
+            store.record_many('one', [(self.start + timedelta(seconds=i), 'cpu:{}'.format(i)) for i in range(5)])
+            store.compress('one', before=self.start + timedelta(minutes=20))
+            with open(store._create_bucket('one', self.start).compressed_path, 'rb') as fp:
+                self.assertEqual(fp.read(), b''.join(store.retrieve_gzip('one')))
+            self.assertEqual(b'', gzip.decompress(b''.join(store.retrieve_gzip('bar'))))
+
+    def test_append_after_store_compressed_write_bucket_check_decompressed(self):
+        with temporary_directory() as tem_dir:
+            store = self.make_store(tem_dir, compression='zlib', compress_after=0)
+            self.assertTrue(store._write_bucket('foo', naive_tstamp(self.start)).writable)
+            store.compress('foo', before=self.start + timedelta(minutes=20))
+            store.record('foo', self.start + timedelta(seconds=1), 'cpu:late')
+            self.assertIsNone(store._create_bucket('foo', self.start).compressed_path)
+            self.assertEqual(81, len(list(store.retrieve('foo'))))
+
+    def test_unknown_codec_check_raises(self):
+        with temporary_directory() as tem_dir:
+            with self.assertRaises(ValueError):
+                Store(directory=tem_dir, compression='brotli')
+            with self.assertRaises(ValueError):
+                Store(directory=tem_dir).compress('foo')
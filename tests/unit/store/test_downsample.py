@@ -0,0 +1,88 @@
+import math
+from unittest import TestCase
+
+from notmany.store.downsample import LTTB, MinMax, downsample, MAX_CANDIDATES
+
+
+def sine(count):
+    return [(float(i), math.sin(i / 50.0) * 10) for i in range(count)]
+
+
+class LTTBTestCase(TestCase):
+
+    def sample(self, points, count):
+        sampler = LTTB(0, count - 1, count)
+        for tstamp, value in points:
+            sampler.add(tstamp, value)
+        return sampler.finish()
+
+    def test_downsample_check_bounded_and_ends_kept(self):
+        points = sine(10000)
+        kept = self.sample(points, 100)
+        self.assertLessEqual(len(kept), 100)
+        self.assertGreater(len(kept), 90)
+        self.assertEqual(points[0], kept[0])
+        self.assertEqual(points[-1], kept[-1])
+        self.assertEqual(sorted(kept), kept)
+        # peaks of the sine survive
+        self.assertGreater(max(value for _, value in kept), 9.9)
+        self.assertLess(min(value for _, value in kept), -9.9)
+
+    def test_few_points_check_all_kept(self):
+        points = [(0.0, 1.0), (5.0, 3.0), (9.0, 2.0)]
+        self.assertEqual(points, self.sample(points, 10))
+        self.assertEqual(points[:1], self.sample(points[:1], 10))
+        self.assertEqual([], self.sample([], 10))
+
+    def test_spike_check_selected(self):
+        points = [(float(i), 0.0) for i in range(100)]
+        points[42] = (42.0, 100.0)
+        sampler = LTTB(0, 99, 12)
+        for tstamp, value in points:
+            sampler.add(tstamp, value)
+        self.assertIn((42.0, 100.0), sampler.finish())
+
+    def test_long_bucket_check_candidates_bounded(self):
+        points = [(float(i), float(i * 7919 % 1000)) for i in range(20000)]
+        sampler = LTTB(0, 19999, 3)
+        largest = 0
+        for tstamp, value in points:
+            sampler.add(tstamp, value)
+            largest = max(largest, len(sampler._current.points) if sampler._current else 0)
+        self.assertLessEqual(largest, MAX_CANDIDATES)
+
+        (a_x, a_y), (c_x, c_y) = points[0], points[-1]
+        best = max(points[1:-1], key=lambda p: abs((a_x - c_x) * (p[1] - a_y) - (a_x - p[0]) * (c_y - a_y)))
+        self.assertEqual([points[0], best, points[-1]], sampler.finish())
+
+    def test_too_few_points_check_error(self):
+        with self.assertRaises(ValueError):
+            LTTB(0, 10, 2)
+
+
+class MinMaxTestCase(TestCase):
+
+    def test_downsample_check_extremes_in_time_order(self):
+        sampler = MinMax(0, 100, 4)
+        for tstamp, value in [(0, 5.0), (10, 1.0), (20, 9.0), (60, 3.0), (70, 3.0), (99, 4.0)]:
+            sampler.add(tstamp, value)
+        self.assertEqual([(10, 1.0), (20, 9.0), (60, 3.0), (99, 4.0)], sampler.finish())
+
+
+class DownsampleTestCase(TestCase):
+
+    def test_downsample_check_fields_separately(self):
+        records = [(float(i), 'cpu:{},mem:{}'.format(i % 7, i) if i % 2 else 'cpu:{}'.format(i % 7))
+                   for i in range(1000)]
+        result = downsample(records, 0, 999, 50)
+        self.assertEqual(['cpu', 'mem'], sorted(result))
+        self.assertLessEqual(len(result['cpu']), 50)
+        self.assertEqual((999.0, 999.0), result['mem'][-1])
+
+        result = downsample(records, 0, 999, 50, method='minmax', fields=['mem'])
+        self.assertEqual(['mem'], list(result))
+        self.assertLessEqual(len(result['mem']), 50)
+
+    def test_unknown_method_check_error(self):
+        with self.assertRaises(ValueError):
+            downsample([], 0, 10, 10, method='avg')
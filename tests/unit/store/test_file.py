@@ -1,12 +1,16 @@
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, datetime
 from tempfile import gettempdir
 from unittest import TestCase
 from uuid import uuid4
 
-from notmany.store.file import Store, Bucket, DEFAULT_DIR_NAME
+import numpy
+
+from notmany.store.file import Store, Bucket, DEFAULT_DIR_NAME, seek_line
 from notmany.store.base import StoreSetupError, Interval
+from notmany.store.gorilla import GorillaBucket
 
 # TODO Add prevention form running this test as root as this will invalidate the test
 # and can be done easily by mistake
@@ -128,6 +132,93 @@ class FileBucketTestCase(TestCase):
             buck.delete()
             self.assertFalse(os.path.exists(buck.full_path))
 
+    def test_arrays_with_file_existing_check_columns(self):
+        with temporary_directory() as temp_dir:
+            buck, _ = self.make_buck(base=temp_dir)
+            buck.append(123456, 'cpu:7,some:8.4')
+            buck.append(123457, 'cpu:8')
+            timestamps, columns = buck.arrays()
+            self.assertListEqual([123456.0, 123457.0], timestamps.tolist())
+            self.assertListEqual([7.0, 8.0], columns['cpu'].tolist())
+            self.assertEqual(8.4, columns['some'][0])
+            self.assertTrue(numpy.isnan(columns['some'][1]))
+            self.assertListEqual(['cpu'], list(buck.arrays(fields=['cpu'])[1]))
+
+    def test_view_check_content(self):
+        with temporary_directory() as temp_dir:
+            buck, _ = self.make_buck(base=temp_dir)
+            self.assertEqual(b'', buck.view().tobytes())
+            buck.append(123456, 'cpu:7,some:8.4')
+            self.assertEqual(b'123456 cpu:7,some:8.4\n', buck.view().tobytes())
+
+    def test_closed_check_end_of_bucket_in_past(self):
+        buck, _ = self.make_buck()
+        self.assertEqual(buck.end, dt('2018-03-03T12:35:00'))
+        self.assertTrue(buck.closed)
+        now = datetime.now()
+        buck = Bucket(name='some', start=now, length=300, base='tmp1')
+        self.assertFalse(buck.closed)
+
+    def test_read_range_check_only_records_in_range(self):
+        with temporary_directory() as temp_dir:
+            buck, _ = self.make_buck(base=temp_dir)
+            buck.extend([(123456, 'cpu:7'), (123459, 'cpu:8'), (123457, 'cpu:9'), (123460, 'cpu:1')])
+            self.assertEqual([(123459.0, 'cpu:8'), (123457.0, 'cpu:9')], list(buck.read_range(123457, 123459)))
+            self.assertEqual(['123459 cpu:8\n123457 cpu:9\n'], list(buck.raw_range(123457, 123459)))
+
+    def test_read_range_ordered_check_bisected(self):
+        with temporary_directory() as temp_dir:
+            buck, _ = self.make_buck(base=temp_dir)
+            buck.extend([(123450 + i, 'cpu:{}'.format(i)) for i in range(10)])
+            self.assertEqual(
+                [(123452.0, 'cpu:2'), (123453.0, 'cpu:3')], list(buck.read_range(123451.5, 123453, ordered=True)))
+            self.assertEqual([], list(buck.read_range(123460, 123470, ordered=True)))
+            self.assertEqual(10, len(list(buck.read_range(0, 123470, ordered=True))))
+            self.assertEqual(
+                ['123458 cp', 'u:8\n12345', '9 cpu:9\n'], list(buck.raw_range(123458, 123470, ordered=True, size=9)))
+
+    def test_seal_check_sorted_and_marked(self):
+        with temporary_directory() as temp_dir:
+            buck, _ = self.make_buck(base=temp_dir)
+            self.assertEqual([], buck.seal())
+            buck.append(123457, 'cpu:8,some:8.4')
+            buck.append(123456, 'cpu:7,some:8.4')
+            buck.append(123457, 'cpu:9,some:8.4')
+            self.assertFalse(buck.sealed)
+            self.assertEqual([123456.0, 123457.0, 123457.0], buck.seal())
+            self.assertTrue(buck.sealed)
+            self.assertEqual(
+                '123456 cpu:7,some:8.4\n123457 cpu:8,some:8.4\n123457 cpu:9,some:8.4\n',
+                file_content(buck.full_path))
+            self.assertEqual(['12_30_00', '12_30_00.sealed'], sorted(os.listdir(buck.dir)))
+
+    def test_seal_with_dedupe_check_last_kept(self):
+        with temporary_directory() as temp_dir:
+            buck, _ = self.make_buck(base=temp_dir)
+            buck.extend([(123457, 'cpu:8'), (123456, 'cpu:7'), (123457, 'cpu:9')])
+            self.assertEqual([123456.0, 123457.0], buck.seal(dedupe=True))
+            self.assertEqual('123456 cpu:7\n123457 cpu:9\n', file_content(buck.full_path))
+
+    def test_append_to_sealed_check_unsealed(self):
+        with temporary_directory() as temp_dir:
+            buck, _ = self.make_buck(base=temp_dir)
+            buck.append(123457, 'cpu:8')
+            buck.seal()
+            buck.append(123456, 'cpu:7')
+            self.assertFalse(buck.sealed)
+            buck.delete()
+            self.assertEqual([], os.listdir(buck.dir))
+
+    def test_seek_line_check_offsets(self):
+        content = b'10 a\n20 b\n20 c\n30 d\n'
+        self.assertEqual(0, seek_line(content, 5))
+        self.assertEqual(0, seek_line(content, 10))
+        self.assertEqual(5, seek_line(content, 11))
+        self.assertEqual(5, seek_line(content, 20))
+        self.assertEqual(15, seek_line(content, 20, after=True))
+        self.assertEqual(20, seek_line(content, 31))
+        self.assertEqual(0, seek_line(b'', 31))
+
     def test_create_from_file(self):
         base = os.path.join('tmp1')
         dire = os.path.join(base, 'some', '420', '2018_03_02')
@@ -214,7 +305,32 @@ class FileStoreTestCase(TestCase):
         self.fail()
 
     def test_get_all_check_all(self):
-        self.fail()
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600)
+            store.record(name='some', timestamp=self.start + timedelta(hours=5, minutes=20), data='pending:3')
+            store.record(name='some', timestamp=self.start, data='pending:7')
+            store.record(name='some', timestamp=self.start + timedelta(minutes=20), data='pending:7')
+            store.record(name='some', timestamp=self.start + timedelta(seconds=1), data='pending:8')
+            store.record(name='some', timestamp=self.start - timedelta(days=40), data='pending:1')
+            store.record(name='other', timestamp=self.start, data='pending:2')
+
+            buckets = list(store.get_all('some'))
+            self.assertListEqual([
+                dt('2018-01-22T12:30:00'),
+                dt('2018-03-03T12:30:00'),
+                dt('2018-03-03T12:50:00'),
+                dt('2018-03-03T17:50:00'),
+            ], [bucket.start for bucket in buckets])
+            self.assertEqual(5, len(list(store.retrieve('some'))))
+            self.assertEqual([], list(store.get_all('missing')))
+
+    def test_forget_without_interval_check_namespace_deleted(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600)
+            store.record(name='some', timestamp=self.start, data='pending:1')
+            store.record(name='some', timestamp=self.start + timedelta(days=3), data='pending:1')
+            store.forget(name='some')
+            self.assertEqual([], os.listdir(tem_dir))
 
     def test_retrieve_with_interval_check_all_data_points_retrieved(self):
 
@@ -266,6 +382,92 @@ class FileStoreTestCase(TestCase):
                 '1520116200.0 pending:10\n1520116200.0 pending:10\n'
             ], records)
 
+    def test_retrieve_with_interval_check_edges_trimmed(self):
+        with temporary_directory() as tem_dir:
+            for manifest in (False, True):
+                store = Store(directory=os.path.join(tem_dir, str(manifest)), bucket_size=600, manifest=manifest)
+                store.record_many('foo', [(self.start + timedelta(minutes=i), 'pending:{}'.format(i))
+                                          for i in range(60)])
+                interval = Interval(start=self.start + timedelta(minutes=5, seconds=30), delta=timedelta(minutes=20))
+
+                records = list(store.retrieve('foo', interval=interval))
+                self.assertEqual(['pending:{}'.format(i) for i in range(6, 26)], [r[1] for r in records])
+
+                raw = ''.join(store.retrieve_raw('foo', interval=interval))
+                self.assertEqual(20, raw.count('\n'))
+                self.assertTrue(raw.startswith('1520080560.0 pending:6\n'))
+
+                arrays = list(store.retrieve_arrays('foo', interval=interval))
+                self.assertEqual(list(range(6, 26)), [int(v) for _, c in arrays for v in c['pending']])
+
+    def test_compact_check_closed_buckets_sealed(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600, dedupe=True)
+            store.record('foo', self.start + timedelta(seconds=2), 'pending:2')
+            store.record('foo', self.start + timedelta(seconds=1), 'pending:1')
+            store.record('foo', self.start + timedelta(seconds=1), 'pending:3')
+            store.record('foo', self.start + timedelta(minutes=10), 'pending:4')
+
+            self.assertEqual(1, store.compact('foo', before=self.start + timedelta(minutes=15)))
+            buckets = list(store.get_all('foo'))
+            self.assertEqual([True, False], [bucket.sealed for bucket in buckets])
+            self.assertEqual(['pending:3', 'pending:2'], [data for _, data in buckets[0]])
+            self.assertEqual(1, store.compact('foo'))
+            self.assertEqual(0, store.compact('foo'))
+
+    def test_append_after_compact_in_future_check_open_bucket_not_sealed(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=3600)
+            start = datetime.now().replace(minute=0, second=0, microsecond=0)
+            store.record('foo', start + timedelta(minutes=10), 'cpu:10')
+            self.assertEqual(0, store.compact('foo', before=start + timedelta(days=1)))
+            store.record('foo', start + timedelta(minutes=5), 'cpu:5')
+            store.record('foo', start + timedelta(minutes=15), 'cpu:15')
+
+            interval = Interval(start=start + timedelta(minutes=4), delta=timedelta(minutes=12))
+            self.assertEqual(['cpu:5', 'cpu:10', 'cpu:15'],
+                             sorted([data for _, data in store.retrieve('foo', interval)], key=lambda d: int(d[4:])))
+
+    def test_record_with_auto_seal_check_previous_bucket_sealed(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600, auto_seal=True, manifest=True)
+            store.record('foo', self.start + timedelta(seconds=2), 'pending:2')
+            store.record('foo', self.start + timedelta(seconds=1), 'pending:1')
+            self.assertFalse(store.get_manifest('foo').ordered(1520080200))
+            store.record('foo', self.start + timedelta(minutes=10), 'pending:3')
+            buckets = list(store.get_all('foo'))
+            self.assertEqual([True, False], [bucket.sealed for bucket in buckets])
+            self.assertTrue(store.get_manifest('foo').ordered(1520080200))
+
+            interval = Interval(start=self.start + timedelta(seconds=2), delta=timedelta(minutes=10))
+            self.assertEqual(['pending:2', 'pending:3'], [data for _, data in store.retrieve('foo', interval)])
+
+    def test_record_many_check_grouped_by_bucket(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600)
+            store.record_many('foo', [
+                (self.start, 'cpu:1'),
+                (self.start + timedelta(minutes=11), 'cpu:3'),
+                (self.start + timedelta(minutes=1), 'cpu:2'),
+            ])
+            base = os.path.join(tem_dir, 'foo', '600', '2018_03_03')
+            self.assertEqual(
+                '1520080200.0 cpu:1\n1520080260.0 cpu:2\n', file_content(base, '12_30_00'))
+            self.assertEqual('1520080860.0 cpu:3\n', file_content(base, '12_40_00'))
+
+    def test_record_many_series_check_each_series_written(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600)
+            store.record_many_series([
+                ('foo', self.start, 'cpu:1'),
+                ('bar', self.start, 'cpu:2'),
+                ('foo', self.start + timedelta(seconds=1), 'cpu:3'),
+            ])
+            interval = Interval(start=self.start, delta=timedelta(minutes=5))
+            self.assertListEqual(
+                [(1520080200.0, 'cpu:1'), (1520080201.0, 'cpu:3')], list(store.retrieve('foo', interval)))
+            self.assertListEqual([(1520080200.0, 'cpu:2')], list(store.retrieve('bar', interval)))
+
     def test_record_metric_with_no_buckets_check_buckets_created(self):
         with temporary_directory() as tem_dir:
             self.make_three_buckets(tem_dir=tem_dir)
@@ -318,3 +520,95 @@ class FileStoreTestCase(TestCase):
              '1520080200.0 pending:7;cpu:11.6\n',
              '1520081400.0 pending:7;cpu:11.8\n']
         )
+
+
+class PrefetchTestCase(TestCase):
+    start = dt('2018-03-03T12:00:00')
+
+    def test_retrieve_with_prefetch_check_same_order(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600)
+            store.record_many('foo', [(self.start + timedelta(seconds=i * 7), 'cpu:{}'.format(i)) for i in range(2000)])
+            interval = Interval(start=self.start + timedelta(seconds=300), delta=timedelta(hours=3))
+            expected = list(store.retrieve('foo', interval))
+
+            for depth in (1, 4):
+                prefetching = Store(directory=tem_dir, bucket_size=600, prefetch=depth)
+                self.assertEqual(expected, list(prefetching.retrieve('foo', interval)))
+                self.assertEqual(2000, len(list(prefetching.retrieve('foo'))))
+                arrays = list(prefetching.retrieve_arrays('foo', interval, fields=['cpu']))
+                self.assertEqual([tstamp for tstamp, _ in expected],
+                                 numpy.concatenate([timestamps for timestamps, _ in arrays]).tolist())
+                prefetching.close()
+
+
+class RetrieveManyTestCase(TestCase):
+    start = dt('2018-03-03T12:00:00')
+
+    def test_retrieve_many_check_ordered_merge(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600)
+            for host in range(5):
+                store.record_many('host{}'.format(host), [
+                    (self.start + timedelta(seconds=(i * 37 + host) % 3600), 'cpu:{}'.format(host))
+                    for i in range(0, 200)])
+            names = ['host{}'.format(host) for host in range(5)]
+            interval = Interval(start=self.start + timedelta(seconds=100), delta=timedelta(seconds=3000))
+
+            for prefetch in (0, 2):
+                store = Store(directory=tem_dir, bucket_size=600, prefetch=prefetch)
+                records = list(store.retrieve_many(names, interval))
+                expected = sorted([(tstamp, name, data) for name in names
+                                   for tstamp, data in store.retrieve(name, interval)])
+                self.assertEqual(expected, [(tstamp, name, data) for name, tstamp, data in records])
+
+                rows = list(store.retrieve_many(names, interval, wide=True))
+                self.assertEqual(sorted(set(tstamp for tstamp, _, _ in expected)), [tstamp for tstamp, _ in rows])
+                self.assertEqual(len(expected), sum(len([data for data in row if data]) for _, row in rows))
+                store.close()
+
+
+class ProjectionTestCase(TestCase):
+    start = dt('2018-03-03T12:00:00')
+
+    def test_retrieve_with_fields_check_projected(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600)
+            store.record_many('foo', [(self.start + timedelta(seconds=i), 'cpu:{},mem:7,disk:1'.format(i))
+                                      for i in range(3)])
+            store.record('foo', self.start + timedelta(seconds=3), 'mem:8')
+            tstamp = 1520078400.0
+
+            self.assertEqual([(tstamp, 'cpu:0'), (tstamp + 1, 'cpu:1'), (tstamp + 2, 'cpu:2')],
+                             list(store.retrieve('foo', fields=['cpu'])))
+            interval = Interval(start=self.start + timedelta(seconds=2), delta=timedelta(seconds=5))
+            self.assertEqual('{0} disk:1,mem:7\n{1} mem:8\n'.format(tstamp + 2, tstamp + 3),
+                             ''.join(store.retrieve_raw('foo', interval, fields=['disk', 'mem'])))
+            self.assertEqual([('foo', tstamp + 3, 'mem:8')],
+                             list(store.retrieve_many(['foo'], interval, fields=['mem']))[1:])
+
+
+class ThreadsTestCase(TestCase):
+    start = dt('2018-03-03T12:00:00')
+
+    def test_record_and_retrieve_from_threads_check_nothing_lost(self):
+        for bucket_class in (Bucket, GorillaBucket):
+            with temporary_directory() as tem_dir:
+                store = Store(directory=tem_dir, bucket_size=60, bucket_class=bucket_class,
+                              manifest=True, rollups=(600,))
+                interval = Interval(start=self.start, delta=timedelta(hours=1))
+
+                def work(worker):
+                    for i in range(worker, 2400, 8):
+                        store.record('foo', self.start + timedelta(seconds=i), 'cpu:{}'.format(i))
+                        if i % 100 == worker:
+                            list(store.retrieve('foo', interval))
+
+                with ThreadPoolExecutor(max_workers=8) as executor:
+                    list(executor.map(work, range(8)))
+
+                self.assertEqual(list(range(2400)),
+                                 sorted(int(float(data[4:])) for _, data in store.retrieve('foo', interval)))
+                self.assertEqual(40, len(store.get_manifest('foo').starts(0, float('inf'))))
+                store.close()
+                self.assertEqual(4, len(list(store.retrieve_rollup('foo', 600))))
@@ -0,0 +1,119 @@
+import math
+import os
+from datetime import timedelta
+from unittest import TestCase
+
+from notmany.store.base import Interval, naive_tstamp
+from notmany.store import gorilla
+from notmany.store.file import Store
+from notmany.store.gorilla import GorillaBucket, encode_dod, encode_xor, decode_frame, float_bits, bits_to_bytes, \
+    MAX_POINTS
+from tests.utils import dt, temporary_directory
+
+
+class GorillaCodecTestCase(TestCase):
+
+    def test_encode_dod_check_tiers(self):
+        self.assertEqual('0', encode_dod(0))
+        self.assertEqual('10' + '1111111', encode_dod(64))
+        self.assertEqual('10' + '0000000', encode_dod(-63))
+        self.assertEqual(12, len(encode_dod(-64)))
+        self.assertEqual(69, len(encode_dod(1 << 40)))
+
+    def test_encode_xor_check_window_reused(self):
+        first, leading, trailing = encode_xor(float_bits(2.0) ^ float_bits(3.0), None, None)
+        self.assertTrue(first.startswith('11'))
+        second, _, _ = encode_xor(float_bits(2.0) ^ float_bits(3.0), leading, trailing)
+        self.assertTrue(second.startswith('10'))
+        self.assertLess(len(second), len(first))
+        self.assertEqual(('0', leading, trailing), encode_xor(0, leading, trailing))
+
+    def test_decode_frame_check_round_trip(self):
+        bucket_values = [(1520080200000000, 1.5), (1520080201000000, 1.5), (1520080202000000, -7.25),
+                         (1520080202500000, 1e300), (1520080190000000, float('nan'))]
+        stream = format(bucket_values[0][0], '064b') + format(float_bits(bucket_values[0][1]), '064b')
+        delta, leading, trailing = 0, None, None
+        for (previous, previous_value), (tstamp, value) in zip(bucket_values, bucket_values[1:]):
+            stream += encode_dod(tstamp - previous - delta)
+            delta = tstamp - previous
+            code, leading, trailing = encode_xor(float_bits(value) ^ float_bits(previous_value), leading, trailing)
+            stream += code
+
+        timestamps, columns = decode_frame(bits_to_bytes(stream), len(bucket_values), 1)
+        self.assertEqual([tstamp for tstamp, _ in bucket_values], timestamps.tolist())
+        self.assertEqual([float_bits(value) for _, value in bucket_values], columns[0].tolist())
+
+    def test_decode_frame_many_fields_check_round_trip(self):
+        tstamps = [1520080200000000 + step for step in (0, 1000000, 2000000, 2000000, 2000001, 1 << 50, 3 << 50)]
+        rows = [{'a': 1.0, 'b': 2.0}, {'a': 1.0, 'b': 2.0}, {'a': 2.0}, {'a': 3.0, 'b': -2.5},
+                {'a': 3.0, 'b': -2.5}, {'a': 1e-300, 'b': 2.0}, {'a': 1e-300}]
+        encoder = gorilla.Encoder(['a', 'b'], offset=0)
+        for tstamp, values in zip(tstamps, rows):
+            encoder.add(tstamp, values)
+        frame = encoder.frame()
+
+        timestamps, columns = decode_frame(frame[gorilla.FRAME.size + 3:], len(rows), 2)
+        self.assertEqual(tstamps, timestamps.tolist())
+        for field, column in zip(['a', 'b'], columns):
+            self.assertEqual([float_bits(values.get(field, float('nan'))) for values in rows], column.tolist())
+
+
+class GorillaBucketTestCase(TestCase):
+    start = dt('2018-03-03T12:30:00')
+
+    def test_append_and_extend_check_read(self):
+        with temporary_directory() as tem_dir:
+            bucket = GorillaBucket(name='foo', start=self.start, length=600, base=tem_dir)
+            tstamp = naive_tstamp(self.start)
+            bucket.append(tstamp, 'cpu:10,mem:4400')
+            bucket.extend([(tstamp + i, 'cpu:{},mem:4400'.format(10 + i % 3)) for i in range(1, 100)])
+            bucket.append(tstamp + 100.5, 'cpu:7.5')
+            bucket.append(tstamp + 101, 'cpu:1,disk:3')
+
+            records = list(bucket.read())
+            self.assertEqual(102, len(records))
+            self.assertEqual((tstamp, 'cpu:10.0,mem:4400.0'), records[0])
+            self.assertEqual((tstamp + 4, 'cpu:11.0,mem:4400.0'), records[4])
+            self.assertEqual((tstamp + 100.5, 'cpu:7.5'), records[100])
+            self.assertEqual((tstamp + 101, 'cpu:1.0,disk:3.0'), records[101])
+            self.assertEqual(['cpu', 'mem', 'disk'], bucket.fields())
+            self.assertLess(os.path.getsize(bucket.full_path), 100 * 3)
+
+            timestamps, columns = bucket.arrays(fields=['mem'])
+            self.assertEqual(['mem'], list(columns))
+            self.assertTrue(math.isnan(columns['mem'][-1]))
+
+    def test_append_without_cached_encoder_check_new_frame(self):
+        with temporary_directory() as tem_dir:
+            bucket = GorillaBucket(name='foo', start=self.start, length=600, base=tem_dir)
+            tstamp = naive_tstamp(self.start)
+            bucket.append(tstamp, 'cpu:1')
+            gorilla._encoders.clear()
+            bucket.append(tstamp + 1, 'cpu:2')
+            self.assertEqual([(tstamp, 'cpu:1.0'), (tstamp + 1, 'cpu:2.0')], list(bucket.read()))
+
+    def test_seal_check_sorted_and_framed(self):
+        with temporary_directory() as tem_dir:
+            bucket = GorillaBucket(name='foo', start=self.start, length=600, base=tem_dir)
+            tstamp = naive_tstamp(self.start)
+            bucket.extend([(tstamp + (i * 7) % 600, 'cpu:{}'.format(i)) for i in range(MAX_POINTS + 10)])
+            timestamps = bucket.seal(dedupe=True)
+            self.assertEqual(600, len(timestamps))
+            self.assertEqual(sorted(timestamps), [record[0] for record in bucket.read()])
+
+
+class GorillaStoreTestCase(TestCase):
+    start = dt('2018-03-03T12:00:00')
+
+    def test_store_check_retrieve(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600, bucket_class=GorillaBucket)
+            store.record_many('foo', [(self.start + timedelta(seconds=i), 'cpu:{}'.format(i % 5)) for i in range(1800)])
+            for i in range(1800, 1810):
+                store.record('foo', self.start + timedelta(seconds=i), 'cpu:1')
+
+            interval = Interval(start=self.start + timedelta(seconds=590), delta=timedelta(seconds=20))
+            records = list(store.retrieve('foo', interval))
+            self.assertEqual(21, len(records))
+            self.assertEqual((naive_tstamp(self.start) + 590, 'cpu:0.0'), records[0])
+            self.assertEqual(1810, sum(len(timestamps) for timestamps, _ in store.retrieve_arrays('foo')))
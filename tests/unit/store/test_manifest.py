@@ -0,0 +1,145 @@
+import os
+from datetime import timedelta
+from unittest import TestCase
+
+from notmany.store.base import Interval
+from notmany.store.file import Store
+from notmany.store.manifest import Manifest
+from tests.utils import dt, temporary_directory
+
+
+class ManifestTestCase(TestCase):
+
+    def test_update_check_stats(self):
+        manifest = Manifest('some')
+        manifest.update(600, [610.0, 605.0])
+        manifest.update(600, [620.0])
+        manifest.update(0, [1.0])
+        self.assertEqual((3, 605.0, 620.0), manifest.stats(600))
+        self.assertEqual((1, 1.0, 1.0), manifest.stats(0))
+        self.assertIsNone(manifest.stats(1200))
+        self.assertTrue(manifest.dirty)
+
+    def test_starts_check_sorted_and_inclusive(self):
+        manifest = Manifest('some')
+        for start in (3000, 600, 1200, 0):
+            manifest.update(start, [start])
+        self.assertEqual([600, 1200], manifest.starts(600, 1200))
+        self.assertEqual([0, 600, 1200, 3000], manifest.starts(0, 5000))
+        self.assertEqual([], manifest.starts(1800, 2400))
+
+    def test_update_out_of_order_check_not_ordered(self):
+        manifest = Manifest('some')
+        manifest.update(600, [601.0, 602.0])
+        manifest.update(1200, [1201.0])
+        self.assertTrue(manifest.ordered(600))
+        manifest.update(600, [602.0, 603.0])
+        self.assertTrue(manifest.ordered(600))
+        manifest.update(600, [601.5])
+        self.assertFalse(manifest.ordered(600))
+        manifest.update(1200, [1203.0, 1202.0])
+        self.assertFalse(manifest.ordered(1200))
+        self.assertFalse(manifest.ordered(1800))
+
+    def test_remove_check_range_removed(self):
+        manifest = Manifest('some')
+        for start in (0, 600, 1200):
+            manifest.update(start, [start])
+        manifest.remove(600, 1200)
+        self.assertEqual([0, 1200], manifest.starts(0, 5000))
+
+    def test_save_and_load_check_same(self):
+        with temporary_directory() as tem_dir:
+            manifest = Manifest(os.path.join(tem_dir, 'some', '600'))
+            self.assertFalse(manifest.load())
+            manifest.update(600, [610.0, 605.0])
+            manifest.save()
+            self.assertFalse(manifest.dirty)
+
+            loaded = Manifest(os.path.join(tem_dir, 'some', '600'))
+            self.assertTrue(loaded.load())
+            self.assertEqual((2, 605.0, 610.0), loaded.stats(600))
+
+            loaded.remove(0, 1200)
+            loaded.save()
+            self.assertFalse(os.path.exists(loaded.path))
+
+
+class CountingStore(Store):
+
+    created = 0
+
+    def _create_bucket(self, name, start):
+        self.created += 1
+        return Store._create_bucket(self, name, start)
+
+
+class ManifestStoreTestCase(TestCase):
+
+    def setUp(self):
+        self.start = dt('2018-03-03T12:30:00')
+        self.week = Interval(start=self.start, delta=timedelta(days=7))
+
+    def record_sparse(self, store):
+        store.record('foo', self.start, 'cpu:1')
+        store.record('foo', self.start + timedelta(days=3), 'cpu:2')
+        store.record('foo', self.start + timedelta(days=3, seconds=5), 'cpu:3')
+
+    def test_retrieve_sparse_check_only_existing_buckets_touched(self):
+        with temporary_directory() as tem_dir:
+            store = CountingStore(directory=tem_dir, bucket_size=600, manifest=True)
+            self.record_sparse(store)
+            store.created = 0
+            records = list(store.retrieve('foo', self.week))
+            self.assertEqual([1520080200.0, 1520339400.0, 1520339405.0], [r[0] for r in records])
+            self.assertEqual(2, store.created)
+
+    def test_new_store_check_manifest_rebuilt_from_tree(self):
+        with temporary_directory() as tem_dir:
+            self.record_sparse(Store(directory=tem_dir, bucket_size=600))
+            store = Store(directory=tem_dir, bucket_size=600, manifest=True)
+            self.assertEqual(3, len(list(store.retrieve('foo', self.week))))
+            self.assertEqual((2, 1520339400.0, 1520339405.0), store.get_manifest('foo').stats(1520339400))
+
+    def test_flush_check_manifest_persisted(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600, manifest=True)
+            self.record_sparse(store)
+            store.flush()
+            manifest = Manifest(os.path.join(tem_dir, 'foo', '600'))
+            self.assertTrue(manifest.load())
+            self.assertEqual(2, len(manifest))
+            self.assertEqual((1, 1520080200.0, 1520080200.0), manifest.stats(1520080200))
+            self.assertEqual((2, 1520339400.0, 1520339405.0), manifest.stats(1520339400))
+
+    def test_record_check_counts_same_as_rebuilt(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600, manifest=True)
+            store.record('foo', self.start, 'cpu:1')
+            self.assertEqual((1, 1520080200.0, 1520080200.0), store.get_manifest('foo').stats(1520080200))
+
+            store.record_many('foo', [(self.start + timedelta(seconds=i), 'cpu:1') for i in range(1, 5)])
+            self.assertEqual((5, 1520080200.0, 1520080204.0), store.get_manifest('foo').stats(1520080200))
+            self.assertEqual(store.get_manifest('foo').entries, store.rebuild_manifest('foo').entries)
+
+    def test_forget_check_manifest_updated(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600, manifest=True)
+            self.record_sparse(store)
+            store.forget('foo', Interval(start=self.start, delta=timedelta(hours=1)))
+            self.assertEqual(1, len(store.get_manifest('foo')))
+            self.assertEqual(2, len(list(store.retrieve('foo', self.week))))
+
+            store.forget('foo', self.week)
+            self.assertEqual([], os.listdir(tem_dir))
+
+    def test_new_bucket_without_flush_check_visible_after_crash(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600, manifest=True)
+            store.record('foo', self.start, 'cpu:1')
+            store.flush()
+            store.record('foo', self.start + timedelta(days=3), 'cpu:2')
+            store.record('foo', self.start + timedelta(days=3, seconds=5), 'cpu:3')
+            # no flush or close, a new store reads what the first one left
+            restarted = Store(directory=tem_dir, bucket_size=600, manifest=True)
+            self.assertEqual(3, len(list(restarted.retrieve('foo', self.week))))
@@ -0,0 +1,176 @@
+import gzip
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import TestCase
+
+from notmany.store.base import Interval, naive_tstamp
+from notmany.store.file import Store
+from notmany.store.memory import MemoryStore, MemoryBucket
+from tests.utils import dt, temporary_directory
+
+
+class MemoryBucketTestCase(TestCase):
+
+    def test_append_out_of_order_check_read_range(self):
+        bucket = MemoryBucket('foo', dt('2018-03-03T12:30:00'), 600)
+        bucket.extend([(10.0, 'cpu:1'), (12.0, 'cpu:3')])
+        self.assertTrue(bucket.ordered)
+        self.assertEqual([(12.0, 'cpu:3')], list(bucket.read_range(11.0, 20.0, bucket.ordered)))
+
+        bucket.append(11.0, 'cpu:2')
+        self.assertFalse(bucket.ordered)
+        self.assertEqual([(12.0, 'cpu:3'), (11.0, 'cpu:2')], list(bucket.read_range(11.0, 20.0, bucket.ordered)))
+
+
+class MemoryStoreTestCase(TestCase):
+    start = dt('2018-03-03T12:00:00')
+
+    def record_minutes(self, store, count):
+        store.record_many('foo', [
+            (self.start + timedelta(minutes=i), 'cpu:{}'.format(i)) for i in range(count)])
+
+    def test_record_without_backend_check_only_ring_kept(self):
+        store = MemoryStore(bucket_size=600, buckets=2)
+        self.record_minutes(store, 40)
+        self.assertEqual(
+            ['cpu:{}'.format(i) for i in range(20, 40)], [data for _, data in store.retrieve('foo')])
+
+        # older than the ring is dropped
+        store.record('foo', self.start, 'cpu:old')
+        self.assertEqual(20, len(list(store.retrieve('foo'))))
+
+    def test_record_check_evicted_written_through(self):
+        with temporary_directory() as tem_dir:
+            backend = Store(directory=tem_dir, bucket_size=600)
+            store = MemoryStore(backend=backend, buckets=2)
+            self.record_minutes(store, 40)
+
+            self.assertEqual(
+                ['cpu:{}'.format(i) for i in range(20)], [data for _, data in backend.retrieve('foo')])
+            self.assertEqual(
+                ['cpu:{}'.format(i) for i in range(40)], [data for _, data in store.retrieve('foo')])
+
+            # older than the ring goes straight to the backend
+            store.record('foo', self.start + timedelta(seconds=30), 'cpu:late')
+            self.assertIn('cpu:late', [data for _, data in backend.retrieve('foo')])
+
+    def test_retrieve_interval_check_split_between_backend_and_ring(self):
+        with temporary_directory() as tem_dir:
+            store = MemoryStore(backend=Store(directory=tem_dir, bucket_size=600), buckets=2)
+            self.record_minutes(store, 40)
+
+            interval = Interval(start=self.start + timedelta(minutes=15), end=self.start + timedelta(minutes=25))
+            self.assertEqual(
+                ['cpu:{}'.format(i) for i in range(15, 26)], [data for _, data in store.retrieve('foo', interval)])
+
+            interval = Interval(start=self.start + timedelta(minutes=30), end=self.start + timedelta(minutes=32))
+            self.assertEqual(['cpu:30', 'cpu:31', 'cpu:32'], [data for _, data in store.retrieve('foo', interval)])
+            self.assertEqual(
+                '1520080200.0 cpu:30\n1520080260.0 cpu:31\n1520080320.0 cpu:32\n',
+                ''.join(store.retrieve_raw('foo', interval)))
+
+    def test_aggregate_check_both_parts(self):
+        with temporary_directory() as tem_dir:
+            store = MemoryStore(backend=Store(directory=tem_dir, bucket_size=600), buckets=2)
+            self.record_minutes(store, 40)
+            result = store.aggregate('foo', Interval(start=self.start, delta=timedelta(minutes=40)), step=1200)
+            self.assertEqual(
+                [naive_tstamp(self.start), naive_tstamp(self.start) + 1200], result['timestamps'].tolist())
+            self.assertEqual([9.5, 29.5], result['fields']['cpu']['avg'].tolist())
+
+    def test_forget_check_ring_and_backend(self):
+        with temporary_directory() as tem_dir:
+            store = MemoryStore(backend=Store(directory=tem_dir, bucket_size=600), buckets=2)
+            self.record_minutes(store, 40)
+            store.forget('foo', Interval(start=self.start, delta=timedelta(minutes=29, seconds=59)))
+            self.assertEqual(
+                ['cpu:{}'.format(i) for i in range(30, 40)], [data for _, data in store.retrieve('foo')])
+
+            store.forget('foo')
+            self.assertEqual([], list(store.retrieve('foo')))
+
+    def test_close_check_rings_written_through(self):
+        with temporary_directory() as tem_dir:
+            store = MemoryStore(backend=Store(directory=tem_dir, bucket_size=600), buckets=2)
+            self.record_minutes(store, 40)
+            store.close()
+            self.assertEqual(
+                ['cpu:{}'.format(i) for i in range(40)],
+                [data for _, data in Store(directory=tem_dir, bucket_size=600).retrieve('foo')])
+
+    def test_record_older_than_ring_check_backend_manifest_updated(self):
+        with temporary_directory() as tem_dir:
+            backend = Store(directory=tem_dir, bucket_size=600, manifest=True)
+            store = MemoryStore(backend=backend, buckets=2)
+            self.record_minutes(store, 40)
+            store.record('foo', self.start - timedelta(hours=1), 'cpu:old')
+
+            interval = Interval(start=self.start - timedelta(hours=1), delta=timedelta(minutes=5))
+            self.assertEqual(['cpu:old'], [data for _, data in backend.retrieve('foo', interval)])
+
+    def test_backend_has_ring_bucket_check_both_returned_once(self):
+        with temporary_directory() as tem_dir:
+            backend = Store(directory=tem_dir, bucket_size=600)
+            backend.record('foo', self.start, 'cpu:1')
+            store = MemoryStore(backend=backend, buckets=2)
+            store.record('foo', self.start + timedelta(seconds=1), 'cpu:2')
+
+            interval = Interval(start=self.start, delta=timedelta(minutes=5))
+            self.assertEqual(['cpu:1', 'cpu:2'], [data for _, data in store.retrieve('foo', interval)])
+            self.assertEqual(['cpu:1', 'cpu:2'], [data for _, data in store.retrieve('foo')])
+
+            store.close()
+            self.assertEqual(['cpu:1', 'cpu:2'], [data for _, data in backend.retrieve('foo')])
+
+    def test_retrieve_gzip_check_single_member(self):
+        with temporary_directory() as tem_dir:
+            store = MemoryStore(backend=Store(directory=tem_dir, bucket_size=600), buckets=2)
+            self.record_minutes(store, 40)
+            self.assertIsNone(store.cache)
+            self.assertEqual(
+                ''.join(store.retrieve_raw('foo')),
+                gzip.decompress(b''.join(store.retrieve_gzip('foo'))).decode())
+
+    def test_record_and_retrieve_from_threads_check_nothing_lost(self):
+        with temporary_directory() as tem_dir:
+            store = MemoryStore(backend=Store(directory=tem_dir, bucket_size=60), buckets=2)
+            interval = Interval(start=self.start, delta=timedelta(hours=2))
+            stopped = threading.Event()
+
+            def write(worker):
+                for i in range(worker, 4000, 8):
+                    store.record('foo', self.start + timedelta(seconds=i), 'cpu:{}'.format(i))
+
+            def read(_):
+                while not stopped.is_set():
+                    list(store.retrieve('foo', interval))
+
+            with ThreadPoolExecutor(max_workers=10) as executor:
+                readers = [executor.submit(read, i) for i in range(2)]
+                list(executor.map(write, range(8)))
+                stopped.set()
+                [reader.result() for reader in readers]
+
+            self.assertEqual(list(range(4000)), sorted(int(data[4:]) for _, data in store.retrieve('foo', interval)))
+            store.close()
+            self.assertEqual(4000, len(list(Store(directory=tem_dir, bucket_size=60).retrieve('foo', interval))))
+
+    def test_bucket_size_differs_from_backend_check_raises(self):
+        with temporary_directory() as tem_dir:
+            with self.assertRaises(ValueError):
+                MemoryStore(backend=Store(directory=tem_dir, bucket_size=600), bucket_size=3600)
+
+
+class MemoryStoreRetrieveManyTestCase(TestCase):
+    start = dt('2018-03-03T12:00:00')
+
+    def test_retrieve_many_check_merged(self):
+        store = MemoryStore(bucket_size=600)
+        store.record_many('foo', [(self.start + timedelta(seconds=i), 'cpu:{}'.format(i)) for i in (5, 1, 700)])
+        store.record('bar', self.start + timedelta(seconds=2), 'cpu:0')
+        tstamp = naive_tstamp(self.start)
+        self.assertEqual(
+            [('foo', tstamp + 1, 'cpu:1'), ('bar', tstamp + 2, 'cpu:0'), ('foo', tstamp + 5, 'cpu:5'),
+             ('foo', tstamp + 700, 'cpu:700')],
+            list(store.retrieve_many(['foo', 'bar'])))
@@ -0,0 +1,117 @@
+import os
+from datetime import timedelta
+from unittest import TestCase
+
+from notmany.store.base import Interval, naive_tstamp
+from notmany.store.file import Store
+from notmany.store.retention import Retention, Tombstones
+from notmany.store.writer import Writer
+from tests.utils import dt, temporary_directory
+
+
+class TombstonesTestCase(TestCase):
+
+    def test_add_and_discard_check_persisted(self):
+        with temporary_directory() as tem_dir:
+            tombstones = Tombstones(tem_dir)
+            paths = [os.path.join(tem_dir, 'foo', '600', day) for day in ('2018_03_03', '2018_03_04')]
+            tombstones.add(paths)
+            tombstones.add(paths[:1])
+            self.assertEqual(sorted(paths), Tombstones(tem_dir).take())
+            self.assertTrue(tombstones.covers('other', paths[1]))
+
+            tombstones.discard(paths[:1])
+            self.assertEqual(paths[1:], Tombstones(tem_dir).take())
+            tombstones.discard(paths[1:])
+            self.assertEqual([], os.listdir(tem_dir))
+
+
+class ForgetTestCase(TestCase):
+    start = dt('2018-03-03T12:00:00')
+
+    def make_store(self, tem_dir, **kwargs):
+        store = Store(directory=tem_dir, bucket_size=600, **kwargs)
+        store.record_many('foo', [(self.start + timedelta(minutes=i * 5), 'cpu:{}'.format(i))
+                                  for i in range(12 * 24 * 2)])
+        return store
+
+    def test_forget_interval_check_only_touched_buckets_deleted(self):
+        with temporary_directory() as tem_dir:
+            store = self.make_store(tem_dir, manifest=True)
+            store.forget('foo', Interval(start=self.start + timedelta(minutes=15), delta=timedelta(minutes=10)))
+            self.assertEqual(len(list(store.get_all('foo'))), 288 - 2)
+            self.assertEqual(576 - 4, len(list(store.retrieve('foo'))))
+            self.assertNotIn(naive_tstamp(self.start) + 600, store.get_manifest('foo'))
+
+            store.forget('foo', Interval(start=self.start, delta=timedelta(days=3)))
+            self.assertEqual([], os.listdir(tem_dir))
+
+    def test_record_after_forget_pruned_day_check_writer_recreates_directory(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600, writer=Writer(max_age=0))
+            store.record('foo', self.start + timedelta(minutes=40), 'cpu:1')
+            store.flush()
+            store.forget('foo', Interval(start=self.start + timedelta(minutes=40), delta=timedelta(minutes=5)))
+            self.assertEqual([], os.listdir(tem_dir))
+
+            store.record('foo', self.start + timedelta(minutes=50), 'cpu:2')
+            store.flush()
+            self.assertEqual([(naive_tstamp(self.start) + 3000, 'cpu:2')], list(store.retrieve('foo')))
+
+    def test_forget_lazy_check_hidden_until_reclaimed(self):
+        with temporary_directory() as tem_dir:
+            store = self.make_store(tem_dir)
+            day = os.path.join(tem_dir, 'foo', '600', '2018_03_04')
+            store.forget('foo', Interval(start=dt('2018-03-04T00:00:00'), delta=timedelta(hours=23, minutes=59)),
+                         lazy=True)
+
+            self.assertTrue(os.path.exists(day))
+            self.assertEqual(576 - 288, len(list(store.retrieve('foo'))))
+            self.assertEqual([], list(store.retrieve('foo', Interval(start=dt('2018-03-04T06:00:00'),
+                                                                     delta=timedelta(hours=1)))))
+            # a new store honours tombstones of the old one
+            self.assertEqual(576 - 288, len(list(Store(directory=tem_dir, bucket_size=600).retrieve('foo'))))
+
+            self.assertEqual(1, store.reclaim())
+            self.assertFalse(os.path.exists(day))
+            self.assertEqual(576 - 288, len(list(store.retrieve('foo'))))
+            self.assertEqual(0, len(store.tombstones))
+
+    def test_record_after_lazy_forget_check_old_data_gone(self):
+        with temporary_directory() as tem_dir:
+            store = self.make_store(tem_dir, rollups=(3600,))
+            store.forget('foo', lazy=True)
+            self.assertEqual([], store.names())
+            self.assertEqual([], list(store.retrieve_rollup('foo', 3600)))
+
+            store.record('foo', self.start, 'cpu:-1')
+            self.assertEqual([(naive_tstamp(self.start), 'cpu:-1')], list(store.retrieve('foo')))
+            self.assertEqual(0, store.reclaim())
+
+
+class RetentionTestCase(TestCase):
+    start = dt('2018-03-01T00:00:00')
+
+    def test_expire_check_raw_and_rollups_by_series(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600, rollups=(3600,), retention={
+                None: Retention(raw=86400, rollups={3600: 2 * 86400}),
+                'keep': None,
+            })
+            for name in ('foo', 'keep'):
+                store.record_many(name, [(self.start + timedelta(hours=i), 'cpu:{}'.format(i)) for i in range(24 * 4)])
+            store.flush()
+
+            now = self.start + timedelta(days=3, hours=12)
+            # 2 days and 12 hours of raw buckets, 1 day of rollups
+            self.assertEqual(2 + 12 + 1, store.expire(now=now))
+            self.assertEqual(0, store.expire(now=now))
+            self.assertEqual(36, len(list(store.retrieve('foo'))))
+            self.assertEqual(72, len(list(store.retrieve_rollup('foo', 3600))))
+            self.assertEqual(96, len(list(store.retrieve('keep'))))
+
+            store.reclaim(limit=5)
+            self.assertEqual(10, len(store.tombstones))
+            self.assertEqual(36, len(list(store.retrieve('foo'))))
+            store.reclaim()
+            self.assertEqual(['2018_03_03', '2018_03_04'], sorted(os.listdir(os.path.join(tem_dir, 'foo', '600'))))
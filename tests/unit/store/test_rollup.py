@@ -0,0 +1,151 @@
+import os
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+import numpy
+
+from notmany.store.base import Interval
+from notmany.store.file import Store
+from notmany.store.rollup import Rollup, encode, decode, merge_rows, to_records
+from tests.utils import dt, temporary_directory, file_content
+
+
+class RollupTestCase(TestCase):
+
+    def test_add_check_slot_finished_by_later_point(self):
+        state = Rollup(60)
+        self.assertEqual([], state.add(120, {'cpu': 2.0}))
+        self.assertEqual([], state.add(150, {'cpu': 4.0, 'mem': 1.0}))
+        self.assertEqual([(120, {'cpu': [2.0, 4.0, 6.0, 2], 'mem': [1.0, 1.0, 1.0, 1]})],
+                         state.add(185, {'cpu': 1.0}))
+        self.assertEqual(180, state.slot)
+
+    def test_add_late_point_check_partial_row(self):
+        state = Rollup(60)
+        state.add(185, {'cpu': 1.0})
+        self.assertEqual([(60, {'cpu': [3.0, 3.0, 3.0, 1]})], state.add(61, {'cpu': 3.0}))
+        self.assertEqual((180, {'cpu': [1.0, 1.0, 1.0, 1]}), state.pop())
+        self.assertIsNone(state.slot)
+
+    def test_to_records_check_value_of_every_func(self):
+        rows = [(60, {'cpu': [1.0, 3.0, 6.0, 3], 'mem': [2.0, 2.0, 2.0, 1]})]
+        self.assertEqual([(60, 'cpu:1.0,mem:2.0'), (60, 'cpu:3.0,mem:2.0')], list(to_records(rows, ('min', 'max'))))
+        self.assertEqual([(60, 'cpu:2.0,mem:2.0')], list(to_records(rows)))
+
+    def test_encode_decode_check_same(self):
+        fields = {'cpu': [2.0, 4.5, 6.5, 2], 'mem': [1.0, 1.0, 1.0, 1]}
+        self.assertEqual(
+            'cpu.min:2.0,cpu.max:4.5,cpu.sum:6.5,cpu.count:2,mem.min:1.0,mem.max:1.0,mem.sum:1.0,mem.count:1',
+            encode(fields))
+        self.assertEqual(fields, decode(encode(fields)))
+
+    def test_merge_rows_check_combined(self):
+        fields = {'cpu': [2.0, 4.0, 6.0, 2]}
+        merge_rows(fields, {'cpu': [1.0, 3.0, 3.0, 2], 'mem': [1.0, 1.0, 1.0, 1]})
+        self.assertEqual({'cpu': [1.0, 4.0, 9.0, 4], 'mem': [1.0, 1.0, 1.0, 1]}, fields)
+
+
+class RollupStoreTestCase(TestCase):
+
+    def setUp(self):
+        self.start = dt('2018-03-03T12:30:00')
+
+    def test_record_check_rollups_written(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600, rollups=(60, 3600))
+            store.record_many('foo', [(self.start + timedelta(seconds=10 * i), 'cpu:{}'.format(i))
+                                      for i in range(13)])
+            store.flush()
+            content = file_content(os.path.join(tem_dir, 'foo', 'rollup_60', '2018_03_03', '00_00_00'))
+            self.assertEqual(
+                '1520080200 cpu.min:0.0,cpu.max:5.0,cpu.sum:15.0,cpu.count:6\n'
+                '1520080260 cpu.min:6.0,cpu.max:11.0,cpu.sum:51.0,cpu.count:6\n'
+                '1520080320 cpu.min:12.0,cpu.max:12.0,cpu.sum:12.0,cpu.count:1\n', content)
+            self.assertEqual(
+                [(1520078400, {'cpu': [0.0, 12.0, 78.0, 13]})], list(store.retrieve_rollup('foo', 3600)))
+
+    def test_retrieve_rollup_check_partial_rows_merged(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600, rollups=(600,))
+            store.record('foo', self.start, 'cpu:1')
+            store.record('foo', self.start + timedelta(minutes=10), 'cpu:2')
+            store.record('foo', self.start + timedelta(minutes=1), 'cpu:5')
+            store.record('foo', self.start + timedelta(minutes=11), 'cpu:4')
+
+            interval = Interval(start=self.start, delta=timedelta(minutes=10))
+            self.assertEqual([
+                (1520080200, {'cpu': [1.0, 5.0, 6.0, 2]}),
+                (1520080800, {'cpu': [2.0, 4.0, 6.0, 2]}),
+            ], list(store.retrieve_rollup('foo', 600, interval)))
+
+            store.flush()
+            interval = Interval(start=self.start + timedelta(minutes=5), delta=timedelta(minutes=10))
+            self.assertEqual(
+                [(1520080800, {'cpu': [2.0, 4.0, 6.0, 2]})], list(store.retrieve_rollup('foo', 600, interval)))
+
+    def test_retrieve_rollup_missing_resolution_check_raises(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600, rollups=(600,))
+            with self.assertRaises(ValueError):
+                list(store.retrieve_rollup('foo', 60))
+            self.assertEqual([], list(store.retrieve_rollup('foo', 600)))
+
+    def test_init_with_resolution_not_dividing_day_check_raises(self):
+        with self.assertRaises(ValueError):
+            Store(bucket_size=600, rollups=(7 * 60,))
+
+    def test_flush_check_only_finished_slots_written(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600, rollups=(3600,))
+            now = datetime.now()
+            store.record('foo', now, 'cpu:1')
+            store.flush()
+            day = os.path.join(tem_dir, 'foo', 'rollup_3600', now.strftime('%Y_%m_%d'))
+            self.assertFalse(os.path.exists(day))
+            self.assertEqual(1, len(list(store.retrieve_rollup('foo', 3600))))
+            store.close()
+            self.assertEqual(1, len(file_content(day, '00_00_00').splitlines()))
+
+    def test_forget_interval_check_rollup_rows_recomputed(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600, rollups=(600, 3600))
+            store.record_many('foo', [(self.start + timedelta(minutes=i), 'cpu:{}'.format(i)) for i in range(120)])
+            store.flush()
+
+            store.forget('foo', Interval(start=self.start + timedelta(minutes=10), delta=timedelta(minutes=5)))
+            self.assertEqual([
+                (1520080200, {'cpu': [0.0, 9.0, 45.0, 10]}),
+                (1520081400, {'cpu': [20.0, 29.0, 245.0, 10]}),
+            ], list(store.retrieve_rollup('foo', 600))[:2])
+            # 12:00 slot kept 12:30 - 12:40 and 12:50 - 13:00
+            self.assertEqual((1520078400, {'cpu': [0.0, 29.0, 290.0, 20]}),
+                             list(store.retrieve_rollup('foo', 3600))[0])
+            self.assertEqual(sum(range(120)) - sum(range(10, 20)),
+                             sum(fields['cpu'][2] for _, fields in store.retrieve_rollup('foo', 3600)))
+
+            store.forget('foo')
+            store.flush()
+            self.assertEqual([], os.listdir(tem_dir))
+
+    def test_aggregate_check_same_as_raw(self):
+        records = [(self.start + timedelta(seconds=7 * i), 'cpu:{},mem:{}'.format(i % 13, i % 5 * 0.5))
+                   for i in range(1200)] + [(self.start + timedelta(hours=2), 'cpu:100')]
+        interval = Interval(start=self.start, delta=timedelta(hours=2))
+        with temporary_directory() as tem_dir, temporary_directory() as raw_dir:
+            store = Store(directory=tem_dir, bucket_size=600, rollups=(60, 600))
+            raw = Store(directory=raw_dir, bucket_size=600)
+            store.record_many('foo', records)
+            raw.record_many('foo', records)
+            self.assertEqual(600, store.rollup_resolution(interval, 1800))
+            self.assertEqual(60, store.rollup_resolution(interval, 900))
+            self.assertIsNone(store.rollup_resolution(interval, 30))
+
+            funcs = ['avg', 'min', 'max', 'sum', 'count']
+            for fields in (None, ['cpu']):
+                expected = raw.aggregate('foo', interval, step=1800, funcs=funcs, fields=fields)
+                result = store.aggregate('foo', interval, step=1800, funcs=funcs, fields=fields)
+                self.assertEqual(expected['timestamps'].tolist(), result['timestamps'].tolist())
+                self.assertEqual(sorted(expected['fields']), sorted(result['fields']))
+                for field, values in expected['fields'].items():
+                    for func in funcs:
+                        numpy.testing.assert_allclose(values[func], result['fields'][field][func])
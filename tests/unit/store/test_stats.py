@@ -0,0 +1,101 @@
+from datetime import timedelta
+from unittest import TestCase
+
+from notmany.store.base import Interval, naive_tstamp
+from notmany.store.columnar import ColumnarBucket
+from notmany.store.file import Store
+from notmany.store.stats import Histogram, Stats
+from tests.utils import dt, temporary_directory
+
+
+class HistogramTestCase(TestCase):
+
+    def test_observe_check_percentiles_are_bucket_bounds(self):
+        histogram = Histogram()
+        for seconds in [0.00001] * 90 + [0.001] * 10:
+            histogram.observe(seconds)
+        self.assertEqual(100, histogram.count)
+        self.assertEqual(16 / 1e6, histogram.percentile(50))
+        self.assertEqual(1024 / 1e6, histogram.percentile(99))
+        self.assertEqual(0.001, histogram.max)
+        self.assertEqual({'16': 90, '1024': 10}, histogram.to_dict()['buckets'])
+        self.assertEqual(0.0, Histogram().percentile(50))
+
+    def test_since_check_only_new_calls(self):
+        histogram = Histogram()
+        histogram.observe(0.00001)
+        previous = histogram.copy()
+        histogram.observe(0.001)
+        since = histogram.since(previous)
+        self.assertEqual(1, since.count)
+        self.assertEqual(1024 / 1e6, since.percentile(50))
+
+
+class StatsTestCase(TestCase):
+
+    def test_timed_check_items_counted_on_close(self):
+        stats = Stats()
+        items = stats.timed('read', iter(['ab', 'cde', 'f']), 'read.bytes', size=len)
+        self.assertEqual('ab', next(items))
+        items.close()
+        snapshot = stats.snapshot()
+        self.assertEqual({'read.bytes': 2}, snapshot['counters'])
+        self.assertEqual(1, snapshot['latency']['read']['count'])
+
+    def test_points_check_increments_since_previous_call(self):
+        stats = Stats()
+        stats.incr('calls', 3)
+        stats.observe('call', 0.001)
+        self.assertEqual([('x.calls', 10, 'count:3')], stats.points(10, prefix='x.')[:1])
+        self.assertEqual([], stats.points(20))
+
+        stats.incr('calls')
+        self.assertEqual([('notmany.calls', 30, 'count:1')], stats.points(30))
+
+
+class StoreStatsTestCase(TestCase):
+    start = dt('2018-03-03T12:00:00')
+
+    def test_store_check_counters(self):
+        with temporary_directory() as tem_dir:
+            stats = Stats()
+            store = Store(directory=tem_dir, bucket_size=600, stats=stats)
+            store.record('temp', self.start, 'cpu:1')
+            store.record_many('temp', [(self.start + timedelta(minutes=i), 'cpu:{}'.format(i)) for i in range(20)])
+            interval = Interval(start=self.start, delta=timedelta(minutes=30))
+            self.assertEqual(21, len(list(store.retrieve('temp', interval))))
+            raw = ''.join(store.retrieve_raw('temp', interval))
+
+            counters = stats.snapshot()['counters']
+            self.assertEqual(21, counters['record.points'])
+            self.assertEqual(21, counters['retrieve.records'])
+            self.assertEqual(len(raw), counters['retrieve_raw.bytes'])
+            # 12:20 and 12:30 buckets of the interval have no records
+            self.assertEqual(8, counters['buckets.touched'])
+            self.assertEqual(4, counters['buckets.missing'])
+            self.assertEqual(['record', 'record_many', 'retrieve', 'retrieve_raw'],
+                             sorted(stats.snapshot()['latency']))
+
+    def test_mapped_reads_check_buckets_opened(self):
+        with temporary_directory() as tem_dir:
+            stats = Stats()
+            store = Store(directory=tem_dir, bucket_size=600, bucket_class=ColumnarBucket, stats=stats)
+            store.record_many('temp', [(self.start + timedelta(minutes=i), 'cpu:{}'.format(i)) for i in range(20)])
+            stats.reset()
+            self.assertEqual(2, len(list(store.retrieve_arrays('temp'))))
+            self.assertEqual(2, stats.snapshot()['counters']['buckets.opened'])
+
+    def test_record_stats_check_series_written(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600, stats=Stats())
+            store.record('temp', self.start, 'cpu:1')
+            store.record_stats()
+            self.assertIn('notmany.record.points', store.names())
+            self.assertEqual('count:1', list(store.retrieve('notmany.record.points'))[0][1])
+
+    def test_no_stats_check_nothing_counted(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600)
+            store.record('temp', self.start, 'cpu:1')
+            self.assertIsNone(store.stats)
+            self.assertEqual([(naive_tstamp(self.start), 'cpu:1')], list(store.retrieve('temp')))
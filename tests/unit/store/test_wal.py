@@ -0,0 +1,176 @@
+import os
+import threading
+from datetime import timedelta
+from unittest import TestCase
+
+from notmany.store.base import Interval, naive_tstamp
+from notmany.store.file import Store
+from notmany.store.wal import WriteAheadLog
+from tests.utils import dt, temporary_directory, file_content
+
+
+class WriteAheadLogTestCase(TestCase):
+
+    def test_append_check_taken_and_replayed(self):
+        with temporary_directory() as tem_dir:
+            wal = WriteAheadLog(tem_dir)
+            wal.append([('foo', 1.5, 'cpu:1'), ('bar', 2.0, 'cpu:2')])
+            wal.append([('foo', 3.0, 'cpu:3')])
+            self.assertEqual(3, wal.pending)
+
+            records, offset = wal.take()
+            self.assertEqual([('foo', 1.5, 'cpu:1'), ('bar', 2.0, 'cpu:2'), ('foo', 3.0, 'cpu:3')], records)
+            self.assertEqual(os.path.getsize(wal.path), offset)
+            self.assertEqual(0, wal.pending)
+            self.assertEqual(records, wal.replay())
+            wal.close()
+
+    def test_replay_torn_line_check_skipped(self):
+        with temporary_directory() as tem_dir:
+            wal = WriteAheadLog(tem_dir)
+            wal.append([('foo', 1.0, 'cpu:1')])
+            wal.close()
+            with open(wal.path, 'a') as fp:
+                fp.write('foo\t2.0\tcp')
+            self.assertEqual([('foo', 1.0, 'cpu:1')], WriteAheadLog(tem_dir).replay())
+
+    def test_truncate_check_later_records_kept(self):
+        with temporary_directory() as tem_dir:
+            wal = WriteAheadLog(tem_dir, fsync='never')
+            wal.append([('foo', 1.0, 'cpu:1')])
+            _, offset = wal.take()
+            wal.append([('foo', 2.0, 'cpu:2')])
+            wal.truncate(offset)
+            self.assertEqual([('foo', 2.0, 'cpu:2')], wal.replay())
+            self.assertEqual(os.path.getsize(wal.path), wal.size)
+
+    def test_append_from_threads_check_all_committed(self):
+        with temporary_directory() as tem_dir:
+            wal = WriteAheadLog(tem_dir, fsync='interval')
+
+            def append(thread):
+                for i in range(50):
+                    wal.append([('foo', float(thread * 100 + i), 'cpu:1')])
+
+            threads = [threading.Thread(target=append, args=(thread,)) for thread in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(200, wal.pending)
+            self.assertEqual(200, len(wal.replay()))
+
+    def test_failed_commit_check_batched_callers_raise(self):
+        with temporary_directory() as tem_dir:
+            wal = WriteAheadLog(tem_dir, fsync='never')
+            real_fp = wal._fp
+            first_writing, release, writes = threading.Event(), threading.Event(), []
+
+            class FailingFile(object):
+
+                def write(self, data):
+                    writes.append(data)
+                    if len(writes) == 1:
+                        first_writing.set()
+                        release.wait(5)
+                        return real_fp.write(data)
+                    raise OSError('disk full')
+
+                def __getattr__(self, name):
+                    return getattr(real_fp, name)
+
+            wal._fp = FailingFile()
+            errors = []
+
+            def append(tstamp):
+                try:
+                    wal.append([('foo', tstamp, 'cpu:1')])
+                except OSError as exc:
+                    errors.append((tstamp, exc))
+
+            first = threading.Thread(target=append, args=(1.0,))
+            first.start()
+            first_writing.wait(5)
+            # both queue up behind the commit in progress and go out as one batch
+            batched = [threading.Thread(target=append, args=(tstamp,)) for tstamp in (2.0, 3.0)]
+            for thread in batched:
+                thread.start()
+            while len(wal._queue) < 2:
+                threading.Event().wait(0.001)
+            release.set()
+            for thread in [first] + batched:
+                thread.join()
+
+            self.assertEqual([2.0, 3.0], sorted(tstamp for tstamp, _ in errors))
+            self.assertEqual(1, wal.pending)
+            self.assertEqual([('foo', 1.0, 'cpu:1')], wal.replay())
+            self.assertEqual({}, wal._failed)
+
+    def test_unknown_policy_check_raises(self):
+        with temporary_directory() as tem_dir:
+            with self.assertRaises(ValueError):
+                WriteAheadLog(tem_dir, fsync='sometimes')
+
+
+class StoreWithWalTestCase(TestCase):
+    start = dt('2018-03-03T12:00:00')
+
+    def test_record_check_readable_and_log_emptied_on_close(self):
+        with temporary_directory() as tem_dir:
+            wal = WriteAheadLog(os.path.join(tem_dir, 'wal'))
+            store = Store(directory=tem_dir, wal=wal, apply_interval=60)
+            store.record_many('foo', [(self.start + timedelta(minutes=i), 'cpu:{}'.format(i)) for i in range(20)])
+            store.record('foo', self.start + timedelta(minutes=20), 'cpu:20')
+            self.assertGreater(wal.size, 0)
+
+            interval = Interval(start=self.start, delta=timedelta(minutes=30))
+            self.assertEqual(
+                ['cpu:{}'.format(i) for i in range(21)], [data for _, data in store.retrieve('foo', interval)])
+
+            store.close()
+            self.assertEqual('', file_content(wal.path))
+            self.assertEqual(21, len(list(Store(directory=tem_dir).retrieve('foo'))))
+
+    def test_record_many_series_check_one_commit(self):
+        with temporary_directory() as tem_dir:
+            wal = WriteAheadLog(os.path.join(tem_dir, 'wal'))
+            store = Store(directory=tem_dir, wal=wal, apply_interval=60)
+            store.record_many_series([('foo', self.start, 'cpu:1'), ('bar', self.start, 'cpu:2')])
+            self.assertEqual(1, wal._committed)
+            self.assertEqual(2, wal.pending)
+            self.assertEqual(['cpu:1'], [data for _, data in store.retrieve('foo')])
+            self.assertEqual(['cpu:2'], [data for _, data in store.retrieve('bar')])
+            store.close()
+
+    def test_start_with_log_check_replayed_once(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir)
+            store.record('foo', self.start, 'cpu:1')
+
+            # crash after the first record reached its bucket
+            wal = WriteAheadLog(os.path.join(tem_dir, 'wal'))
+            wal.append([
+                ('foo', naive_tstamp(self.start), 'cpu:1.0'),
+                ('foo', naive_tstamp(self.start) + 60, 'cpu:2'),
+                ('bar', naive_tstamp(self.start), 'mem:3')])
+            wal.close()
+
+            store = Store(directory=tem_dir, wal=WriteAheadLog(os.path.join(tem_dir, 'wal')))
+            self.assertEqual(0, store.wal.size)
+            self.assertEqual(['cpu:1', 'cpu:2'], [data for _, data in store.retrieve('foo')])
+            self.assertEqual(['mem:3'], [data for _, data in store.retrieve('bar')])
+            store.close()
+
+    def test_background_apply_check_written_without_reads(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, wal=WriteAheadLog(os.path.join(tem_dir, 'wal')), apply_interval=0.01)
+            store.record('foo', self.start, 'cpu:1')
+            bucket = store._create_bucket('foo', self.start)
+            # the file is created before the record is written to it
+            for _ in range(500):
+                if os.path.exists(bucket.full_path) and file_content(bucket.full_path):
+                    break
+                threading.Event().wait(0.01)
+            self.assertEqual('1520078400.0 cpu:1\n', file_content(bucket.full_path))
+            store.close()
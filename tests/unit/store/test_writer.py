@@ -0,0 +1,142 @@
+import os
+from datetime import timedelta
+from time import sleep
+from unittest import TestCase
+
+from notmany.store.base import Interval
+from notmany.store.file import Store
+from notmany.store.writer import Writer
+from tests.utils import dt, temporary_directory, file_content
+
+
+class WriterTestCase(TestCase):
+
+    def test_write_check_buffered_until_flush(self):
+        with temporary_directory() as tem_dir:
+            writer = Writer()
+            path = os.path.join(tem_dir, 'a', 'file')
+            writer.write(os.path.join(tem_dir, 'a'), path, 'foo\n')
+            self.assertFalse(os.path.exists(path))
+            self.assertEqual(writer.pending, 4)
+            writer.flush()
+            self.assertEqual('foo\n', file_content(path))
+            self.assertEqual(writer.pending, 0)
+            writer.close()
+
+    def test_failed_flush_check_buffer_kept(self):
+        with temporary_directory() as tem_dir:
+            writer = Writer(max_age=3600)
+            directory = os.path.join(tem_dir, 'a')
+            path = os.path.join(directory, 'file')
+            # a file where the directory should be
+            open(directory, 'w').close()
+            writer.write(directory, path, 'foo\n')
+            with self.assertRaises(OSError):
+                writer.flush()
+            self.assertEqual(writer.pending, 4)
+
+            os.remove(directory)
+            writer.write(directory, path, 'bar\n')
+            writer.flush()
+            self.assertEqual('foo\nbar\n', file_content(path))
+            self.assertEqual(writer.pending, 0)
+            writer.close()
+
+    def test_write_over_buffer_size_check_flushed(self):
+        with temporary_directory() as tem_dir:
+            writer = Writer(buffer_size=8)
+            path = os.path.join(tem_dir, 'file')
+            writer.write(tem_dir, path, 'foo\n')
+            self.assertFalse(os.path.exists(path))
+            writer.write(tem_dir, path, 'bar\n')
+            self.assertEqual('foo\nbar\n', file_content(path))
+            writer.close()
+
+    def test_write_older_than_max_age_check_flushed(self):
+        with temporary_directory() as tem_dir:
+            writer = Writer(max_age=0)
+            path = os.path.join(tem_dir, 'file')
+            writer.write(tem_dir, path, 'foo\n')
+            self.assertEqual('foo\n', file_content(path))
+            writer.close()
+
+    def test_idle_write_older_than_max_age_check_flushed_in_background(self):
+        with temporary_directory() as tem_dir:
+            writer = Writer(max_age=0.05)
+            path = os.path.join(tem_dir, 'file')
+            writer.write(tem_dir, path, 'foo\n')
+            self.assertFalse(os.path.exists(path))
+            sleep(0.2)
+            self.assertEqual('foo\n', file_content(path))
+            writer.close()
+
+    def test_more_paths_than_max_open_check_all_written(self):
+        with temporary_directory() as tem_dir:
+            writer = Writer(max_open=2, buffer_size=1)
+            paths = [os.path.join(tem_dir, str(i)) for i in range(5)]
+            for _ in range(2):
+                for path in paths:
+                    writer.write(tem_dir, path, 'foo\n')
+            self.assertEqual(len(writer._handles), 2)
+            writer.close()
+            self.assertEqual(len(writer._handles), 0)
+            for path in paths:
+                self.assertEqual('foo\nfoo\n', file_content(path))
+
+    def test_discard_check_buffers_dropped(self):
+        with temporary_directory() as tem_dir:
+            writer = Writer()
+            path = os.path.join(tem_dir, 'a', 'file')
+            other = os.path.join(tem_dir, 'ab', 'file')
+            writer.write(os.path.join(tem_dir, 'a'), path, 'foo\n')
+            writer.write(os.path.join(tem_dir, 'ab'), other, 'bar\n')
+            writer.discard(os.path.join(tem_dir, 'a'))
+            writer.close()
+            self.assertFalse(os.path.exists(path))
+            self.assertEqual('bar\n', file_content(other))
+
+
+class WriterStoreTestCase(TestCase):
+
+    def setUp(self):
+        self.start = dt('2018-03-03T12:30:00')
+
+    def test_record_with_writer_check_same_file_content(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600, writer=Writer())
+            store.record(name='some', timestamp=self.start, data='cpu:7')
+            store.record(name='some', timestamp=self.start + timedelta(seconds=1), data='cpu:8')
+            path = os.path.join(tem_dir, 'some', '600', '2018_03_03', '12_30_00')
+            self.assertFalse(os.path.exists(path))
+            store.flush()
+            self.assertEqual('1520080200.0 cpu:7\n1520080201.0 cpu:8\n', file_content(path))
+            store.close()
+
+    def test_retrieve_with_writer_check_pending_data_read(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600, writer=Writer())
+            store.record(name='some', timestamp=self.start, data='cpu:7')
+            interval = Interval(start=self.start, delta=timedelta(minutes=5))
+            self.assertEqual([(1520080200.0, 'cpu:7')], list(store.retrieve('some', interval)))
+            self.assertEqual(['1520080200.0 cpu:7\n'], list(store.retrieve_raw('some', interval)))
+            store.close()
+
+    def test_forget_with_writer_check_nothing_written_back(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600, writer=Writer())
+            store.record(name='some', timestamp=self.start, data='cpu:7')
+            store.flush()
+            store.record(name='some', timestamp=self.start, data='cpu:8')
+            store.forget(name='some', interval=Interval(start=self.start, delta=timedelta(minutes=5)))
+            store.close()
+            self.assertEqual([], os.listdir(tem_dir))
+
+    def test_forget_with_only_buffered_data_check_other_days_kept(self):
+        with temporary_directory() as tem_dir:
+            store = Store(directory=tem_dir, bucket_size=600, writer=Writer())
+            store.record(name='some', timestamp=self.start, data='cpu:7')
+            store.record(name='some', timestamp=self.start + timedelta(days=1), data='cpu:8')
+            store.forget(name='some', interval=Interval(start=self.start, delta=timedelta(minutes=5)))
+            store.close()
+            next_day = Interval(start=self.start + timedelta(days=1), delta=timedelta(minutes=5))
+            self.assertEqual([(1520166600.0, 'cpu:8')], list(store.retrieve('some', next_day)))
@@ -0,0 +1,45 @@
+import gzip
+from unittest import TestCase
+
+from notmany.protocol import LineParser, parse_line
+from tests.utils import dt
+
+
+class ParseLineTestCase(TestCase):
+
+    def test_parse_line_check_timestamp_formats(self):
+        self.assertEqual(('foo', dt('2018-03-03T12:30:00'), 'cpu:1,mem:2'),
+                         parse_line('foo 1520080200 cpu:1,mem:2'))
+        self.assertEqual(('foo', dt('2018-03-03T12:30:00'), 'cpu:1'),
+                         parse_line('foo 2018-03-03T12:30:00 cpu:1'))
+
+    def test_parse_line_malformed_check_raises(self):
+        for line in ('foo 1520080200', 'foo now cpu:1', 'foo 1520080200 cpu', 'foo 1520080200 cpu:x',
+                     '.foo 1520080200 cpu:1', 'foo/bar 1520080200 cpu:1', 'foo 1e400 cpu:1'):
+            with self.assertRaises(ValueError):
+                parse_line(line)
+
+
+class LineParserTestCase(TestCase):
+    body = b'foo 1520080200 cpu:1\nbar 1520080201 cpu:2\nbroken line\nfoo 1520080202 cpu:3'
+
+    def test_feed_split_lines_check_all_parsed(self):
+        parser = LineParser()
+        records = []
+        for i in range(0, len(self.body), 5):
+            records.extend(parser.feed(self.body[i:i + 5]))
+        records.extend(parser.close())
+
+        self.assertEqual(['foo', 'bar', 'foo'], [name for name, _, _ in records])
+        self.assertEqual({'accepted': 3, 'rejected': 1, 'errors': ['line 3: Expected name timestamp data']},
+                         parser.summary())
+
+    def test_feed_gzip_members_check_parsed(self):
+        body = gzip.compress(self.body[:42]) + gzip.compress(self.body[42:])
+        parser = LineParser(compressed=True)
+        records = []
+        for i in range(0, len(body), 7):
+            records.extend(parser.feed(body[i:i + 7]))
+        records.extend(parser.close())
+        self.assertEqual(3, len(records))
+        self.assertEqual(1, parser.rejected)